@@ -1,9 +1,13 @@
 import streamlit as st
-from translator_core_new import generate_translation_and_advice
+from translator_core_new import stream_translation_then_advice, warm_up_client
+from document_translate import is_long_document, stream_document_translation
+from incremental_translate import IncrementalTranslator
 import streamlit.components.v1 as components
 import json
+import threading
 import speech_recognition as sr  # 恢复使用
 import os
+from speech_models import VOSK_MODEL_PATHS, get_model
 
 # UI Translations
 TRANSLATIONS = {
@@ -28,6 +32,9 @@ TRANSLATIONS = {
         "translate_btn": "翻译并给出文化建议",
         "input_warning": "请输入要翻译的内容。",
         "spinner": "正在生成翻译和文化建议...",
+        "advice_spinner": "翻译已完成，正在生成文化建议...",
+        "document_progress": "长文本分段并行翻译中：已完成 {count} 段",
+        "incremental_progress": "仅重新翻译修改过的 {changed} 句（沿用 {reused} 句）",
         "literal_title": "直译",
         "tts_literal_btn": "🔊 朗读直译",
         "natural_title": "更自然的表达",
@@ -56,6 +63,9 @@ TRANSLATIONS = {
         "translate_btn": "Translate & Get Cultural Advice",
         "input_warning": "Please enter text to translate.",
         "spinner": "Generating translation and advice...",
+        "advice_spinner": "Translation ready, generating cultural advice...",
+        "document_progress": "Long text, translating in parallel segments: {count} done",
+        "incremental_progress": "Re-translating {changed} edited sentences ({reused} reused)",
         "literal_title": "Literal Translation",
         "tts_literal_btn": "🔊 Read Literal",
         "natural_title": "Natural Expressions",
@@ -84,6 +94,9 @@ TRANSLATIONS = {
         "translate_btn": "翻訳して文化的アドバイスを表示",
         "input_warning": "翻訳するテキストを入力してください。",
         "spinner": "翻訳とアドバイスを生成中...",
+        "advice_spinner": "翻訳完了、文化的アドバイスを生成中...",
+        "document_progress": "長文を分割して並列翻訳中：{count} ブロック完了",
+        "incremental_progress": "変更された {changed} 文のみ再翻訳中（{reused} 文を再利用）",
         "literal_title": "直訳",
         "tts_literal_btn": "🔊 直訳を読み上げ",
         "natural_title": "より自然な表現",
@@ -431,12 +444,7 @@ def recognize_speech_from_mic(lang_code):
     target_lang = google_lang_map.get(lang_code, "en-US")
 
     # Map app language codes to Vosk model paths (relative to app.py)
-    vosk_model_map = {
-        "zh": "models/zh",
-        "en": "models/en",
-        "ja": "models/ja"
-    }
-    vosk_model_path = vosk_model_map.get(lang_code)
+    vosk_model_path = VOSK_MODEL_PATHS.get(lang_code)
 
     try:
         with sr.Microphone() as source:
@@ -459,9 +467,10 @@ def recognize_speech_from_mic(lang_code):
                 if vosk_model_path and os.path.exists(vosk_model_path):
                     st.info(f"🔄 尝试 Vosk 离线识别 (模型: {vosk_model_path})...")
                     try:
-                        from vosk import Model, KaldiRecognizer
+                        from vosk import KaldiRecognizer
                         
-                        model = Model(vosk_model_path)
+                        # 模型在进程内只加载一次，后续识别直接复用
+                        model = get_model(vosk_model_path)
                         rec = KaldiRecognizer(model, 16000)
                         
                         # Convert audio data to bytes
@@ -501,7 +510,92 @@ def recognize_speech_from_mic(lang_code):
     return None
 
 
+def render_streaming_translation(t, incremental=None, **request):
+    """
+    Stream the translation and render each part as soon as it arrives
+    (literal first, then natural expressions one by one, then the advice text).
+    The translation is a short request of its own; the cultural advice is
+    generated in parallel and shown once the translation is on screen.
+    Long inputs go through document mode (parallel chunks, one advice section);
+    with an `incremental` session, only the sentences edited since its last
+    input are sent again.
+    The live view is cleared afterwards and the final result is returned so the
+    normal results section can render it with TTS buttons.
+    """
+    live = st.empty()
+    with live.container():
+        st.divider()
+        st.subheader(t["literal_title"])
+        literal_slot = st.empty()
+        literal_slot.caption(t["spinner"])
+        st.divider()
+        st.subheader(t["natural_title"])
+        natural_slot = st.container()
+        st.divider()
+        st.subheader(t["advice_title"])
+        advice_slot = st.empty()
+
+    advice = ""
+    note = ""
+    document_slot = None
+    result = None
+    # Multi-sentence inputs only re-translate the sentences edited since the last run;
+    # long inputs are split into sentences and translated in parallel chunks
+    if incremental is not None and incremental.applies(
+        request.get("source_text", ""), request.get("source_lang", ""), request.get("target_lang", ""),
+        request.get("scenario", ""), request.get("tone", "neutral"),
+    ):
+        stream = incremental.stream
+    elif is_long_document(request.get("source_text", "")):
+        stream = stream_document_translation
+    else:
+        stream = stream_translation_then_advice
+    for event in stream(**request):
+        kind = event.get("type")
+        if kind == "incremental":
+            note = t["incremental_progress"].format(changed=event.get("changed", 0), reused=event.get("reused", 0))
+            advice_slot.caption(note)
+        elif kind == "chunk":
+            progress = t["document_progress"].format(count=event.get("index", 0) + 1)
+            advice_slot.caption(f"{note} · {progress}" if note else progress)
+        elif kind == "literal_translation":
+            literal_slot.write(event.get("text", ""))
+        elif kind == "translation_done":
+            literal_slot.write((event.get("result") or {}).get("literal_translation", ""))
+            if not advice:
+                advice_slot.caption(t["advice_spinner"])
+        elif kind == "natural_document":
+            # Document mode: one stitched natural translation, no alternatives
+            if document_slot is None:
+                document_slot = natural_slot.empty()
+            document_slot.write(event.get("text", ""))
+        elif kind == "natural_expression":
+            item = event.get("item") or {}
+            with natural_slot:
+                st.markdown(f"**{event.get('index', 0) + 1}. {item.get('text', '')}**")
+                if item.get("explanation"):
+                    st.caption(item.get("explanation"))
+        elif kind == "advice_delta":
+            advice += event.get("text", "")
+            advice_slot.markdown(advice)
+        elif kind == "done":
+            result = event.get("result")
+
+    live.empty()
+    return result
+
+
+@st.cache_resource
+def start_client_warm_up():
+    """Open the pooled Deepseek connection once per server process (not per rerun)."""
+    thread = threading.Thread(target=warm_up_client, daemon=True)
+    thread.start()
+    return thread
+
+
 def main():
+    start_client_warm_up()
+
     # Sidebar for language selection
     with st.sidebar:
         st.header("Settings / 设置 / 設定")
@@ -604,20 +698,23 @@ def main():
     # 4. Translate Button
     if "translation_result" not in st.session_state:
         st.session_state.translation_result = None
+    # 记住上一次的逐句译文，修改后只重新翻译改动的句子
+    if "incremental" not in st.session_state:
+        st.session_state.incremental = IncrementalTranslator()
 
     if st.button(t["translate_btn"], type="primary", use_container_width=True):
         if not source_text or not source_text.strip():
             st.warning(t["input_warning"])
         else:
-            with st.spinner(t["spinner"]):
-                result = generate_translation_and_advice(
-                    source_text=source_text,
-                    source_lang=source_lang,
-                    target_lang=target_lang,
-                    scenario=scenario,
-                    tone=tone,
-                )
-                st.session_state.translation_result = result
+            st.session_state.translation_result = render_streaming_translation(
+                t,
+                incremental=st.session_state.incremental,
+                source_text=source_text,
+                source_lang=source_lang,
+                target_lang=target_lang,
+                scenario=scenario,
+                tone=tone,
+            )
 
     # 5. Results Display
     if st.session_state.translation_result:
@@ -642,7 +739,10 @@ def main():
         st.subheader(t["natural_title"])
         natural_data = result.get("natural_translation", [])
         
-        if isinstance(natural_data, list):
+        if result.get("document"):
+            # 文档模式：整篇自然译文，没有多种表达和说明
+            st.write(natural_data)
+        elif isinstance(natural_data, list):
             for idx, item in enumerate(natural_data):
                 text = item.get("text", "")
                 explanation = item.get("explanation", "")
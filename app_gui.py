@@ -6,10 +6,10 @@ Cross-Cultural Translation Assistant - Desktop GUI Version
 """
 
 import sys
-import json
 import os
 import wave
 import tempfile
+import threading
 
 # Try to import Qt framework (prefer PyQt6, fallback to PySide6)
 QT_FRAMEWORK = None
@@ -46,7 +46,13 @@ except ImportError:
 
 print(f"✓ Using {QT_FRAMEWORK} for GUI")
 
-from translator_core_new import generate_translation_and_advice
+from translator_core_new import stream_translation_then_advice, warm_up_client
+from document_translate import is_long_document, stream_document_translation
+from incremental_translate import IncrementalTranslator
+from speech_models import VOSK_MODEL_PATHS, get_model, is_loaded, model_path_for_lang, preload
+from speech_stream import SAMPLE_RATE, OverlappedTranslator, stream_utterances
+import tts_worker
+from tts_worker import TTS_AVAILABLE, TTS_SETTINGS, get_default_tts_worker
 
 # 多语言翻译字典
 TRANSLATIONS = {
@@ -83,12 +89,15 @@ TRANSLATIONS = {
         "input_required": "请输入要翻译的内容。",
         "translating": "正在生成翻译和文化建议...",
         "translation_complete": "翻译完成！",
+        "advice_generating": "翻译已完成，正在生成文化建议...",
+        "incremental_status": "仅重新翻译修改过的 {changed} 句（沿用 {reused} 句）",
         "translation_failed": "翻译失败",
         "translation_error": "翻译错误",
         "translation_error_msg": "翻译过程中发生错误:\n",
         "voice_input_title": "语音输入",
         "voice_recognizing": "✅ 语音识别完成",
         "voice_failed": "语音输入失败",
+        "voice_stop": "⏹️ 停止语音输入",
         "tts_error": "TTS 错误",
         "basic_features": "基础功能",
         "theme_label": "主题:",
@@ -128,12 +137,15 @@ TRANSLATIONS = {
         "input_required": "請輸入要翻譯的內容。",
         "translating": "正在生成翻譯和文化建議...",
         "translation_complete": "翻譯完成！",
+        "advice_generating": "翻譯已完成，正在生成文化建議...",
+        "incremental_status": "僅重新翻譯修改過的 {changed} 句（沿用 {reused} 句）",
         "translation_failed": "翻譯失敗",
         "translation_error": "翻譯錯誤",
         "translation_error_msg": "翻譯過程中發生錯誤:\n",
         "voice_input_title": "語音輸入",
         "voice_recognizing": "✅ 語音識別完成",
         "voice_failed": "語音輸入失敗",
+        "voice_stop": "⏹️ 停止語音輸入",
         "tts_error": "TTS 錯誤",
         "basic_features": "基礎功能",
         "theme_label": "主題:",
@@ -173,12 +185,15 @@ TRANSLATIONS = {
         "input_required": "Please enter text to translate.",
         "translating": "Generating translation and cultural advice...",
         "translation_complete": "Translation complete!",
+        "advice_generating": "Translation ready, generating cultural advice...",
+        "incremental_status": "Re-translating {changed} edited sentences ({reused} reused)",
         "translation_failed": "Translation failed",
         "translation_error": "Translation Error",
         "translation_error_msg": "An error occurred during translation:\n",
         "voice_input_title": "Voice Input",
         "voice_recognizing": "✅ Voice recognition complete",
         "voice_failed": "Voice input failed",
+        "voice_stop": "⏹️ Stop Voice Input",
         "tts_error": "TTS Error",
         "basic_features": "Basic Features",
         "theme_label": "Theme:",
@@ -218,12 +233,15 @@ TRANSLATIONS = {
         "input_required": "翻訳するテキストを入力してください。",
         "translating": "翻訳と文化的アドバイスを生成中...",
         "translation_complete": "翻訳完了！",
+        "advice_generating": "翻訳完了、文化的アドバイスを生成中...",
+        "incremental_status": "変更された {changed} 文のみ再翻訳中（{reused} 文を再利用）",
         "translation_failed": "翻訳失敗",
         "translation_error": "翻訳エラー",
         "translation_error_msg": "翻訳中にエラーが発生しました:\n",
         "voice_input_title": "音声入力",
         "voice_recognizing": "✅ 音声認識完了",
         "voice_failed": "音声入力失敗",
+        "voice_stop": "⏹️ 音声入力を停止",
         "tts_error": "TTS エラー",
         "basic_features": "基本機能",
         "theme_label": "テーマ:",
@@ -263,12 +281,15 @@ TRANSLATIONS = {
         "input_required": "Por favor ingrese texto para traducir.",
         "translating": "Generando traducción y consejos culturales...",
         "translation_complete": "¡Traducción completa!",
+        "advice_generating": "Traducción lista, generando consejos culturales...",
+        "incremental_status": "Retraduciendo {changed} frases editadas ({reused} reutilizadas)",
         "translation_failed": "Traducción fallida",
         "translation_error": "Error de Traducción",
         "translation_error_msg": "Ocurrió un error durante la traducción:\n",
         "voice_input_title": "Entrada de Voz",
         "voice_recognizing": "✅ Reconocimiento de voz completo",
         "voice_failed": "Entrada de voz fallida",
+        "voice_stop": "⏹️ Detener Entrada de Voz",
         "tts_error": "Error TTS",
         "basic_features": "Funciones Básicas",
         "theme_label": "Tema:",
@@ -308,12 +329,15 @@ TRANSLATIONS = {
         "input_required": "Veuillez entrer le texte à traduire.",
         "translating": "Génération de la traduction et des conseils culturels...",
         "translation_complete": "Traduction terminée!",
+        "advice_generating": "Traduction prête, génération des conseils culturels...",
+        "incremental_status": "Retraduction de {changed} phrases modifiées ({reused} réutilisées)",
         "translation_failed": "Traduction échouée",
         "translation_error": "Erreur de Traduction",
         "translation_error_msg": "Une erreur s'est produite lors de la traduction:\n",
         "voice_input_title": "Entrée Vocale",
         "voice_recognizing": "✅ Reconnaissance vocale terminée",
         "voice_failed": "Entrée vocale échouée",
+        "voice_stop": "⏹️ Arrêter l'Entrée Vocale",
         "tts_error": "Erreur TTS",
         "basic_features": "Fonctions de Base",
         "theme_label": "Thème:",
@@ -353,12 +377,15 @@ TRANSLATIONS = {
         "input_required": "Bitte geben Sie Text zum Übersetzen ein.",
         "translating": "Übersetzung und kulturelle Hinweise werden generiert...",
         "translation_complete": "Übersetzung abgeschlossen!",
+        "advice_generating": "Übersetzung fertig, kulturelle Hinweise werden generiert...",
+        "incremental_status": "{changed} geänderte Sätze werden neu übersetzt ({reused} wiederverwendet)",
         "translation_failed": "Übersetzung fehlgeschlagen",
         "translation_error": "Übersetzungsfehler",
         "translation_error_msg": "Während der Übersetzung ist ein Fehler aufgetreten:\n",
         "voice_input_title": "Spracheingabe",
         "voice_recognizing": "✅ Spracherkennung abgeschlossen",
         "voice_failed": "Spracheingabe fehlgeschlagen",
+        "voice_stop": "⏹️ Spracheingabe Stoppen",
         "tts_error": "TTS-Fehler",
         "basic_features": "Grundfunktionen",
         "theme_label": "Design:",
@@ -397,18 +424,14 @@ THEME_STYLES = {
     }
 }
 
-# Try to import text-to-speech
-TTS_AVAILABLE = False
-try:
-    import pyttsx3
-    TTS_AVAILABLE = True
-except ImportError:
+# Text-to-speech runs in one persistent worker thread (tts_worker.py)
+if not TTS_AVAILABLE:
     print("⚠️ pyttsx3 not available. Install with: pip install pyttsx3")
 
 # Try to import Vosk for speech recognition (free and offline)
 VOSK_AVAILABLE = False
 try:
-    from vosk import Model, KaldiRecognizer
+    from vosk import KaldiRecognizer
     import pyaudio
     VOSK_AVAILABLE = True
     print("✓ Vosk speech recognition available")
@@ -418,48 +441,84 @@ except ImportError as e:
 
 
 class TranslationThread(QThread):
-    """后台翻译线程，避免阻塞 UI"""
+    """后台翻译线程，避免阻塞 UI（两阶段流式输出：先翻译，文化建议随后到达）"""
     finished = Signal(dict)
+    partial = Signal(dict)  # 流式事件: literal_translation / natural_expression / translation_done / advice_delta
     error = Signal(str)
     progress = Signal(int)  # 进度信号 0-100
     
-    def __init__(self, source_text, source_lang, target_lang, scenario, tone):
+    def __init__(self, source_text, source_lang, target_lang, scenario, tone, incremental=None):
         super().__init__()
         self.source_text = source_text
         self.source_lang = source_lang
         self.target_lang = target_lang
         self.scenario = scenario
         self.tone = tone
+        self.incremental = incremental  # 增量翻译会话：只重新翻译修改过的句子
     
     def run(self):
         try:
             self.progress.emit(10)  # 开始翻译
-            result = generate_translation_and_advice(
+            result = None
+            # 多句输入走增量翻译，只发送修改过的句子；长文本走文档模式：按句分段、并行翻译、合并为一段文化建议
+            if self.incremental is not None and self.incremental.applies(
+                self.source_text, self.source_lang, self.target_lang, self.scenario, self.tone
+            ):
+                document, stream = True, self.incremental.stream
+            else:
+                document = is_long_document(self.source_text)
+                stream = stream_document_translation if document else stream_translation_then_advice
+            for event in stream(
                 source_text=self.source_text,
                 source_lang=self.source_lang,
                 target_lang=self.target_lang,
                 scenario=self.scenario,
                 tone=self.tone
-            )
+            ):
+                if event.get("type") == "done":
+                    result = event.get("result")
+                    break
+                if event.get("type") == "chunk":
+                    self.progress.emit(min(65, 10 + 5 * (event.get("index", 0) + 1)))  # 文档模式：分段逐个完成
+                elif event.get("type") == "literal_translation" and not document:
+                    self.progress.emit(40)  # 直译已到达
+                elif event.get("type") == "natural_expression":
+                    self.progress.emit(60)  # 自然表达逐条到达
+                elif event.get("type") == "translation_done":
+                    self.progress.emit(70)  # 翻译阶段完成，文化建议并行生成中
+                elif event.get("type") == "advice_delta":
+                    self.progress.emit(80)  # 文化建议生成中
+                self.partial.emit(event)
             self.progress.emit(100)  # 完成
-            self.finished.emit(result)
+            self.finished.emit(result or {})
         except Exception as e:
             self.error.emit(str(e))
 
 
 class VoiceInputThread(QThread):
     """
-    使用 Vosk 进行免费的本地语音识别
-    完全离线，无需网络连接
+    使用 Vosk 进行免费的本地语音识别（流式）
+    完全离线，无需网络连接；VAD 检测到一句话结束（约 0.5 秒静音）即出结果，
+    每句识别结果立即送去翻译，翻译与继续说话并行进行
     """
     finished = Signal(str)
     error = Signal(str)
     status = Signal(str)
+    utterance = Signal(int, str)  # 每句识别完成: (序号, 文本)
+    translated = Signal(int, str, dict)  # 每句翻译完成（按序号顺序）: (序号, 原文, 结果)
     
-    def __init__(self, lang_code, model_path=None):
+    def __init__(self, lang_code, model_path=None, target_lang=None, scenario="daily", tone="neutral"):
         super().__init__()
         self.lang_code = lang_code
         self.model_path = model_path
+        self.target_lang = target_lang
+        self.scenario = scenario
+        self.tone = tone
+        self._stop = threading.Event()
+    
+    def stop(self):
+        """结束录音；已识别的句子仍会完成翻译"""
+        self._stop.set()
     
     def run(self):
         if not VOSK_AVAILABLE:
@@ -474,12 +533,7 @@ class VoiceInputThread(QThread):
         
         # 获取语音模型路径
         if not self.model_path:
-            model_map = {
-                "zh": "models/zh",
-                "en": "models/en",
-                "ja": "models/ja"
-            }
-            self.model_path = model_map.get(self.lang_code, "models/en")
+            self.model_path = model_path_for_lang(self.lang_code)
         
         # 检查模型是否存在
         if not os.path.exists(self.model_path):
@@ -497,62 +551,57 @@ class VoiceInputThread(QThread):
             return
         
         try:
-            # 初始化 Vosk 模型
-            self.status.emit(f"正在加载语音模型 ({self.lang_code})...")
-            model = Model(self.model_path)
-            rec = KaldiRecognizer(model, 16000)
+            # 初始化 Vosk 模型（进程内共享，只在首次使用时加载）
+            if not is_loaded(self.model_path):
+                self.status.emit(f"正在加载语音模型 ({self.lang_code})...")
+            model = get_model(self.model_path)
+            rec = KaldiRecognizer(model, SAMPLE_RATE)
             rec.SetWords(True)  # 启用词级识别
             
-            # 初始化麦克风
+            # 初始化麦克风（小缓冲区，降低句尾检测延迟）
             p = pyaudio.PyAudio()
             stream = p.open(
                 format=pyaudio.paInt16,
                 channels=1,
-                rate=16000,
+                rate=SAMPLE_RATE,
                 input=True,
-                frames_per_buffer=8192
+                frames_per_buffer=1600
             )
             stream.start_stream()
             
             self.status.emit("🎙️ 正在监听... 请说话")
             
-            # 录音和识别
-            results = []
-            silent_chunks = 0
-            max_silent_chunks = 30  # 约3秒静默后停止
-            
-            while silent_chunks < max_silent_chunks:
-                data = stream.read(4096, exception_on_overflow=False)
-                
-                if rec.AcceptWaveform(data):
-                    result = json.loads(rec.Result())
-                    text = result.get("text", "")
-                    if text:
-                        results.append(text)
-                        self.status.emit(f"识别中: {text}")
-                        silent_chunks = 0
-                    else:
-                        silent_chunks += 1
-                else:
-                    # 部分识别结果
-                    partial = json.loads(rec.PartialResult())
-                    partial_text = partial.get("partial", "")
-                    if partial_text:
-                        self.status.emit(f"识别中: {partial_text}...")
-                        silent_chunks = 0
-                    else:
-                        silent_chunks += 1
+            # 每句话识别完成后立即翻译（边说边译）
+            translator = None
+            if self.target_lang:
+                translator = OverlappedTranslator(
+                    lambda idx, text, result: self.translated.emit(idx, text, result),
+                    self.lang_code, self.target_lang, self.scenario, self.tone
+                )
             
-            # 获取最终结果
-            final_result = json.loads(rec.FinalResult())
-            final_text = final_result.get("text", "")
-            if final_text:
-                results.append(final_text)
+            results = []
+            try:
+                for event in stream_utterances(
+                    rec, lambda: stream.read(1600, exception_on_overflow=False), stop=self._stop
+                ):
+                    if event["type"] == "partial":
+                        self.status.emit(f"识别中: {event['text']}...")
+                    elif event["type"] == "utterance":
+                        results.append(event["text"])
+                        self.utterance.emit(event["index"], event["text"])
+                        self.status.emit(f"识别中: {event['text']}")
+                        if translator:
+                            translator.submit(event["index"], event["text"])
+            finally:
+                # 清理资源
+                stream.stop_stream()
+                stream.close()
+                p.terminate()
             
-            # 清理资源
-            stream.stop_stream()
-            stream.close()
-            p.terminate()
+            # 等待仍在进行的翻译
+            if translator and translator.pending():
+                self.status.emit("正在完成翻译...")
+                translator.wait()
             
             # 合并所有识别结果
             full_text = " ".join(results).strip()
@@ -568,78 +617,16 @@ class VoiceInputThread(QThread):
             self.error.emit(f"语音识别错误: {str(e)}")
 
 
-class TTSThread(QThread):
-    """文本转语音线程"""
-    error = Signal(str)
-    
-    def __init__(self, text, lang_code):
-        super().__init__()
-        self.text = text
-        self.lang_code = lang_code
-    
-    def run(self):
-        if not TTS_AVAILABLE:
-            self.error.emit("TTS 库未安装。请安装: pip install pyttsx3")
-            return
-        
-        try:
-            engine = pyttsx3.init()
-            engine.setProperty('rate', 150)
-            
-            voices = engine.getProperty('voices')
-            
-            # 扩展的语音匹配关键词（包括更多可能的命名格式）
-            lang_keywords = {
-                "zh": ["chinese", "mandarin", "zh", "cn", "china", "台灣", "中文", "普通话"],
-                "en": ["english", "en", "us", "uk", "america", "britain"],
-                "ja": ["japanese", "ja", "japan", "日本", "haruka", "ichiro", "sayaka"]  # 添加常见日语语音名称
-            }
-            
-            keywords = lang_keywords.get(self.lang_code, ["english"])
-            selected_voice = None
-            
-            # 尝试匹配语音
-            for voice in voices:
-                voice_name_lower = voice.name.lower()
-                voice_id_lower = voice.id.lower() if hasattr(voice, 'id') else ""
-                
-                # 检查 name 和 id 字段
-                for keyword in keywords:
-                    if keyword.lower() in voice_name_lower or keyword.lower() in voice_id_lower:
-                        selected_voice = voice
-                        break
-                
-                if selected_voice:
-                    break
-            
-            # 如果找到匹配的语音，使用它
-            if selected_voice:
-                engine.setProperty('voice', selected_voice.id)
-            else:
-                # 如果没找到，使用系统默认语音并提示用户
-                available_voices = "\n".join([f"- {v.name} ({v.id})" for v in voices[:5]])
-                self.error.emit(
-                    f"未找到 {self.lang_code} 语音。\n\n"
-                    f"将使用系统默认语音。\n\n"
-                    f"可用的前 5 个语音：\n{available_voices}\n\n"
-                    f"提示：\n"
-                    f"- 如需日语语音，请在 Windows 设置中安装日语语音包\n"
-                    f"- 设置 → 时间和语言 → 语音 → 添加语音"
-                )
-            
-            engine.say(self.text)
-            engine.runAndWait()
-            
-        except Exception as e:
-            self.error.emit(f"TTS 错误: {str(e)}")
-
-
 class TranslationApp(QMainWindow):
     """主应用窗口"""
     
+    tts_error = Signal(str)  # TTS 线程报告的错误
+    
     def __init__(self):
         super().__init__()
         self.translation_result = None
+        self.document_natural_label = None  # 文档模式的整篇自然译文
+        self.incremental = IncrementalTranslator()  # 记住上一次的逐句译文，修改后只重新翻译改动的句子
         self.current_ui_lang = "zh-CN"  # 默认界面语言
         self.current_theme = "light"  # 默认浅色主题
         self.init_ui()
@@ -647,29 +634,33 @@ class TranslationApp(QMainWindow):
         # 应用默认主题
         self.apply_theme()
         
-        # 初始化时检查可用的 TTS 语音（可选，用于调试）
-        if TTS_AVAILABLE:
-            self.check_available_voices()
+        # 后台预热 Deepseek 连接池，所有 TranslationThread 共享同一个长连接客户端
+        threading.Thread(target=warm_up_client, daemon=True).start()
+        
+        # 后台预加载当前源语言的 Vosk 模型，首次语音输入无需等待
+        if VOSK_AVAILABLE:
+            source_lang = self.get_lang_code(self.source_lang_combo.currentText())
+            preload([model_path_for_lang(source_lang)])
+        
+        # 启动常驻 TTS 线程：引擎与语音只初始化一次，点击 🔊 即可播放
+        self.tts_error.connect(lambda msg: QMessageBox.warning(self, self.t("tts_error"), msg))
+        self.tts = get_default_tts_worker(on_error=self.tts_error.emit)
+        if self.tts:
+            threading.Thread(target=self.check_available_voices, daemon=True).start()
     
     def check_available_voices(self):
-        """检查系统可用的 TTS 语音（调试用）"""
-        try:
-            import pyttsx3
-            engine = pyttsx3.init()
-            voices = engine.getProperty('voices')
-            print("\n" + "=" * 60)
-            print("可用的 TTS 语音:")
-            print("=" * 60)
-            for i, voice in enumerate(voices, 1):
-                print(f"{i}. {voice.name}")
-                print(f"   ID: {voice.id}")
-                if hasattr(voice, 'languages'):
-                    print(f"   语言: {voice.languages}")
-                print()
-            print("=" * 60 + "\n")
-            engine.stop()
-        except Exception as e:
-            print(f"检查 TTS 语音时出错: {e}")
+        """检查系统可用的 TTS 语音（调试用，语音列表由 TTS 线程启动时获取一次）"""
+        voices = self.tts.voices()
+        print("\n" + "=" * 60)
+        print("可用的 TTS 语音:")
+        print("=" * 60)
+        for i, voice in enumerate(voices, 1):
+            print(f"{i}. {voice['name']}")
+            print(f"   ID: {voice['id']}")
+            if voice['languages']:
+                print(f"   语言: {voice['languages']}")
+            print()
+        print("=" * 60 + "\n")
     
     def t(self, key):
         """获取当前语言的翻译文本"""
@@ -969,8 +960,7 @@ class TranslationApp(QMainWindow):
     
     def _check_vosk_models(self):
         """检查是否有可用的 Vosk 模型"""
-        model_paths = ["models/zh", "models/en", "models/ja"]
-        return any(os.path.exists(path) for path in model_paths)
+        return any(os.path.exists(path) for path in VOSK_MODEL_PATHS.values())
     
     def create_output_area(self):
         """创建输出区域（选项卡）"""
@@ -1066,27 +1056,62 @@ class TranslationApp(QMainWindow):
             return "neutral"
     
     def start_voice_input(self):
-        """开始语音输入"""
+        """开始语音输入（再次点击停止）"""
+        if getattr(self, "voice_thread", None) is not None and self.voice_thread.isRunning():
+            self.voice_thread.stop()
+            self.voice_btn.setEnabled(False)
+            return
+        
         source_lang = self.get_lang_code(self.source_lang_combo.currentText())
+        target_lang = self.get_lang_code(self.target_lang_combo.currentText())
+        scenario = self.get_scenario_code(self.scenario_combo.currentText())
+        tone = self.get_tone_code(self.tone_combo.currentText())
         
-        self.voice_btn.setEnabled(False)
+        self.voice_btn.setText(self.t("voice_stop"))
         self.status_bar.showMessage("正在准备 Vosk 语音识别...")
         
-        self.voice_thread = VoiceInputThread(source_lang)
+        # 清空之前的内容，逐句追加识别与翻译结果
+        self.input_text.clear()
+        self.literal_text.clear()
+        self.clear_natural_items()
+        self.advice_text.clear()
+        self.literal_tts_btn.setEnabled(False)
+        self.voice_translations = []
+        
+        self.voice_thread = VoiceInputThread(
+            source_lang, target_lang=target_lang, scenario=scenario, tone=tone
+        )
+        self.voice_thread.utterance.connect(self.on_voice_utterance)
+        self.voice_thread.translated.connect(self.on_voice_translated)
         self.voice_thread.finished.connect(self.on_voice_finished)
         self.voice_thread.error.connect(self.on_voice_error)
         self.voice_thread.status.connect(self.status_bar.showMessage)
         self.voice_thread.start()
     
+    def on_voice_utterance(self, index, text):
+        """一句话识别完成：追加到输入框"""
+        current = self.input_text.toPlainText().strip()
+        self.input_text.setPlainText(f"{current} {text}".strip())
+    
+    def on_voice_translated(self, index, text, result):
+        """一句话翻译完成（按说话顺序到达）：追加到直译区"""
+        literal = result.get("literal_translation", "")
+        self.voice_translations.append(literal)
+        self.literal_text.setPlainText("\n".join(self.voice_translations))
+        if literal and not literal.startswith("["):
+            self.literal_tts_btn.setEnabled(TTS_AVAILABLE)
+    
     def on_voice_finished(self, text):
         """语音输入完成"""
         self.input_text.setPlainText(text)
+        self.voice_btn.setText(self.t("voice_input"))
         self.voice_btn.setEnabled(True)
         self.status_bar.showMessage("✅ 语音识别完成", 3000)
     
     def on_voice_error(self, error_msg):
         """语音输入错误"""
         QMessageBox.warning(self, self.t("voice_input_title"), error_msg)
+        self.voice_btn.setText(self.t("voice_input"))
         self.voice_btn.setEnabled(True)
         self.status_bar.showMessage(self.t("voice_failed"), 3000)
     
@@ -1119,8 +1144,12 @@ class TranslationApp(QMainWindow):
         
         # 启动翻译线程
         self.translation_thread = TranslationThread(
-            source_text, source_lang, target_lang, scenario, tone
+            source_text, source_lang, target_lang, scenario, tone, incremental=self.incremental
         )
+        self.streamed_advice = ""
+        self.streamed_natural_count = 0
+        self.document_natural_label = None
+        self.translation_thread.partial.connect(self.on_translation_partial)
         self.translation_thread.finished.connect(self.on_translation_finished)
         self.translation_thread.error.connect(self.on_translation_error)
         self.translation_thread.progress.connect(self.on_translation_progress)
@@ -1191,6 +1220,16 @@ class TranslationApp(QMainWindow):
             if child.widget():
                 child.widget().deleteLater()
     
+    def create_document_item(self):
+        """创建文档模式的整篇自然译文显示区域"""
+        label = QLabel()
+        label.setFont(QFont("Microsoft YaHei", 11))
+        label.setTextFormat(Qt.TextFormat.PlainText)
+        label.setWordWrap(True)
+        label.setTextInteractionFlags(Qt.TextInteractionFlag.TextSelectableByMouse)
+        label.setContentsMargins(5, 5, 5, 5)
+        return label
+    
     def create_natural_item(self, idx, text, explanation):
         """创建单个自然表达项（带播放按钮）"""
         item_widget = QWidget()
@@ -1250,6 +1289,41 @@ class TranslationApp(QMainWindow):
         
         return item_widget
     
+    def on_translation_partial(self, event):
+        """流式部分结果：直译、每条自然表达、文化建议片段到达即显示"""
+        kind = event.get("type")
+        if kind == "incremental":
+            self.status_bar.showMessage(
+                self.t("incremental_status").format(changed=event.get("changed", 0), reused=event.get("reused", 0))
+            )
+        elif kind == "literal_translation":
+            self.literal_text.setPlainText(event.get("text", ""))
+        elif kind == "natural_document":
+            # 文档模式：整篇自然译文只显示一段文本，逐块更新
+            if self.document_natural_label is None:
+                self.document_natural_label = self.create_document_item()
+                self.natural_items_layout.addWidget(self.document_natural_label)
+            self.document_natural_label.setText(event.get("text", ""))
+        elif kind == "natural_expression":
+            item = event.get("item") or {}
+            self.streamed_natural_count += 1
+            item_widget = self.create_natural_item(
+                self.streamed_natural_count, item.get("text", ""), item.get("explanation", "")
+            )
+            self.natural_items_layout.addWidget(item_widget)
+        elif kind == "translation_done":
+            # 翻译先行展示，文化建议稍后到达
+            literal = (event.get("result") or {}).get("literal_translation", "")
+            self.literal_text.setPlainText(literal)
+            if literal and not literal.startswith("["):
+                self.literal_tts_btn.setEnabled(TTS_AVAILABLE)
+            if not self.streamed_advice:
+                self.advice_text.setPlainText(self.t("advice_generating"))
+            self.status_bar.showMessage(self.t("advice_generating"))
+        elif kind == "advice_delta":
+            self.streamed_advice += event.get("text", "")
+            self.advice_text.setPlainText(self.format_advice_text(self.streamed_advice))
+    
     def on_translation_finished(self, result):
         """翻译完成"""
         self.translation_result = result
@@ -1264,7 +1338,14 @@ class TranslationApp(QMainWindow):
         self.clear_natural_items()
         # 支持两种字段名：natural_translation 和 natural_expressions
         natural_data = result.get("natural_translation") or result.get("natural_expressions", [])
-        if isinstance(natural_data, list) and natural_data:
+        self.document_natural_label = None
+        if result.get("document"):
+            # 文档模式：整篇译文，不显示表达编号和说明，也不在后台预合成语音
+            document_label = self.create_document_item()
+            document_label.setText(natural_data)
+            self.natural_items_layout.addWidget(document_label)
+            self.natural_items_layout.addStretch()
+        elif isinstance(natural_data, list) and natural_data:
             for idx, item in enumerate(natural_data, 1):
                 text = item.get("text", "")
                 explanation = item.get("explanation", "")
@@ -1272,6 +1353,7 @@ class TranslationApp(QMainWindow):
                 self.natural_items_layout.addWidget(item_widget)
             # 添加底部弹性空间
             self.natural_items_layout.addStretch()
+            self.presynthesize_natural(natural_data)
         elif natural_data:
             # 如果不是列表格式，显示原始数据
             fallback_label = QLabel(str(natural_data))
@@ -1300,11 +1382,22 @@ class TranslationApp(QMainWindow):
         if not text or text.startswith("["):
             return
         
+        if not self.tts:
+            QMessageBox.warning(self, self.t("tts_error"), "TTS 库未安装。请安装: pip install pyttsx3")
+            return
+        
         target_lang = self.get_lang_code(self.target_lang_combo.currentText())
         
-        self.tts_thread = TTSThread(text, target_lang)
-        self.tts_thread.error.connect(lambda msg: QMessageBox.warning(self, self.t("tts_error"), msg))
-        self.tts_thread.start()
+        # 打断正在播放的内容，立即播放（已预合成的短语直接播放 WAV）
+        self.tts.speak(text, target_lang, interrupt=True)
+    
+    def presynthesize_natural(self, natural_data):
+        """后台预合成前几条自然表达的语音，点击 🔊 时无需等待"""
+        if not self.tts or not isinstance(natural_data, list):
+            return
+        target_lang = self.get_lang_code(self.target_lang_combo.currentText())
+        texts = [item.get("text", "") for item in natural_data[:TTS_SETTINGS["presynth_count"]] if isinstance(item, dict)]
+        self.tts.presynthesize(texts, target_lang)
     
     def change_theme(self, index):
         """切换主题"""
@@ -1405,7 +1498,9 @@ def main():
     window = TranslationApp()
     window.show()
     
-    sys.exit(app.exec())
+    exit_code = app.exec()
+    tts_worker.shutdown()  # 停止 TTS 线程并删除预合成的 WAV 文件
+    sys.exit(exit_code)
 
 
 if __name__ == "__main__":
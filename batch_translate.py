@@ -0,0 +1,227 @@
+"""
+Batch translation engine and command-line entry point.
+
+Pre-translates phrasebooks from a CSV, JSONL or plain text file and writes
+one JSON object per line, in input order.
+
+- Requests run concurrently on a thread pool with a bounded number of
+  in-flight jobs; input is read lazily so memory stays flat for large files.
+- Consecutive short phrases with the same settings are packed into one
+  model request (see `generate_translations_batch`).
+- Output is flushed line by line; re-running the same command resumes after
+  the last complete line instead of starting over.
+- Every record has an "ok" field; rows that got a fallback result (API error,
+  missing token, unusable answer) are written with "ok": false, counted in
+  the summary and make the command exit with status 1. A resumed run starts
+  again from the first failed row, so an outage never poisons the output.
+
+Usage:
+    python batch_translate.py phrases.csv -o phrases.out.jsonl --source-lang zh --target-lang en --scenario tourism
+"""
+
+from typing import Dict, Iterable, Iterator, List, Optional
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+import argparse
+import csv
+import itertools
+import json
+import os
+import sys
+
+from translator_core_new import generate_translation_and_advice, generate_translations_batch, is_fallback
+
+
+REQUEST_FIELDS = ("source_lang", "target_lang", "scenario", "tone")
+
+
+def read_rows(path: str) -> Iterator[Dict]:
+    """Yield input rows as dicts with at least a `text` key.
+
+    - .csv: header row required; the text column may be `text` or `source_text`.
+    - .jsonl / .ndjson: one object (same keys) or one JSON string per line.
+    - anything else: one phrase per non-empty line.
+    Optional per-row columns: id, source_lang, target_lang, scenario, tone.
+    """
+    ext = os.path.splitext(path)[1].lower()
+    with open(path, "r", encoding="utf-8-sig", newline="") as f:
+        if ext == ".csv":
+            for row in csv.DictReader(f):
+                text = row.get("text") or row.get("source_text") or ""
+                yield {**row, "text": text}
+        elif ext in (".jsonl", ".ndjson"):
+            for line in f:
+                line = line.strip()
+                if not line:
+                    continue
+                data = json.loads(line)
+                if isinstance(data, str):
+                    yield {"text": data}
+                else:
+                    yield {**data, "text": data.get("text") or data.get("source_text") or ""}
+        else:
+            for line in f:
+                if line.strip():
+                    yield {"text": line.rstrip("\n")}
+
+
+def count_completed(output_path: str) -> int:
+    """Return how many rows are done, truncating the output at the first torn
+    line or failed row so a resumed run translates it again."""
+    if not os.path.exists(output_path):
+        return 0
+    completed = 0
+    good_offset = 0
+    with open(output_path, "rb") as f:
+        for line in f:
+            if not line.endswith(b"\n"):
+                break
+            try:
+                record = json.loads(line)
+            except ValueError:
+                break
+            # output written before the "ok" field existed: check the result itself
+            if not isinstance(record, dict) or not record.get("ok", not is_fallback(record)):
+                break
+            completed += 1
+            good_offset += len(line)
+    if good_offset != os.path.getsize(output_path):
+        with open(output_path, "r+b") as f:
+            f.truncate(good_offset)
+    return completed
+
+
+class BatchTranslator:
+    """Translate an iterable of rows concurrently while preserving order."""
+
+    def __init__(
+        self,
+        source_lang: str = "zh",
+        target_lang: str = "en",
+        scenario: str = "general",
+        tone: str = "neutral",
+        concurrency: int = 8,
+        pack_size: int = 8,
+        pack_max_chars: int = 40,
+        token_name: str = None,
+        use_cache: bool = True,
+    ):
+        self.defaults = {"source_lang": source_lang, "target_lang": target_lang, "scenario": scenario, "tone": tone}
+        self.concurrency = max(1, concurrency)
+        self.pack_size = max(1, pack_size)
+        self.pack_max_chars = pack_max_chars
+        self.token_name = token_name
+        self.use_cache = use_cache
+
+    def _settings(self, row: Dict) -> tuple:
+        return tuple(row.get(k) or self.defaults[k] for k in REQUEST_FIELDS)
+
+    def _jobs(self, rows: Iterable[Dict]) -> Iterator[List[Dict]]:
+        """Group consecutive short rows with identical settings into packed jobs."""
+        pack: List[Dict] = []
+        for row in rows:
+            short = len(row.get("text", "")) <= self.pack_max_chars
+            if pack and (not short or len(pack) >= self.pack_size or self._settings(row) != self._settings(pack[0])):
+                yield pack
+                pack = []
+            if short and self.pack_size > 1:
+                pack.append(row)
+            else:
+                yield [row]
+        if pack:
+            yield pack
+
+    def _translate_job(self, job: List[Dict]) -> List[Dict]:
+        source_lang, target_lang, scenario, tone = self._settings(job[0])
+        if len(job) == 1:
+            results = [generate_translation_and_advice(
+                job[0].get("text", ""), source_lang, target_lang, scenario, tone,
+                token_name=self.token_name, use_cache=self.use_cache,
+            )]
+        else:
+            results = generate_translations_batch(
+                [row.get("text", "") for row in job], source_lang, target_lang, scenario, tone,
+                token_name=self.token_name, use_cache=self.use_cache,
+            )
+        records = []
+        for row, result in zip(job, results):
+            record = {"id": row.get("id"), "source_text": row.get("text", "")}
+            record.update(zip(REQUEST_FIELDS, (source_lang, target_lang, scenario, tone)))
+            record.update(result)
+            record["ok"] = not is_fallback(result)
+            records.append(record)
+        return records
+
+    def run(self, rows: Iterable[Dict], start_index: int = 0) -> Iterator[Dict]:
+        """Yield one result record per row, in input order.
+
+        At most `concurrency` jobs run at once and at most twice that many are
+        buffered, so arbitrarily large inputs are processed in bounded memory.
+        """
+        index = start_index
+        window: deque = deque()
+        with ThreadPoolExecutor(max_workers=self.concurrency) as pool:
+            for job in self._jobs(rows):
+                window.append(pool.submit(self._translate_job, job))
+                if len(window) >= self.concurrency * 2:
+                    for record in window.popleft().result():
+                        yield {"index": index, **record}
+                        index += 1
+            while window:
+                for record in window.popleft().result():
+                    yield {"index": index, **record}
+                    index += 1
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Batch-translate phrases from a CSV / JSONL / text file.")
+    parser.add_argument("input", help="Input file (.csv, .jsonl or one phrase per line)")
+    parser.add_argument("-o", "--output", help="Output JSONL file (default: <input>.out.jsonl)")
+    parser.add_argument("--source-lang", default="zh")
+    parser.add_argument("--target-lang", default="en")
+    parser.add_argument("--scenario", default="general")
+    parser.add_argument("--tone", default="neutral")
+    parser.add_argument("--concurrency", type=int, default=8, help="Max in-flight requests")
+    parser.add_argument("--pack-size", type=int, default=8, help="Max short phrases per request (1 disables packing)")
+    parser.add_argument("--pack-max-chars", type=int, default=40, help="Phrases up to this length may be packed")
+    parser.add_argument("--token-name", default=None, help="Token name from credentials.json")
+    parser.add_argument("--no-cache", action="store_true", help="Bypass the translation cache")
+    parser.add_argument("--restart", action="store_true", help="Ignore existing output instead of resuming")
+    args = parser.parse_args(argv)
+
+    output = args.output or os.path.splitext(args.input)[0] + ".out.jsonl"
+    if args.restart and os.path.exists(output):
+        os.remove(output)
+    done = count_completed(output)
+    if done:
+        print(f"Resuming after {done} completed rows -> {output}", file=sys.stderr)
+
+    translator = BatchTranslator(
+        source_lang=args.source_lang,
+        target_lang=args.target_lang,
+        scenario=args.scenario,
+        tone=args.tone,
+        concurrency=args.concurrency,
+        pack_size=args.pack_size,
+        pack_max_chars=args.pack_max_chars,
+        token_name=args.token_name,
+        use_cache=not args.no_cache,
+    )
+    rows = itertools.islice(read_rows(args.input), done, None)
+    written = failed = 0
+    with open(output, "a", encoding="utf-8") as out:
+        for record in translator.run(rows, start_index=done):
+            out.write(json.dumps(record, ensure_ascii=False) + "\n")
+            out.flush()
+            written += 1
+            failed += 0 if record["ok"] else 1
+            if written % 100 == 0:
+                print(f"{done + written} rows translated", file=sys.stderr)
+    print(f"Done: {written} new rows ({failed} failed), {done + written} total -> {output}", file=sys.stderr)
+    if failed:
+        print("Re-run the same command to retry from the first failed row.", file=sys.stderr)
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,322 @@
+"""
+Offline latency / throughput benchmark for the translation pipeline.
+
+Starts `mock_deepseek_server.py` in a separate process (so its CPU time is
+not counted), points the pipeline at it through DEEPSEEK_API_KEY /
+DEEPSEEK_API_URL and drives the real entry points:
+
+- sync:   generate_translation_and_advice from a thread pool
+- stream: stream_translation_and_advice (also reports time to first event)
+- async:  agenerate_translation_and_advice on one event loop
+- batch:  BatchTranslator with packed requests
+
+For each scenario it reports p50/p95/p99 latency, requests per second,
+client CPU time and Python allocations (tracemalloc). Results can be saved
+as JSON and compared against a saved baseline to catch regressions:
+
+    python benchmark.py --requests 200 --concurrency 16 --save bench.json
+    python benchmark.py --baseline bench.json --tolerance 0.2
+"""
+
+from typing import Callable, Dict, List, Optional
+from concurrent.futures import ThreadPoolExecutor
+import argparse
+import asyncio
+import json
+import os
+import socket
+import subprocess
+import sys
+import time
+import tracemalloc
+
+from json_repair import parse_stats
+from mock_deepseek_server import add_config_arguments
+
+
+SCENARIOS = ("sync", "stream", "async", "batch")
+
+SAMPLE_TEXTS = [
+    "今天天气很好，我们去公园散步吧。",
+    "请问这附近有地铁站吗？",
+    "感谢您百忙之中抽出时间参加会议。",
+    "这个方案还需要再讨论一下。",
+]
+
+
+def _texts(n: int) -> List[str]:
+    # distinct texts so requests are not served by the cache or coalesced
+    return [f"{SAMPLE_TEXTS[i % len(SAMPLE_TEXTS)]} (#{i})" for i in range(n)]
+
+
+def _failed(result: Dict) -> bool:
+    literal = str(result.get("literal_translation", ""))
+    return literal.startswith("[Literal Example]") or literal.startswith("[Error]")
+
+
+def percentile(values: List[float], pct: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    rank = (len(ordered) - 1) * pct / 100.0
+    low = int(rank)
+    high = min(low + 1, len(ordered) - 1)
+    return ordered[low] + (ordered[high] - ordered[low]) * (rank - low)
+
+
+class Recorder:
+    """Collects per-request latencies (seconds) and failures for one scenario."""
+
+    def __init__(self):
+        self.latencies: List[float] = []
+        self.first_event: List[float] = []
+        self.failures = 0
+
+    def add(self, started: float, result: Dict, first_event: Optional[float] = None) -> None:
+        self.latencies.append(time.perf_counter() - started)
+        if first_event is not None:
+            self.first_event.append(first_event - started)
+        if _failed(result):
+            self.failures += 1
+
+
+def _run_sync(texts: List[str], args, rec: Recorder) -> int:
+    from translator_core_new import generate_translation_and_advice
+
+    def _one(text: str) -> None:
+        started = time.perf_counter()
+        result = generate_translation_and_advice(text, args.source_lang, args.target_lang, args.scenario, use_cache=False)
+        rec.add(started, result)
+
+    with ThreadPoolExecutor(max_workers=args.concurrency) as pool:
+        list(pool.map(_one, texts))
+    return len(texts)
+
+
+def _run_stream(texts: List[str], args, rec: Recorder) -> int:
+    from translator_core_new import stream_translation_and_advice
+
+    def _one(text: str) -> None:
+        started = time.perf_counter()
+        first = None
+        result: Dict = {}
+        for event in stream_translation_and_advice(text, args.source_lang, args.target_lang, args.scenario, use_cache=False):
+            if first is None:
+                first = time.perf_counter()
+            if event["type"] == "done":
+                result = event["result"]
+        rec.add(started, result, first)
+
+    with ThreadPoolExecutor(max_workers=args.concurrency) as pool:
+        list(pool.map(_one, texts))
+    return len(texts)
+
+
+def _run_async(texts: List[str], args, rec: Recorder) -> int:
+    from translator_core_new import agenerate_translation_and_advice
+    from client_pool import aclose_all
+
+    async def _main() -> None:
+        gate = asyncio.Semaphore(args.concurrency)
+
+        async def _one(text: str) -> None:
+            async with gate:
+                started = time.perf_counter()
+                result = await agenerate_translation_and_advice(
+                    text, args.source_lang, args.target_lang, args.scenario, use_cache=False
+                )
+                rec.add(started, result)
+
+        await asyncio.gather(*(_one(text) for text in texts))
+        await aclose_all()
+
+    asyncio.run(_main())
+    return len(texts)
+
+
+def _run_batch(texts: List[str], args, rec: Recorder) -> int:
+    from batch_translate import BatchTranslator
+
+    class _TimedBatch(BatchTranslator):
+        def _translate_job(self, job):
+            started = time.perf_counter()
+            records = super()._translate_job(job)
+            rec.add(started, records[0] if records else {})
+            rec.failures += sum(1 for record in records[1:] if _failed(record))
+            return records
+
+    translator = _TimedBatch(
+        source_lang=args.source_lang,
+        target_lang=args.target_lang,
+        scenario=args.scenario,
+        concurrency=args.concurrency,
+        pack_size=args.pack_size,
+        pack_max_chars=10_000,
+        use_cache=False,
+    )
+    rows = [{"id": i, "text": text} for i, text in enumerate(texts)]
+    return sum(1 for _record in translator.run(rows))
+
+
+_RUNNERS: Dict[str, Callable] = {"sync": _run_sync, "stream": _run_stream, "async": _run_async, "batch": _run_batch}
+
+
+def _parse_counts() -> Dict[str, int]:
+    """Model JSON parse outcomes so far, summed over completion kinds."""
+    totals = {"repaired": 0, "truncated": 0, "failed": 0}
+    for counts in parse_stats().values():
+        for key in totals:
+            totals[key] += counts[key]
+    return totals
+
+
+def run_scenario(name: str, args) -> Dict:
+    rec = Recorder()
+    texts = _texts(args.requests)
+    if args.trace_alloc:
+        tracemalloc.start()
+    parsed0 = _parse_counts()
+    cpu0 = time.process_time()
+    wall0 = time.perf_counter()
+    rows = _RUNNERS[name](texts, args, rec)
+    wall = time.perf_counter() - wall0
+    cpu = time.process_time() - cpu0
+    alloc_current = alloc_peak = 0
+    if args.trace_alloc:
+        alloc_current, alloc_peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+
+    parsed = {k: v - parsed0[k] for k, v in _parse_counts().items()}
+    ms = [x * 1000 for x in rec.latencies]
+    report = {
+        "scenario": name,
+        "rows": rows,
+        "calls": len(ms),
+        "failures": rec.failures,
+        "wall_s": round(wall, 3),
+        "rps": round(rows / wall, 2) if wall else 0.0,
+        "p50_ms": round(percentile(ms, 50), 1),
+        "p95_ms": round(percentile(ms, 95), 1),
+        "p99_ms": round(percentile(ms, 99), 1),
+        "cpu_s": round(cpu, 3),
+        "cpu_ms_per_row": round(cpu * 1000 / rows, 3) if rows else 0.0,
+        "alloc_peak_kib": round(alloc_peak / 1024, 1),
+        "alloc_retained_kib": round(alloc_current / 1024, 1),
+        "json_salvaged": parsed["repaired"] + parsed["truncated"],
+        "json_failed": parsed["failed"],
+    }
+    if rec.first_event:
+        report["first_event_p50_ms"] = round(percentile([x * 1000 for x in rec.first_event], 50), 1)
+    return report
+
+
+def _warm_up(args) -> None:
+    """Import the SDK and open the pooled connection outside the measured runs."""
+    from translator_core_new import generate_translation_and_advice
+
+    generate_translation_and_advice("warm up", args.source_lang, args.target_lang, args.scenario, use_cache=False)
+
+
+def _free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def _start_mock_server(args) -> subprocess.Popen:
+    port = _free_port()
+    cmd = [sys.executable, os.path.join(os.path.dirname(os.path.abspath(__file__)), "mock_deepseek_server.py"), "--port", str(port)]
+    for flag in ("latency", "latency_ms", "jitter", "ttft_ms", "error_rate", "throttle_rate",
+                 "bad_json_rate", "natural_count", "advice_chars", "chunk_chars", "seed"):
+        value = getattr(args, flag)
+        if value is not None:
+            cmd += [f"--{flag.replace('_', '-')}", str(value)]
+    proc = subprocess.Popen(cmd, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    deadline = time.time() + 10
+    while time.time() < deadline:
+        try:
+            socket.create_connection(("127.0.0.1", port), timeout=0.2).close()
+            args.server_url = f"http://127.0.0.1:{port}"
+            return proc
+        except OSError:
+            time.sleep(0.05)
+    proc.kill()
+    raise RuntimeError("Mock Deepseek server did not start")
+
+
+def compare(results: List[Dict], baseline: List[Dict], tolerance: float) -> List[str]:
+    """Return human-readable regressions (p95 latency up / throughput down beyond tolerance)."""
+    base = {r["scenario"]: r for r in baseline}
+    problems = []
+    for r in results:
+        b = base.get(r["scenario"])
+        if not b:
+            continue
+        if b["p95_ms"] and r["p95_ms"] > b["p95_ms"] * (1 + tolerance):
+            problems.append(f"{r['scenario']}: p95 {b['p95_ms']} -> {r['p95_ms']} ms")
+        if b["rps"] and r["rps"] < b["rps"] * (1 - tolerance):
+            problems.append(f"{r['scenario']}: rps {b['rps']} -> {r['rps']}")
+        if b["cpu_ms_per_row"] and r["cpu_ms_per_row"] > b["cpu_ms_per_row"] * (1 + tolerance):
+            problems.append(f"{r['scenario']}: cpu/row {b['cpu_ms_per_row']} -> {r['cpu_ms_per_row']} ms")
+    return problems
+
+
+def _print_table(results: List[Dict]) -> None:
+    cols = ["scenario", "rows", "failures", "rps", "p50_ms", "p95_ms", "p99_ms", "cpu_ms_per_row", "alloc_peak_kib"]
+    print("  ".join(f"{c:>14}" for c in cols))
+    for r in results:
+        print("  ".join(f"{str(r.get(c, '')):>14}" for c in cols))
+    for r in results:
+        if "first_event_p50_ms" in r:
+            print(f"{r['scenario']}: first event p50 {r['first_event_p50_ms']} ms")
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Benchmark the translation pipeline against a local mock Deepseek API.")
+    parser.add_argument("--scenarios", default=",".join(SCENARIOS), help=f"Comma-separated subset of {','.join(SCENARIOS)}")
+    parser.add_argument("--requests", type=int, default=100, help="Rows per scenario")
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--pack-size", type=int, default=8, help="Phrases per packed request in the batch scenario")
+    parser.add_argument("--source-lang", default="zh")
+    parser.add_argument("--target-lang", default="en")
+    parser.add_argument("--scenario", default="general", help="Translation scenario passed to the pipeline")
+    parser.add_argument("--server-url", default=None, help="Use an already running mock server instead of starting one")
+    parser.add_argument("--no-trace-alloc", dest="trace_alloc", action="store_false", help="Skip tracemalloc (lower overhead)")
+    parser.add_argument("--save", help="Write results as JSON to this file")
+    parser.add_argument("--baseline", help="Compare against results saved with --save")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="Allowed relative regression vs. the baseline")
+    add_config_arguments(parser)
+    args = parser.parse_args(argv)
+
+    names = [n.strip() for n in args.scenarios.split(",") if n.strip()]
+    unknown = [n for n in names if n not in _RUNNERS]
+    if unknown:
+        parser.error(f"Unknown scenario(s): {', '.join(unknown)}")
+
+    proc = None if args.server_url else _start_mock_server(args)
+    os.environ["DEEPSEEK_API_KEY"] = "mock-token"
+    os.environ["DEEPSEEK_API_URL"] = args.server_url
+    os.environ["TRANSLATION_CACHE_DISABLED"] = "1"
+    try:
+        _warm_up(args)
+        results = [run_scenario(name, args) for name in names]
+    finally:
+        if proc is not None:
+            proc.terminate()
+            proc.wait(timeout=5)
+
+    _print_table(results)
+    if args.save:
+        with open(args.save, "w", encoding="utf-8") as f:
+            json.dump(results, f, ensure_ascii=False, indent=2)
+    if args.baseline:
+        with open(args.baseline, "r", encoding="utf-8") as f:
+            problems = compare(results, json.load(f), args.tolerance)
+        for problem in problems:
+            print(f"REGRESSION {problem}")
+        return 1 if problems else 0
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
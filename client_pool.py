@@ -0,0 +1,159 @@
+"""
+Process-wide registry of pooled Deepseek (OpenAI SDK) clients, sync and async.
+
+Constructing `OpenAI(...)` per call throws away the underlying httpx
+connection pool, so every translation paid a fresh TCP+TLS handshake.
+Clients here are created once per (token, api_url) and reused by every
+caller in the process (Streamlit reruns, Qt worker threads, batch jobs).
+
+Pool limits and timeouts can be configured with environment variables or
+`configure_pool(...)` before the first client is created:
+
+- DEEPSEEK_POOL_MAX_CONNECTIONS   (default 20)
+- DEEPSEEK_POOL_MAX_KEEPALIVE     (default 10)
+- DEEPSEEK_POOL_KEEPALIVE_EXPIRY  (seconds, default 60)
+- DEEPSEEK_CONNECT_TIMEOUT        (seconds, default 10)
+- DEEPSEEK_READ_TIMEOUT           (seconds, default 120)
+- DEEPSEEK_HTTP2                  ("0" to disable; enabled when `h2` is installed)
+
+The SDK's own retries are switched off (max_retries=0): attempts, backoff
+and deadlines are owned by `resilience`, so they are counted and bounded.
+"""
+
+from typing import Dict, Optional, Tuple
+import asyncio
+import importlib.util
+import os
+import threading
+import weakref
+
+
+POOL_SETTINGS = {
+    "max_connections": int(os.environ.get("DEEPSEEK_POOL_MAX_CONNECTIONS", "20")),
+    "max_keepalive_connections": int(os.environ.get("DEEPSEEK_POOL_MAX_KEEPALIVE", "10")),
+    "keepalive_expiry": float(os.environ.get("DEEPSEEK_POOL_KEEPALIVE_EXPIRY", "60")),
+    "connect_timeout": float(os.environ.get("DEEPSEEK_CONNECT_TIMEOUT", "10")),
+    "read_timeout": float(os.environ.get("DEEPSEEK_READ_TIMEOUT", "120")),
+    "http2": os.environ.get("DEEPSEEK_HTTP2", "1") != "0",
+}
+
+_clients: Dict[Tuple[str, str], object] = {}
+# event loop -> {(token, api_url): client}; an entry goes away with its loop
+_async_clients: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, Dict[Tuple[str, str], object]]" = (
+    weakref.WeakKeyDictionary()
+)
+_lock = threading.Lock()
+
+
+def configure_pool(**settings) -> None:
+    """Override pool settings. Only affects clients created afterwards."""
+    for key, value in settings.items():
+        if key not in POOL_SETTINGS:
+            raise KeyError(f"Unknown pool setting: {key}")
+        POOL_SETTINGS[key] = value
+
+
+def _http2_enabled() -> bool:
+    # httpx only speaks HTTP/2 when the optional `h2` package is installed
+    return bool(POOL_SETTINGS["http2"]) and importlib.util.find_spec("h2") is not None
+
+
+def _build_http_client(async_client: bool = False):
+    import httpx
+
+    limits = httpx.Limits(
+        max_connections=POOL_SETTINGS["max_connections"],
+        max_keepalive_connections=POOL_SETTINGS["max_keepalive_connections"],
+        keepalive_expiry=POOL_SETTINGS["keepalive_expiry"],
+    )
+    timeout = httpx.Timeout(POOL_SETTINGS["read_timeout"], connect=POOL_SETTINGS["connect_timeout"])
+    client_cls = httpx.AsyncClient if async_client else httpx.Client
+    return client_cls(limits=limits, timeout=timeout, http2=_http2_enabled())
+
+
+def get_client(token: str, api_url: str):
+    """Return the shared OpenAI client for (token, api_url), creating it on first use.
+
+    Raises ImportError if the OpenAI SDK is not installed, so callers can keep
+    their existing `[SDK Not Installed]` handling.
+    """
+    key = (token, api_url)
+    client = _clients.get(key)
+    if client is not None:
+        return client
+    from openai import OpenAI
+
+    with _lock:
+        client = _clients.get(key)
+        if client is None:
+            client = OpenAI(api_key=token, base_url=api_url, http_client=_build_http_client(), max_retries=0)
+            _clients[key] = client
+    return client
+
+
+def get_async_client(token: str, api_url: str):
+    """Return the shared AsyncOpenAI client for (token, api_url) on the running loop.
+
+    httpx async pools are bound to the event loop that created them, so async
+    clients are kept per loop object; callers normally share a single loop.
+    Clients of loops that have been closed (e.g. after `asyncio.run`) are
+    dropped when the next client is created.
+    """
+    loop = asyncio.get_running_loop()
+    key = (token, api_url)
+    client = _async_clients.get(loop, {}).get(key)
+    if client is not None:
+        return client
+    from openai import AsyncOpenAI
+
+    with _lock:
+        for closed in [other for other in list(_async_clients.keys()) if other.is_closed()]:
+            _async_clients.pop(closed, None)
+        clients = _async_clients.setdefault(loop, {})
+        client = clients.get(key)
+        if client is None:
+            client = AsyncOpenAI(
+                api_key=token, base_url=api_url, http_client=_build_http_client(async_client=True), max_retries=0
+            )
+            clients[key] = client
+    return client
+
+
+def warm_up(token: str, api_url: str) -> bool:
+    """Open a keep-alive connection ahead of the first translation.
+
+    Issues a cheap `models.list()` request (no token spend). Returns True if the
+    endpoint answered; failures are swallowed.
+    """
+    try:
+        get_client(token, api_url).models.list()
+        return True
+    except Exception:
+        return False
+
+
+def close_all() -> None:
+    """Close every pooled client (e.g. on application shutdown)."""
+    with _lock:
+        clients = list(_clients.values())
+        _clients.clear()
+    for client in clients:
+        try:
+            client.close()
+        except Exception:
+            pass
+
+
+async def aclose_all() -> None:
+    """Close the async clients created on the running loop."""
+    with _lock:
+        clients = list(_async_clients.pop(asyncio.get_running_loop(), {}).values())
+    for client in clients:
+        try:
+            await client.close()
+        except Exception:
+            pass
+
+
+def pool_info() -> Dict[str, Optional[object]]:
+    return {"clients": len(_clients), "async_clients": sum(len(clients) for clients in list(_async_clients.values())), "http2": _http2_enabled(), **POOL_SETTINGS}
@@ -0,0 +1,387 @@
+"""
+Document mode: long texts translated as parallel, context-linked chunks.
+
+A long input used to go to the model as one prompt: slow, liable to hit the
+output limit and returned as one blob. Document mode instead:
+
+- segments the text into sentences (`text_segmentation`) and packs them into
+  chunks of up to `chunk_chars` characters, preferring paragraph breaks
+- translates the chunks concurrently (`generate_document_sentences`, one
+  aligned answer per sentence, each cached on its own); each chunk carries
+  the source sentences just before it (up to `context_chars`) as a sliding
+  context window, so names and terminology stay consistent
+- stitches the translations back in order, keeping line and paragraph breaks
+- asks for one consolidated cultural advice section on the opening
+  `advice_chars` characters of the document, alongside the chunks
+
+Input is read lazily and at most 2 x `concurrency` chunks are in flight or
+waiting to be delivered, so a file of any size is translated in bounded
+memory; the command line writes every chunk as soon as it is in order.
+
+Usage:
+    python document_translate.py report.txt -o report.zh.md --source-lang en --target-lang zh --scenario business
+
+Settings (environment variables or `configure_document(...)`):
+- TRANSLATION_DOCUMENT_MIN_CHARS      inputs at least this long use document mode in the UIs (default 600)
+- TRANSLATION_DOCUMENT_CHUNK_CHARS    characters per chunk (default 600)
+- TRANSLATION_DOCUMENT_CONTEXT_CHARS  preceding characters sent as context (default 200)
+- TRANSLATION_DOCUMENT_CONCURRENCY    chunks translated at once (default 4)
+- TRANSLATION_DOCUMENT_ADVICE_CHARS   opening characters the advice is based on (default 2000)
+"""
+
+from typing import Dict, Iterable, Iterator, List, Optional, Union
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+import argparse
+import json
+import os
+import queue
+import sys
+import threading
+
+from metrics import incr
+from text_segmentation import Segment, iter_segments, joiner, split_long
+from translator_core_new import generate_document_sentences, stream_advice
+
+
+DOCUMENT_SETTINGS = {
+    "min_chars": int(os.environ.get("TRANSLATION_DOCUMENT_MIN_CHARS", "600")),
+    "chunk_chars": int(os.environ.get("TRANSLATION_DOCUMENT_CHUNK_CHARS", "600")),
+    "context_chars": int(os.environ.get("TRANSLATION_DOCUMENT_CONTEXT_CHARS", "200")),
+    "concurrency": int(os.environ.get("TRANSLATION_DOCUMENT_CONCURRENCY", "4")),
+    "advice_chars": int(os.environ.get("TRANSLATION_DOCUMENT_ADVICE_CHARS", "2000")),
+}
+
+
+def configure_document(**settings) -> None:
+    """Override document mode settings; takes effect for the next document."""
+    for key, value in settings.items():
+        if key not in DOCUMENT_SETTINGS:
+            raise KeyError(f"Unknown document setting: {key}")
+        DOCUMENT_SETTINGS[key] = value
+
+
+def is_long_document(text: str) -> bool:
+    """Whether the UIs should translate `text` in document mode."""
+    return bool(text) and len(text.strip()) >= DOCUMENT_SETTINGS["min_chars"]
+
+
+def _context(recent: deque, limit: int) -> str:
+    """The most recent whole sentences that fit in `limit` characters."""
+    parts: List[str] = []
+    size = 0
+    for text, sep in reversed(recent):
+        if size + len(text) + len(sep) > limit:
+            if not parts:
+                parts.append(text[-limit:])
+            break
+        parts.append(text + sep)
+        size += len(text) + len(sep)
+    return "".join(reversed(parts)).strip()
+
+
+def iter_chunks(segments: Iterable[Segment], chunk_chars: int, context_chars: int) -> Iterator[Dict]:
+    """Pack sentences into chunks: {"index", "text", "sentences", "context", "separator"}.
+
+    `sentences` are the chunk's (sentence, separator) pairs; sentences longer
+    than `chunk_chars` are cut at soft breaks. `separator` is what followed
+    the chunk in the source: "\\n" / "\\n\\n" for line and paragraph
+    breaks, " " inside a line and "" after the last chunk.
+    """
+    recent: deque = deque()
+    recent_size = 0
+    parts: List[Segment] = []
+    size = 0
+    index = 0
+
+    def flush(separator: str) -> Dict:
+        nonlocal parts, size, index, recent_size
+        text = "".join(t + s for t, s in parts[:-1]) + parts[-1][0]
+        chunk = {
+            "index": index, "text": text, "sentences": parts,
+            "context": _context(recent, context_chars), "separator": separator,
+        }
+        for part in parts:
+            recent.append(part)
+            recent_size += len(part[0]) + len(part[1])
+        while len(recent) > 1 and recent_size - len(recent[0][0]) - len(recent[0][1]) >= context_chars:
+            dropped = recent.popleft()
+            recent_size -= len(dropped[0]) + len(dropped[1])
+        parts, size = [], 0
+        index += 1
+        return chunk
+
+    for text, sep in segments:
+        pieces = split_long(text, chunk_chars)
+        for i, piece in enumerate(pieces):
+            piece_sep = sep if i == len(pieces) - 1 else ""
+            if parts:
+                last_sep = parts[-1][1]
+                full = size + len(piece) > chunk_chars
+                # a paragraph break is a good place to end a half-full chunk
+                if full or (last_sep.startswith("\n\n") and size >= chunk_chars // 2):
+                    yield flush(last_sep if "\n" in last_sep else " ")
+            parts.append((piece, piece_sep))
+            size += len(piece) + len(piece_sep)
+    if parts:
+        yield flush("")
+
+
+class DocumentTranslator:
+    """Translate a long text or file chunk by chunk, with one advice section."""
+
+    def __init__(
+        self,
+        source_lang: str,
+        target_lang: str,
+        scenario: str = "general",
+        tone: str = "neutral",
+        token_name: str = None,
+        use_cache: bool = True,
+        chunk_chars: Optional[int] = None,
+        context_chars: Optional[int] = None,
+        concurrency: Optional[int] = None,
+        advice_chars: Optional[int] = None,
+        known: Optional[Dict[str, Dict]] = None,
+    ):
+        self.request = {
+            "source_lang": source_lang, "target_lang": target_lang, "scenario": scenario, "tone": tone,
+            "token_name": token_name, "use_cache": use_cache,
+        }
+        self.chunk_chars = max(50, chunk_chars or DOCUMENT_SETTINGS["chunk_chars"])
+        self.context_chars = DOCUMENT_SETTINGS["context_chars"] if context_chars is None else context_chars
+        self.concurrency = max(1, concurrency or DOCUMENT_SETTINGS["concurrency"])
+        self.advice_chars = advice_chars or DOCUMENT_SETTINGS["advice_chars"]
+        # sentence -> translation already known (e.g. from the previous input); not sent again
+        self.known = known or {}
+        self.advice_events: "queue.Queue" = queue.Queue()
+        self._advice_started = False
+
+    def output_separator(self, separator: str) -> str:
+        """The source separator of a chunk as it goes between translated chunks."""
+        if separator == " ":
+            return joiner(self.request["target_lang"])
+        return separator
+
+    def _translate(self, chunk: Dict) -> Dict:
+        sentences = chunk["sentences"]
+        results: List[Optional[Dict]] = [self.known.get(text) for text, _sep in sentences]
+        missing = [i for i, result in enumerate(results) if result is None]
+        if missing:
+            # the context runs up to the first sentence that is sent
+            before = [(chunk["context"], " ")] + sentences[:missing[0]]
+            fresh = generate_document_sentences(
+                [sentences[i][0] for i in missing], _context(before, self.context_chars), **self.request
+            )
+            for i, result in zip(missing, fresh):
+                results[i] = result
+        ok = all(result["ok"] for result in results)
+        incr("translator_document_chunks_total", outcome="ok" if ok else "failed")
+        inner = [self.output_separator(" " if "\n" not in sep else sep) for _text, sep in sentences[:-1]] + [""]
+        return {
+            "index": chunk["index"],
+            "source_text": chunk["text"],
+            "separator": self.output_separator(chunk["separator"]),
+            "literal_translation": "".join(r["literal_translation"] + sep for r, sep in zip(results, inner)),
+            "natural_translation": "".join(r["natural_translation"] + sep for r, sep in zip(results, inner)),
+            "ok": ok,
+            "reused": len(sentences) - len(missing),
+            "sentences": [{"source_text": text, **result} for (text, _sep), result in zip(sentences, results)],
+        }
+
+    def start_advice(self, digest: str) -> None:
+        """Fetch the cultural advice for `digest` on a background thread.
+
+        Its `stream_advice` events are put on `advice_events`, then None.
+        """
+        if self._advice_started:
+            return
+        self._advice_started = True
+
+        def _produce() -> None:
+            try:
+                for event in stream_advice(
+                    digest, self.request["source_lang"], self.request["target_lang"], self.request["scenario"],
+                    self.request["tone"], token_name=self.request["token_name"], use_cache=self.request["use_cache"],
+                ):
+                    self.advice_events.put(event)
+            finally:
+                self.advice_events.put(None)
+
+        threading.Thread(target=_produce, name="document-advice", daemon=True).start()
+
+    def iter_advice(self) -> Iterator[Dict]:
+        """The advice events (after `start_advice`), ending with its "done" event."""
+        if not self._advice_started:
+            return
+        while True:
+            event = self.advice_events.get()
+            if event is None:
+                return
+            yield event
+
+    def run(self, source: Union[str, Iterable[str]], advice: bool = True) -> Iterator[Dict]:
+        """Yield one record per chunk, in document order: {"index", "source_text",
+        "separator", "literal_translation", "natural_translation", "ok",
+        "reused", "sentences"}, where `sentences` holds the per-sentence
+        results and `reused` counts those taken from `known`.
+
+        `source` is a string or an iterable of lines (e.g. an open file).
+        With `advice`, the advice request starts once the opening
+        `advice_chars` characters have been read (see `iter_advice`).
+        """
+        digest: List[str] = []
+        digest_size = 0
+
+        def _chunks() -> Iterator[Dict]:
+            nonlocal digest_size
+            segments = iter_segments(source, self.request["source_lang"])
+            for chunk in iter_chunks(segments, self.chunk_chars, self.context_chars):
+                if advice and not self._advice_started:
+                    digest.append(chunk["text"] + self.output_separator(chunk["separator"]))
+                    digest_size += len(digest[-1])
+                    if digest_size >= self.advice_chars:
+                        self.start_advice("".join(digest)[: self.advice_chars])
+                yield chunk
+            if advice and digest:
+                self.start_advice("".join(digest).strip())
+
+        window: deque = deque()
+        with ThreadPoolExecutor(max_workers=self.concurrency, thread_name_prefix="document") as pool:
+            for chunk in _chunks():
+                window.append(pool.submit(self._translate, chunk))
+                if len(window) >= self.concurrency * 2:
+                    yield window.popleft().result()
+            while window:
+                yield window.popleft().result()
+
+
+def stream_document_events(
+    translator: DocumentTranslator,
+    source: Union[str, Iterable[str]],
+    advice: Union[bool, str] = True,
+) -> Iterator[Dict]:
+    """Run `translator` with the event protocol of `stream_translation_then_advice`.
+
+    Yields {"type": "chunk", ...} per translated chunk (the `run` record),
+    then {"type": "literal_translation", "text"} and {"type":
+    "natural_document", "text"} with the translations stitched so far; then
+    "translation_done", the advice's "advice_delta" events and {"type":
+    "done", "result", "chunks", "failed", "reused", "advice_ok"}.
+
+    The result is a document result, not a list of alternative expressions:
+    {"document": True, "literal_translation": str, "natural_translation":
+    str, "advice": str}. `advice` is True to request the advice, False to
+    skip it, or the advice text to use as is. Never raises.
+    """
+    literal: List[str] = []
+    natural: List[str] = []
+    chunks = failed = reused = 0
+    try:
+        for record in translator.run(source, advice=advice is True):
+            chunks += 1
+            failed += 0 if record["ok"] else 1
+            reused += record["reused"]
+            literal.append(record["literal_translation"] + record["separator"])
+            natural.append(record["natural_translation"] + record["separator"])
+            yield {"type": "chunk", **record}
+            yield {"type": "literal_translation", "text": "".join(literal)}
+            yield {"type": "natural_document", "text": "".join(natural)}
+    except Exception as exc:
+        failed += 1
+        literal.append(f"[Error] Document translation stopped: {exc}")
+    translation = {
+        "document": True,
+        "literal_translation": "".join(literal),
+        "natural_translation": "".join(natural),
+        "advice": "",
+    }
+    yield {"type": "translation_done", "result": translation}
+
+    advice_text, advice_ok = "", False
+    if isinstance(advice, str):
+        advice_text, advice_ok = advice, True
+        yield {"type": "advice_delta", "text": advice}
+    for event in translator.iter_advice():
+        if event.get("type") == "advice_delta":
+            yield event
+        elif event.get("type") == "done":
+            advice_text, advice_ok = event["result"].get("advice", ""), event.get("ok", False)
+    yield {
+        "type": "done",
+        "result": {**translation, "advice": advice_text},
+        "chunks": chunks,
+        "failed": failed,
+        "reused": reused,
+        "advice_ok": advice_ok,
+    }
+
+
+def stream_document_translation(
+    source_text: str,
+    source_lang: str,
+    target_lang: str,
+    scenario: str,
+    tone: str = "neutral",
+    token_name: str = None,
+    use_cache: bool = True,
+    lazy_advice: bool = False,
+) -> Iterator[Dict]:
+    """Document mode with the event protocol of `stream_translation_then_advice`
+    (see `stream_document_events`). Never raises."""
+    translator = DocumentTranslator(source_lang, target_lang, scenario, tone, token_name, use_cache)
+    yield from stream_document_events(translator, source_text, advice=not lazy_advice)
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Translate a long document in parallel chunks.")
+    parser.add_argument("input", help="Input text file (UTF-8)")
+    parser.add_argument("-o", "--output", help="Output file (default: <input>.<target-lang>.md)")
+    parser.add_argument("--source-lang", default="zh")
+    parser.add_argument("--target-lang", default="en")
+    parser.add_argument("--scenario", default="general")
+    parser.add_argument("--tone", default="neutral")
+    parser.add_argument("--format", choices=("text", "jsonl"), default="text",
+                        help="text: natural translation + advice; jsonl: one record per chunk")
+    parser.add_argument("--literal", action="store_true", help="Write the literal instead of the natural translation")
+    parser.add_argument("--no-advice", action="store_true", help="Skip the cultural advice section")
+    parser.add_argument("--chunk-chars", type=int, default=DOCUMENT_SETTINGS["chunk_chars"])
+    parser.add_argument("--context-chars", type=int, default=DOCUMENT_SETTINGS["context_chars"])
+    parser.add_argument("--concurrency", type=int, default=DOCUMENT_SETTINGS["concurrency"])
+    parser.add_argument("--token-name", default=None, help="Token name from credentials.json")
+    parser.add_argument("--no-cache", action="store_true", help="Bypass the translation cache")
+    args = parser.parse_args(argv)
+
+    output = args.output or f"{os.path.splitext(args.input)[0]}.{args.target_lang}.{'jsonl' if args.format == 'jsonl' else 'md'}"
+    translator = DocumentTranslator(
+        args.source_lang, args.target_lang, args.scenario, args.tone,
+        token_name=args.token_name, use_cache=not args.no_cache,
+        chunk_chars=args.chunk_chars, context_chars=args.context_chars, concurrency=args.concurrency,
+    )
+    field = "literal_translation" if args.literal else "natural_translation"
+    chunks = failed = 0
+    with open(args.input, "r", encoding="utf-8-sig") as src, open(output, "w", encoding="utf-8") as out:
+        for record in translator.run(src, advice=not args.no_advice):
+            chunks += 1
+            failed += 0 if record["ok"] else 1
+            if args.format == "jsonl":
+                out.write(json.dumps(record, ensure_ascii=False) + "\n")
+            else:
+                out.write(record[field] + record["separator"])
+            out.flush()
+            print(f"\r{chunks} chunks translated", end="", file=sys.stderr)
+        advice = ""
+        for event in translator.iter_advice():
+            if event.get("type") == "done":
+                advice = event["result"].get("advice", "")
+        if advice:
+            if args.format == "jsonl":
+                out.write(json.dumps({"advice": advice}, ensure_ascii=False) + "\n")
+            else:
+                out.write(f"\n\n---\n\n{advice}\n")
+    print(f"\nDone: {chunks} chunks ({failed} failed) -> {output}", file=sys.stderr)
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,129 @@
+"""
+Hedged Deepseek requests: cut the tail caused by one slow endpoint.
+
+When hedging is on and more than one token is configured in
+credentials.json, a request that has not answered within a percentile of
+recent call latencies gets a duplicate sent to a different token (and, if
+configured, a different api_url). The first usable answer wins and the
+other request is cancelled.
+
+- The hedge delay is the `DEEPSEEK_HEDGE_PERCENTILE` latency of recent
+  calls (never below DEEPSEEK_HEDGE_MIN_DELAY); until enough calls were
+  seen, DEEPSEEK_HEDGE_INITIAL_DELAY is used.
+- Extra requests are capped by a budget: every request earns
+  DEEPSEEK_HEDGE_BUDGET hedge credits (default 0.1, i.e. at most ~10% extra
+  requests) and a hedge spends one.
+- `translator_hedges_total{outcome}` counts hedges that won, lost, or were
+  skipped for lack of budget; `stats()` reports the win rate.
+
+Settings (environment variables or `configure_hedging(...)`):
+- TRANSLATION_HEDGING            "1" to enable (default off)
+- DEEPSEEK_HEDGE_PERCENTILE      latency percentile that triggers a hedge (default 0.95)
+- DEEPSEEK_HEDGE_MIN_DELAY       seconds (default 0.2)
+- DEEPSEEK_HEDGE_INITIAL_DELAY   seconds, before enough samples (default 2.0)
+- DEEPSEEK_HEDGE_BUDGET          hedge credits earned per request (default 0.1)
+"""
+
+from collections import deque
+from typing import Dict, Optional
+import os
+import threading
+
+from metrics import incr
+
+
+HEDGE_SETTINGS = {
+    "enabled": os.environ.get("TRANSLATION_HEDGING") == "1",
+    "percentile": float(os.environ.get("DEEPSEEK_HEDGE_PERCENTILE", "0.95")),
+    "min_delay": float(os.environ.get("DEEPSEEK_HEDGE_MIN_DELAY", "0.2")),
+    "initial_delay": float(os.environ.get("DEEPSEEK_HEDGE_INITIAL_DELAY", "2.0")),
+    "budget": float(os.environ.get("DEEPSEEK_HEDGE_BUDGET", "0.1")),
+}
+
+# latencies kept for the percentile, and how many are needed before trusting it
+WINDOW = 200
+MIN_SAMPLES = 20
+# unused credits saved up for bursts of slow requests
+MAX_CREDITS = 10.0
+
+
+def configure_hedging(**settings) -> None:
+    """Override hedging settings at runtime."""
+    for key, value in settings.items():
+        if key not in HEDGE_SETTINGS:
+            raise KeyError(f"Unknown hedging setting: {key}")
+        HEDGE_SETTINGS[key] = value
+
+
+def enabled() -> bool:
+    return bool(HEDGE_SETTINGS["enabled"])
+
+
+class HedgePolicy:
+    """Hedge delay from recent latencies, a credit budget and outcome counts."""
+
+    def __init__(self):
+        self._latencies: deque = deque(maxlen=WINDOW)
+        self._credits = 1.0
+        self._lock = threading.Lock()
+        self.requests = 0
+        self.hedged = 0
+        self.won = 0
+        self.skipped = 0
+
+    def delay(self) -> float:
+        """Seconds to wait for the first request before hedging."""
+        with self._lock:
+            samples = sorted(self._latencies)
+        if len(samples) < MIN_SAMPLES:
+            return max(HEDGE_SETTINGS["min_delay"], HEDGE_SETTINGS["initial_delay"])
+        idx = min(len(samples) - 1, int(HEDGE_SETTINGS["percentile"] * len(samples)))
+        return max(HEDGE_SETTINGS["min_delay"], samples[idx])
+
+    def record_latency(self, seconds: float) -> None:
+        with self._lock:
+            self._latencies.append(seconds)
+
+    def start_request(self) -> None:
+        with self._lock:
+            self.requests += 1
+            self._credits = min(MAX_CREDITS, self._credits + HEDGE_SETTINGS["budget"])
+
+    def try_hedge(self) -> bool:
+        """Spend one credit on a hedge; False (and counted) when the budget is used up."""
+        with self._lock:
+            if self._credits < 1.0:
+                self.skipped += 1
+                allowed = False
+            else:
+                self._credits -= 1.0
+                self.hedged += 1
+                allowed = True
+        if not allowed:
+            incr("translator_hedges_total", outcome="skipped_budget")
+        return allowed
+
+    def record_outcome(self, hedge_won: bool) -> None:
+        with self._lock:
+            if hedge_won:
+                self.won += 1
+        incr("translator_hedges_total", outcome="won" if hedge_won else "lost")
+
+    def stats(self) -> Dict[str, Optional[float]]:
+        with self._lock:
+            return {
+                "requests": self.requests,
+                "hedged": self.hedged,
+                "hedge_rate": (self.hedged / self.requests) if self.requests else 0.0,
+                "won": self.won,
+                "win_rate": (self.won / self.hedged) if self.hedged else None,
+                "skipped_budget": self.skipped,
+                "credits": self._credits,
+            }
+
+
+_default_policy = HedgePolicy()
+
+
+def get_hedge_policy() -> HedgePolicy:
+    return _default_policy
@@ -0,0 +1,160 @@
+"""
+Incremental re-translation: after an edit, only changed sentences go upstream.
+
+Fixing one word in a long text used to re-send the whole text. An
+`IncrementalTranslator` is a per-UI session that keeps the sentences and
+per-sentence translations of the last input it translated:
+
+- the new input is segmented like document mode (`iter_chunks`) and diffed
+  against the previous one at sentence granularity (`difflib`)
+- sentences whose text is unchanged reuse their previous translation (even
+  if they moved); only the edited and new ones are sent, packed per chunk
+  with their preceding context (`DocumentTranslator(known=...)`)
+- the cultural advice is kept while the texts are at least `advice_reuse`
+  similar, and requested again otherwise
+- the UI gets the usual event stream with the merged translation, plus an
+  {"type": "incremental", "sentences", "reused", "changed", "similarity"}
+  event up front
+
+Long inputs (document mode anyway) always go through the session. A shorter
+input of at least `min_sentences` sentences only does when it shares
+sentences with the last input the session translated; a first-time
+multi-sentence input keeps the single-request path with its alternative
+expressions and explanations.
+
+Only the latest input is remembered, and a change of languages, scenario or
+tone starts over. Sentences that failed are not remembered, so they are
+retried on the next run. An unchanged sentence keeps its translation even
+when its neighbours changed.
+
+Settings (environment variables or `configure_incremental(...)`):
+- TRANSLATION_INCREMENTAL_MIN_SENTENCES  shorter edits (not in document mode) are translated as usual (default 4)
+- TRANSLATION_INCREMENTAL_ADVICE_REUSE   sentence similarity above which the advice is kept (default 0.8)
+- TRANSLATION_INCREMENTAL_DISABLED=1     turns it off
+"""
+
+from difflib import SequenceMatcher
+from typing import Dict, Iterator, List, Optional, Tuple
+import os
+import threading
+
+from document_translate import (
+    DOCUMENT_SETTINGS,
+    DocumentTranslator,
+    is_long_document,
+    iter_chunks,
+    stream_document_events,
+)
+from metrics import incr
+from text_segmentation import iter_segments
+
+
+INCREMENTAL_SETTINGS = {
+    "min_sentences": int(os.environ.get("TRANSLATION_INCREMENTAL_MIN_SENTENCES", "4")),
+    "advice_reuse": float(os.environ.get("TRANSLATION_INCREMENTAL_ADVICE_REUSE", "0.8")),
+    "enabled": os.environ.get("TRANSLATION_INCREMENTAL_DISABLED") != "1",
+}
+
+
+def configure_incremental(**settings) -> None:
+    """Override incremental re-translation settings; takes effect for the next input."""
+    for key, value in settings.items():
+        if key not in INCREMENTAL_SETTINGS:
+            raise KeyError(f"Unknown incremental setting: {key}")
+        INCREMENTAL_SETTINGS[key] = value
+
+
+def sentence_list(text: str, lang: str) -> List[str]:
+    """The sentences of `text` as document mode cuts them (long ones split)."""
+    segments = iter_segments(text, lang)
+    chunks = iter_chunks(segments, DOCUMENT_SETTINGS["chunk_chars"], 0)
+    return [sentence for chunk in chunks for sentence, _sep in chunk["sentences"]]
+
+
+class IncrementalTranslator:
+    """Remembers the last translated input of one UI session."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._settings: Optional[Tuple[str, str, str, str]] = None
+        self._sentences: List[str] = []
+        # sentence -> {"literal_translation", "natural_translation", "ok"} of the last input
+        self._known: Dict[str, Dict] = {}
+        self._advice = ""
+
+    def applies(self, source_text: str, source_lang: str, target_lang: str, scenario: str, tone: str = "neutral") -> bool:
+        """Whether `source_text` should go through `stream` rather than a single request:
+        long documents, and edits of the last input with sentences to reuse."""
+        if not INCREMENTAL_SETTINGS["enabled"] or not source_text or not source_text.strip():
+            return False
+        if is_long_document(source_text):
+            return True
+        with self._lock:
+            if self._settings != (source_lang, target_lang, scenario, tone) or not self._known:
+                return False
+            known = set(self._known)
+        sentences = sentence_list(source_text, source_lang)
+        return len(sentences) >= INCREMENTAL_SETTINGS["min_sentences"] and any(s in known for s in sentences)
+
+    def reset(self) -> None:
+        with self._lock:
+            self._settings, self._sentences, self._known, self._advice = None, [], {}, ""
+
+    def stream(
+        self,
+        source_text: str,
+        source_lang: str,
+        target_lang: str,
+        scenario: str,
+        tone: str = "neutral",
+        token_name: str = None,
+        use_cache: bool = True,
+        lazy_advice: bool = False,
+    ) -> Iterator[Dict]:
+        """Translate `source_text`, reusing what the previous input already had.
+
+        Yields {"type": "incremental", ...} and then the events of
+        `stream_document_events`. Never raises.
+        """
+        settings = (source_lang, target_lang, scenario, tone)
+        sentences = sentence_list(source_text, source_lang)
+        with self._lock:
+            if settings != self._settings:
+                self._settings, self._sentences, self._known, self._advice = settings, [], {}, ""
+            known, previous, advice = dict(self._known), self._sentences, self._advice
+
+        similarity = SequenceMatcher(None, previous, sentences, autojunk=False).ratio() if previous else 0.0
+        reused = sum(1 for sentence in sentences if sentence in known)
+        incr("translator_incremental_sentences_total", reused, outcome="reused")
+        incr("translator_incremental_sentences_total", len(sentences) - reused, outcome="translated")
+        yield {
+            "type": "incremental",
+            "sentences": len(sentences),
+            "reused": reused,
+            "changed": len(sentences) - reused,
+            "similarity": similarity,
+        }
+
+        if advice and similarity >= INCREMENTAL_SETTINGS["advice_reuse"]:
+            advice_option = advice
+        else:
+            advice_option = not lazy_advice
+        translator = DocumentTranslator(
+            source_lang, target_lang, scenario, tone, token_name, use_cache, known=known,
+        )
+        results: Dict[str, Dict] = {}
+        for event in stream_document_events(translator, source_text, advice=advice_option):
+            if event["type"] == "chunk":
+                for item in event["sentences"]:
+                    if item["ok"]:
+                        results[item["source_text"]] = {
+                            "literal_translation": item["literal_translation"],
+                            "natural_translation": item["natural_translation"],
+                            "ok": True,
+                        }
+            elif event["type"] == "done":
+                with self._lock:
+                    if self._settings == settings:
+                        self._sentences, self._known = sentences, results
+                        self._advice = event["result"]["advice"] if event["advice_ok"] else ""
+            yield event
@@ -0,0 +1,194 @@
+"""
+Tolerant parsing of model JSON output.
+
+A completion that is not strictly valid JSON used to be thrown away and
+replaced by the `[Literal Example]` placeholder, although the user had paid
+for it and a retry doubles cost and latency. `loads_tolerant` tries the
+strict parser first and otherwise repairs the text in one pass:
+
+- prose or Markdown fences around the object are dropped
+- raw newlines / tabs / control characters inside strings are escaped
+- trailing commas before "}" or "]" are removed, mismatched closers fixed
+- truncated output (e.g. the max_tokens cap was hit) is cut back to the last
+  complete value and the open brackets are closed; a string cut short is
+  kept only for the top-level keys in `partial_keys` (e.g. the long
+  cultural advice), everything else that is incomplete is dropped,
+  including an array item object that was cut off (e.g. a natural
+  expression missing its explanation), so no item comes back with keys
+  missing
+
+Outcomes ("ok", "repaired", "truncated", "failed") are counted per kind in
+`translator_json_parse_total{kind,outcome}` and by `parse_stats()`, which
+reports the repair rate.
+"""
+
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+import json
+import re
+import threading
+
+from metrics import incr
+
+
+OUTCOMES = ("ok", "repaired", "truncated", "failed")
+
+_CLOSERS = {"{": "}", "[": "]"}
+_CONTROL_ESCAPES = {"\n": "\\n", "\r": "\\r", "\t": "\\t", "\b": "\\b", "\f": "\\f"}
+# an escape sequence cut off at the end of the text
+_DANGLING_ESCAPE_RE = re.compile(r"\\(u[0-9a-fA-F]{0,3})?$")
+
+
+def _strip_fences(text: str) -> str:
+    text = text.strip()
+    if text.startswith("```json"):
+        text = text[7:]
+    if text.startswith("```"):
+        text = text[3:]
+    if text.endswith("```"):
+        text = text[:-3]
+    return text.strip()
+
+
+def _strip_trailing(out: List[str], chars: str) -> bool:
+    """Drop trailing whitespace and any of `chars` from the output; True if a char in `chars` went."""
+    removed = False
+    while out and (out[-1].isspace() or out[-1] in chars):
+        removed = removed or out[-1] in chars
+        out.pop()
+    return removed
+
+
+def repair(text: str, partial_keys: Iterable[str] = ()) -> Optional[Tuple[str, bool]]:
+    """Rewrite `text` into (JSON text, truncated), or None if it holds no object / array.
+
+    One pass over the characters; nothing after the top-level value is read.
+    """
+    starts = [i for i in (text.find("{"), text.find("[")) if i >= 0]
+    if not starts:
+        return None
+    out: List[str] = []
+    stack: List[str] = []
+    # output position where each open container starts
+    opened: List[int] = []
+    in_string = escape = False
+    # end of the last complete value (before a "," or after a closer) and the stack there
+    safe, safe_stack, safe_opened = 0, [], []
+    # top-level key whose value is being read
+    expect_key, key_start, key = False, -1, None
+
+    for ch in text[min(starts):]:
+        if in_string:
+            if escape:
+                escape = False
+                out.append(ch)
+            elif ch == "\\":
+                escape = True
+                out.append(ch)
+            elif ch == '"':
+                in_string = False
+                out.append(ch)
+                if len(stack) == 1 and expect_key and key_start >= 0:
+                    try:
+                        key = json.loads("".join(out[key_start:]))
+                    except ValueError:
+                        key = None
+            elif ch < " ":
+                out.append(_CONTROL_ESCAPES.get(ch, "\\u%04x" % ord(ch)))
+            else:
+                out.append(ch)
+            continue
+
+        if ch == '"':
+            in_string = True
+            key_start = len(out) if len(stack) == 1 and expect_key else -1
+        elif ch in "{[":
+            stack.append(ch)
+            opened.append(len(out))
+            if len(stack) == 1:
+                expect_key = ch == "{"
+        elif ch in "}]":
+            if not stack:
+                break
+            _strip_trailing(out, ",")
+            out.append(_CLOSERS[stack.pop()])
+            opened.pop()
+            if not stack:
+                return "".join(out), False
+            safe, safe_stack, safe_opened = len(out), list(stack), list(opened)
+            continue
+        elif ch == ",":
+            safe, safe_stack, safe_opened = len(out), list(stack), list(opened)
+            if len(stack) == 1:
+                expect_key, key = stack[0] == "{", None
+        elif ch == ":" and len(stack) == 1:
+            expect_key = False
+        out.append(ch)
+
+    # truncated: the input ended inside the top-level value
+    if in_string and len(stack) == 1 and not expect_key and key in set(partial_keys):
+        partial = _DANGLING_ESCAPE_RE.sub("", "".join(out))
+        out = [partial, '"']
+    else:
+        del out[safe:]
+        stack, opened = safe_stack, safe_opened
+        # an array item object cut off is incomplete as a whole: drop it
+        cut = next((depth for depth in range(1, len(stack)) if stack[depth - 1:depth + 1] == ["[", "{"]), None)
+        if cut is not None:
+            del out[opened[cut]:]
+            stack = stack[:cut]
+        _strip_trailing(out, ",")
+        if not stack:
+            return None
+    out.extend(_CLOSERS[opener] for opener in reversed(stack))
+    return "".join(out), True
+
+
+class ParseStats:
+    """Counts of parse outcomes per kind of completion."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._counts: Dict[str, Dict[str, int]] = {}
+
+    def record(self, kind: str, outcome: str) -> None:
+        with self._lock:
+            counts = self._counts.setdefault(kind, dict.fromkeys(OUTCOMES, 0))
+            counts[outcome] += 1
+
+    def snapshot(self) -> Dict[str, Dict[str, float]]:
+        """Per kind: outcome counts plus `repair_rate`, the share of non-strict
+        completions that were salvaged."""
+        with self._lock:
+            stats = {}
+            for kind, counts in self._counts.items():
+                broken = counts["repaired"] + counts["truncated"] + counts["failed"]
+                stats[kind] = {
+                    **counts,
+                    "repair_rate": ((counts["repaired"] + counts["truncated"]) / broken) if broken else None,
+                }
+            return stats
+
+
+_parse_stats = ParseStats()
+
+
+def parse_stats() -> Dict[str, Dict[str, float]]:
+    return _parse_stats.snapshot()
+
+
+def loads_tolerant(text: str, kind: str = "translation", partial_keys: Iterable[str] = ()) -> Tuple[Any, str]:
+    """Parse model output, repairing it if needed. Returns (data or None, outcome)."""
+    data, outcome = None, "failed"
+    try:
+        data, outcome = json.loads(_strip_fences(text)), "ok"
+    except ValueError:
+        repaired = repair(text, partial_keys)
+        if repaired is not None:
+            try:
+                data = json.loads(repaired[0])
+                outcome = "truncated" if repaired[1] else "repaired"
+            except ValueError:
+                pass
+    _parse_stats.record(kind, outcome)
+    incr("translator_json_parse_total", kind=kind, outcome=outcome)
+    return data, outcome
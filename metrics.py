@@ -0,0 +1,423 @@
+"""
+Per-stage latency spans and counters for the translation pipeline.
+
+Disabled by default: `span()` then returns a shared no-op object and
+`incr()` returns immediately, so instrumented code pays about one attribute
+check per call. Enable with TRANSLATION_METRICS=1 or `configure(enabled=True)`.
+
+When enabled:
+- every `span(stage)` records its duration in the
+  `translator_stage_seconds{stage=...}` histogram;
+- `incr(name, **labels)` bumps a counter (fallback reasons, cache hits, ...);
+- `set_gauge(name, value, **labels)` records a current value (breaker states);
+- `render_prometheus()` returns everything in the Prometheus text format.
+
+Exports (any of these also enables metrics):
+- TRANSLATION_METRICS_FILE     Prometheus text file, rewritten every
+                               TRANSLATION_METRICS_INTERVAL seconds (default 15),
+                               e.g. for node_exporter's textfile collector
+- TRANSLATION_METRICS_PORT     serve /metrics over HTTP on this port
+- TRANSLATION_METRICS_HOST     address the /metrics server binds to (default 127.0.0.1,
+                               local only; e.g. 0.0.0.0 to let another host scrape it)
+- TRANSLATION_SPANS_FILE       finished spans as OpenTelemetry-style JSON lines
+- TRANSLATION_SPANS_ENDPOINT   POST spans as OTLP/HTTP JSON (e.g. http://localhost:4318/v1/traces)
+
+Exporting happens on a background thread; spans are dropped (and counted)
+rather than blocking a translation if the exporter falls behind.
+"""
+
+from typing import Dict, List, Optional, Tuple
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import contextvars
+import json
+import os
+import queue
+import random
+import threading
+import time
+import urllib.request
+
+from translation_logging import get_logger
+
+
+log = get_logger("translator.metrics")
+
+
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+_HELP = {
+    "translator_stage_seconds": "Time spent in each stage of a translation request.",
+    "translator_requests_total": "Translation requests by entry point.",
+    "translator_cache_total": "Translation cache and phrasebook lookups by result and kind.",
+    "translator_fallbacks_total": "Requests answered with a fallback result, by reason.",
+    "translator_spans_dropped_total": "Finished spans dropped because the exporter queue was full.",
+    "translator_retries_total": "Deepseek call retries, by error.",
+    "translator_circuit_state": "Circuit breaker state per endpoint (0 closed, 1 half-open, 2 open).",
+    "translator_circuit_transitions_total": "Circuit breaker state changes per endpoint.",
+    "translator_hedges_total": "Hedged (duplicate) Deepseek requests, by outcome.",
+    "translator_singleflight_total": "Upstream calls by single-flight role: leader (made the call) or coalesced (shared it).",
+    "translator_voice_utterances_total": "Utterances ended by the voice-activity detector, by outcome.",
+    "translator_voice_final_latency_seconds": "Time from the last voiced frame of an utterance to its final recognized text (end-of-speech silence included).",
+    "translator_voice_translation_seconds": "Time to translate one recognized utterance.",
+    "translator_completion_tokens_total": "Completion tokens reported in the usage of Deepseek answers.",
+    "translator_truncated_total": "Answers cut off at their max_tokens limit, by variant and whether the limit was learned.",
+    "translator_json_parse_total": "Model JSON answers by parse outcome (ok, repaired, truncated, failed).",
+    "translator_tts_playback_total": "TTS playbacks, by source (pre-synthesized WAV or live speech).",
+    "translator_document_chunks_total": "Document mode chunks translated, by outcome.",
+    "translator_incremental_sentences_total": "Incremental re-translation sentences, reused from the previous input or translated.",
+}
+
+_SERVICE_NAME = "translation-ai"
+
+_settings = {
+    "enabled": False,
+    "metrics_file": os.environ.get("TRANSLATION_METRICS_FILE") or None,
+    "metrics_interval": float(os.environ.get("TRANSLATION_METRICS_INTERVAL", "15")),
+    "metrics_host": os.environ.get("TRANSLATION_METRICS_HOST") or "127.0.0.1",
+    "spans_file": os.environ.get("TRANSLATION_SPANS_FILE") or None,
+    "spans_endpoint": os.environ.get("TRANSLATION_SPANS_ENDPOINT") or None,
+}
+_settings["enabled"] = os.environ.get("TRANSLATION_METRICS") == "1" or any(
+    _settings[k] for k in ("metrics_file", "spans_file", "spans_endpoint")
+) or bool(os.environ.get("TRANSLATION_METRICS_PORT"))
+
+_lock = threading.Lock()
+# (name, sorted label items) -> value
+_counters: Dict[Tuple[str, Tuple], float] = {}
+# (name, sorted label items) -> value
+_gauges: Dict[Tuple[str, Tuple], float] = {}
+# (name, sorted label items) -> [bucket counts..., sum, count]
+_histograms: Dict[Tuple[str, Tuple], List[float]] = {}
+
+_current_span: contextvars.ContextVar = contextvars.ContextVar("translator_span", default=None)
+_span_queue: "queue.Queue[Dict]" = queue.Queue(maxsize=10000)
+_exporter: Optional[threading.Thread] = None
+_exporter_lock = threading.Lock()
+
+
+def enabled() -> bool:
+    return _settings["enabled"]
+
+
+def configure(
+    enabled: Optional[bool] = None,
+    metrics_file: Optional[str] = None,
+    metrics_interval: Optional[float] = None,
+    spans_file: Optional[str] = None,
+    spans_endpoint: Optional[str] = None,
+) -> None:
+    """Change settings at runtime (e.g. from a CLI flag); None leaves a value unchanged."""
+    for key, value in (
+        ("metrics_file", metrics_file),
+        ("metrics_interval", metrics_interval),
+        ("spans_file", spans_file),
+        ("spans_endpoint", spans_endpoint),
+        ("enabled", enabled),
+    ):
+        if value is not None:
+            _settings[key] = value
+    if _settings["enabled"]:
+        _ensure_exporter()
+
+
+def _label_key(labels: Dict) -> Tuple:
+    return tuple(sorted((k, str(v)) for k, v in labels.items()))
+
+
+def incr(name: str, amount: float = 1, **labels) -> None:
+    if not _settings["enabled"]:
+        return
+    key = (name, _label_key(labels))
+    with _lock:
+        _counters[key] = _counters.get(key, 0) + amount
+
+
+def set_gauge(name: str, value: float, **labels) -> None:
+    if not _settings["enabled"]:
+        return
+    key = (name, _label_key(labels))
+    with _lock:
+        _gauges[key] = value
+
+
+def observe(name: str, seconds: float, **labels) -> None:
+    if not _settings["enabled"]:
+        return
+    key = (name, _label_key(labels))
+    with _lock:
+        hist = _histograms.get(key)
+        if hist is None:
+            hist = _histograms[key] = [0] * (len(BUCKETS) + 2)
+        for i, bound in enumerate(BUCKETS):
+            if seconds <= bound:
+                hist[i] += 1
+                break
+        hist[-2] += seconds
+        hist[-1] += 1
+
+
+class _NoopSpan:
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        return False
+
+    def set(self, key: str, value) -> None:
+        pass
+
+
+_NOOP = _NoopSpan()
+
+
+class Span:
+    """A timed stage; nested spans share the trace of the enclosing one."""
+
+    __slots__ = ("name", "attributes", "trace_id", "span_id", "parent_id", "start_ns", "started", "_token")
+
+    def __init__(self, name: str, attributes: Dict):
+        self.name = name
+        self.attributes = attributes
+        parent = _current_span.get()
+        self.trace_id = parent.trace_id if parent is not None else f"{random.getrandbits(128):032x}"
+        self.parent_id = parent.span_id if parent is not None else None
+        self.span_id = f"{random.getrandbits(64):016x}"
+        self._token = None
+
+    def set(self, key: str, value) -> None:
+        self.attributes[key] = value
+
+    def __enter__(self):
+        self._token = _current_span.set(self)
+        self.start_ns = time.time_ns()
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        elapsed = time.perf_counter() - self.started
+        try:
+            _current_span.reset(self._token)
+        except ValueError:
+            # exited from another context (e.g. a generator resumed elsewhere)
+            pass
+        observe("translator_stage_seconds", elapsed, stage=self.name)
+        if _settings["spans_file"] or _settings["spans_endpoint"]:
+            self._export(elapsed, exc)
+        return False
+
+    def _export(self, elapsed: float, exc: Optional[BaseException]) -> None:
+        record = {
+            "traceId": self.trace_id,
+            "spanId": self.span_id,
+            "name": self.name,
+            "kind": 1,  # SPAN_KIND_INTERNAL
+            "startTimeUnixNano": str(self.start_ns),
+            "endTimeUnixNano": str(self.start_ns + int(elapsed * 1e9)),
+            "attributes": [_otlp_attribute(k, v) for k, v in self.attributes.items()],
+            "status": {"code": 2, "message": str(exc)} if exc is not None else {"code": 1},
+        }
+        if self.parent_id:
+            record["parentSpanId"] = self.parent_id
+        try:
+            _span_queue.put_nowait(record)
+        except queue.Full:
+            incr("translator_spans_dropped_total")
+
+
+def span(name: str, **attributes):
+    """Context manager timing one stage: `with span("request", model="deepseek-chat"): ...`."""
+    if not _settings["enabled"]:
+        return _NOOP
+    return Span(name, attributes)
+
+
+def _otlp_attribute(key: str, value) -> Dict:
+    if isinstance(value, bool):
+        return {"key": key, "value": {"boolValue": value}}
+    if isinstance(value, int):
+        return {"key": key, "value": {"intValue": str(value)}}
+    if isinstance(value, float):
+        return {"key": key, "value": {"doubleValue": value}}
+    return {"key": key, "value": {"stringValue": str(value)}}
+
+
+def _format_labels(labels: Tuple, extra: Tuple = ()) -> str:
+    items = list(labels) + list(extra)
+    if not items:
+        return ""
+    escaped = (str(v).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n") for _k, v in items)
+    return "{" + ",".join(f'{k}="{v}"' for (k, _v), v in zip(items, escaped)) + "}"
+
+
+def render_prometheus() -> str:
+    """All counters, gauges and histograms in the Prometheus text exposition format."""
+    with _lock:
+        counters = sorted(_counters.items())
+        gauges = sorted(_gauges.items())
+        histograms = sorted((key, list(values)) for key, values in _histograms.items())
+    lines: List[str] = []
+    seen = set()
+    for kind, series in (("counter", counters), ("gauge", gauges)):
+        for (name, labels), value in series:
+            if name not in seen:
+                seen.add(name)
+                lines.append(f"# HELP {name} {_HELP.get(name, name)}")
+                lines.append(f"# TYPE {name} {kind}")
+            lines.append(f"{name}{_format_labels(labels)} {value:g}")
+    for (name, labels), values in histograms:
+        if name not in seen:
+            seen.add(name)
+            lines.append(f"# HELP {name} {_HELP.get(name, name)}")
+            lines.append(f"# TYPE {name} histogram")
+        cumulative = 0
+        for bound, count in zip(BUCKETS, values):
+            cumulative += count
+            lines.append(f"{name}_bucket{_format_labels(labels, (('le', f'{bound:g}'),))} {cumulative:g}")
+        lines.append(f"{name}_bucket{_format_labels(labels, (('le', '+Inf'),))} {values[-1]:g}")
+        lines.append(f"{name}_sum{_format_labels(labels)} {values[-2]:.6f}")
+        lines.append(f"{name}_count{_format_labels(labels)} {values[-1]:g}")
+    return "\n".join(lines) + "\n"
+
+
+def snapshot() -> Dict[str, Dict]:
+    """Counters, gauges and per-stage latency summaries as plain dicts (for UIs and benchmarks)."""
+    with _lock:
+        counters = {
+            name + _format_labels(labels): value for (name, labels), value in _counters.items()
+        }
+        gauges = {
+            name + _format_labels(labels): value for (name, labels), value in _gauges.items()
+        }
+        stages = {
+            dict(labels).get("stage", name): {
+                "count": int(values[-1]),
+                "avg_ms": (values[-2] / values[-1] * 1000) if values[-1] else 0.0,
+            }
+            for (name, labels), values in _histograms.items()
+            if name == "translator_stage_seconds"
+        }
+    return {"counters": counters, "gauges": gauges, "stages": stages}
+
+
+def reset() -> None:
+    with _lock:
+        _counters.clear()
+        _gauges.clear()
+        _histograms.clear()
+
+
+def write_prometheus(path: Optional[str] = None) -> None:
+    """Atomically write the Prometheus text to `path` (default TRANSLATION_METRICS_FILE)."""
+    path = path or _settings["metrics_file"]
+    if not path:
+        return
+    tmp = f"{path}.tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        f.write(render_prometheus())
+    os.replace(tmp, path)
+
+
+def _post_spans(endpoint: str, spans: List[Dict]) -> None:
+    payload = {"resourceSpans": [{
+        "resource": {"attributes": [_otlp_attribute("service.name", _SERVICE_NAME)]},
+        "scopeSpans": [{"scope": {"name": "translator_core_new"}, "spans": spans}],
+    }]}
+    request = urllib.request.Request(
+        endpoint, data=json.dumps(payload).encode("utf-8"), headers={"Content-Type": "application/json"}
+    )
+    urllib.request.urlopen(request, timeout=5).close()
+
+
+def flush() -> None:
+    """Export queued spans now (also called periodically by the exporter thread)."""
+    spans: List[Dict] = []
+    while True:
+        try:
+            spans.append(_span_queue.get_nowait())
+        except queue.Empty:
+            break
+    if not spans:
+        return
+    if _settings["spans_file"]:
+        try:
+            with open(_settings["spans_file"], "a", encoding="utf-8") as f:
+                f.writelines(json.dumps(s, ensure_ascii=False) + "\n" for s in spans)
+        except OSError as e:
+            log.warning("Span export to file failed: %s", e)
+    if _settings["spans_endpoint"]:
+        try:
+            _post_spans(_settings["spans_endpoint"], spans)
+        except Exception as e:
+            log.warning("Span export to %s failed: %s", _settings["spans_endpoint"], e)
+
+
+def _export_loop() -> None:
+    last_metrics = 0.0
+    while True:
+        time.sleep(1.0)
+        try:
+            flush()
+            if _settings["metrics_file"] and time.time() - last_metrics >= _settings["metrics_interval"]:
+                write_prometheus()
+                last_metrics = time.time()
+        except Exception as e:
+            log.warning("Metrics export failed: %s", e)
+
+
+def _ensure_exporter() -> None:
+    global _exporter
+    if not (_settings["metrics_file"] or _settings["spans_file"] or _settings["spans_endpoint"]):
+        return
+    with _exporter_lock:
+        if _exporter is None:
+            _exporter = threading.Thread(target=_export_loop, name="metrics-exporter", daemon=True)
+            _exporter.start()
+
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    def log_message(self, format, *args):
+        pass
+
+    def do_GET(self):
+        if self.path.split("?", 1)[0] != "/metrics":
+            self.send_error(404)
+            return
+        body = render_prometheus().encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+
+_http_server: Optional[ThreadingHTTPServer] = None
+
+
+def start_http_server(port: int, host: Optional[str] = None) -> bool:
+    """Serve /metrics on `port` from a daemon thread. Returns False if the port is taken.
+
+    `host` defaults to TRANSLATION_METRICS_HOST (127.0.0.1): the counters carry
+    token names, so they are not exposed to the network unless asked for.
+    """
+    host = host or _settings["metrics_host"]
+    global _http_server
+    with _exporter_lock:
+        if _http_server is not None:
+            return True
+        try:
+            _http_server = ThreadingHTTPServer((host, port), _MetricsHandler)
+        except OSError as e:
+            log.warning("Metrics endpoint not started on port %d: %s", port, e)
+            return False
+        _http_server.daemon_threads = True
+    _settings["enabled"] = True
+    threading.Thread(target=_http_server.serve_forever, name="metrics-http", daemon=True).start()
+    return True
+
+
+if _settings["enabled"]:
+    _ensure_exporter()
+if os.environ.get("TRANSLATION_METRICS_PORT"):
+    start_http_server(int(os.environ["TRANSLATION_METRICS_PORT"]))
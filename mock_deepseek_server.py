@@ -0,0 +1,389 @@
+"""
+Local stand-in for the Deepseek chat-completions API, for offline benchmarks.
+
+Speaks enough of the OpenAI protocol for the translation pipeline:
+`POST /chat/completions` (also `/v1/...`) with `response_format`
+json_object and `stream=True` (server-sent events), and `GET /models` for
+the client warm-up. Answers are well-formed translation JSON shaped like the
+real model's output, including packed batch requests, document passages
+and advice-only requests; `max_tokens` cuts the answer off (finish_reason
+"length").
+
+Behavior is configured with `MockConfig`:
+- latency distribution ("fixed", "uniform" or "lognormal") around
+  `latency_ms` with spread `jitter`; streams spend `ttft_ms` before the
+  first chunk and spread the rest over the chunks;
+- `error_rate` (HTTP 500), `throttle_rate` (HTTP 429 with Retry-After) and
+  `bad_json_rate` (truncated JSON answer);
+- payload size via `natural_count`, `advice_chars` and `chunk_chars`.
+
+Run standalone:  python mock_deepseek_server.py --port 8001 --latency-ms 300
+"""
+
+from typing import Dict, List, Optional
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import argparse
+import json
+import math
+import random
+import threading
+import time
+import uuid
+
+
+class MockConfig:
+    def __init__(
+        self,
+        latency: str = "lognormal",
+        latency_ms: float = 300.0,
+        jitter: float = 0.3,
+        ttft_ms: Optional[float] = None,
+        error_rate: float = 0.0,
+        throttle_rate: float = 0.0,
+        bad_json_rate: float = 0.0,
+        retry_after: float = 1.0,
+        natural_count: int = 2,
+        advice_chars: int = 600,
+        chunk_chars: int = 8,
+        seed: Optional[int] = None,
+    ):
+        if latency not in ("fixed", "uniform", "lognormal"):
+            raise ValueError(f"Unknown latency distribution: {latency}")
+        self.latency = latency
+        self.latency_ms = latency_ms
+        self.jitter = jitter
+        self.ttft_ms = latency_ms * 0.2 if ttft_ms is None else ttft_ms
+        self.error_rate = error_rate
+        self.throttle_rate = throttle_rate
+        self.bad_json_rate = bad_json_rate
+        self.retry_after = retry_after
+        self.natural_count = natural_count
+        self.advice_chars = advice_chars
+        self.chunk_chars = max(1, chunk_chars)
+        self.rng = random.Random(seed)
+        self.rng_lock = threading.Lock()
+
+    def sample_latency(self) -> float:
+        """Seconds for one full response."""
+        with self.rng_lock:
+            if self.latency == "fixed":
+                ms = self.latency_ms
+            elif self.latency == "uniform":
+                ms = self.rng.uniform(self.latency_ms * (1 - self.jitter), self.latency_ms * (1 + self.jitter))
+            else:
+                # latency_ms is the median; jitter is sigma of the underlying normal
+                ms = self.latency_ms * math.exp(self.rng.gauss(0.0, self.jitter))
+        return max(0.0, ms) / 1000.0
+
+    def roll(self, rate: float) -> bool:
+        if rate <= 0:
+            return False
+        with self.rng_lock:
+            return self.rng.random() < rate
+
+
+class MockStats:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.requests = 0
+        self.streamed = 0
+        self.errors = 0
+        self.throttled = 0
+        self.bad_json = 0
+        self.truncated = 0
+
+    def bump(self, field: str) -> None:
+        with self._lock:
+            setattr(self, field, getattr(self, field) + 1)
+
+    def snapshot(self) -> Dict[str, int]:
+        with self._lock:
+            return {
+                "requests": self.requests,
+                "streamed": self.streamed,
+                "errors": self.errors,
+                "throttled": self.throttled,
+                "bad_json": self.bad_json,
+                "truncated": self.truncated,
+            }
+
+
+def _filler(chars: int) -> str:
+    sentence = "- **Mock advice**: keep the tone polite and mind local customs. "
+    return (sentence * (chars // len(sentence) + 1))[:chars]
+
+
+def _answer_for(messages: List[Dict], config: MockConfig) -> Dict:
+    """Build the JSON object the real model would return for these messages."""
+    system = next((m.get("content", "") for m in messages if m.get("role") == "system"), "")
+    user = next((m.get("content", "") for m in reversed(messages) if m.get("role") == "user"), "")
+    natural = [
+        {"text": f"Mock natural expression {i + 1}", "explanation": "Mock explanation of when to use it."}
+        for i in range(config.natural_count)
+    ]
+    if "Source Texts:\n" in user:
+        try:
+            items = json.loads(user.split("Source Texts:\n", 1)[1])
+        except ValueError:
+            items = []
+        return {"items": [
+            {
+                "id": item.get("id"),
+                "literal_translation": f"[mock] {item.get('text', '')}",
+                "natural_expressions": natural[:1],
+                "cultural_advice": _filler(min(config.advice_chars, 120)),
+            }
+            for item in items if isinstance(item, dict)
+        ]}
+    if "Passage Sentences:\n" in user:
+        # the sentences of one passage of a long document (document mode)
+        try:
+            items = json.loads(user.split("Passage Sentences:\n", 1)[1])
+        except ValueError:
+            items = []
+        return {"items": [
+            {
+                "id": item.get("id"),
+                "literal_translation": f"[mock] {item.get('text', '')}",
+                "natural_translation": f"Mock: {item.get('text', '')}",
+            }
+            for item in items if isinstance(item, dict)
+        ]}
+    if "literal_translation" not in system:
+        # advice-only request (second phase of a two-phase translation)
+        return {"cultural_advice": _filler(config.advice_chars)}
+    source = user.split("Source Text:", 1)[1].strip() if "Source Text:" in user else user
+    answer = {"literal_translation": f"[mock] {source}", "natural_expressions": natural}
+    if "cultural_advice" in system or "cultural_advice" in user:
+        answer["cultural_advice"] = _filler(config.advice_chars)
+    return answer
+
+
+def _estimate_tokens(text: str) -> int:
+    return len(text) // 3 + 1
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    server_version = "MockDeepseek/1.0"
+
+    def log_message(self, format, *args):  # keep benchmark output clean
+        pass
+
+    def _send_json(self, status: int, payload: Dict, headers: Optional[Dict[str, str]] = None) -> None:
+        body = json.dumps(payload, ensure_ascii=False).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        for key, value in (headers or {}).items():
+            self.send_header(key, value)
+        self.end_headers()
+        try:
+            self.wfile.write(body)
+        except (BrokenPipeError, ConnectionResetError):
+            pass  # client went away (cancelled / hedged request)
+
+    def _error(self, status: int, message: str, headers: Optional[Dict[str, str]] = None) -> None:
+        self._send_json(status, {"error": {"message": message, "type": "mock_error", "code": status}}, headers)
+
+    def do_GET(self):
+        if self.path.rstrip("/").endswith("/models"):
+            self._send_json(200, {"object": "list", "data": [{"id": "deepseek-chat", "object": "model", "owned_by": "mock"}]})
+        else:
+            self._error(404, f"Not found: {self.path}")
+
+    def do_POST(self):
+        config: MockConfig = self.server.config
+        stats: MockStats = self.server.stats
+        length = int(self.headers.get("Content-Length") or 0)
+        try:
+            request = json.loads(self.rfile.read(length) or b"{}")
+        except ValueError:
+            self._error(400, "Invalid JSON body")
+            return
+        if not self.path.rstrip("/").endswith("/chat/completions"):
+            self._error(404, f"Not found: {self.path}")
+            return
+        stats.bump("requests")
+
+        messages = request.get("messages") or []
+        json_mode = (request.get("response_format") or {}).get("type") == "json_object"
+        if json_mode and not any("json" in str(m.get("content", "")).lower() for m in messages):
+            # mirrors the real API's requirement for json_object mode
+            self._error(400, "Prompt must contain the word 'json' in some form to use 'response_format' of type 'json_object'.")
+            return
+        if config.roll(config.throttle_rate):
+            stats.bump("throttled")
+            self._error(429, "Rate limit reached (mock)", {"Retry-After": str(config.retry_after)})
+            return
+        if config.roll(config.error_rate):
+            stats.bump("errors")
+            time.sleep(config.sample_latency() * 0.1)
+            self._error(500, "Internal server error (mock)")
+            return
+
+        content = json.dumps(_answer_for(messages, config), ensure_ascii=False)
+        if config.roll(config.bad_json_rate):
+            stats.bump("bad_json")
+            content = content[: max(1, len(content) * 2 // 3)]
+        finish_reason = "stop"
+        max_tokens = request.get("max_tokens")
+        if isinstance(max_tokens, int) and _estimate_tokens(content) > max_tokens:
+            # completion cut off at the token limit, like the real API
+            stats.bump("truncated")
+            content = content[: max_tokens * 3]
+            finish_reason = "length"
+        model = request.get("model") or "deepseek-chat"
+        completion_id = f"chatcmpl-{uuid.uuid4().hex[:24]}"
+        usage = {
+            "prompt_tokens": sum(_estimate_tokens(str(m.get("content", ""))) for m in messages),
+            "completion_tokens": _estimate_tokens(content),
+        }
+        usage["total_tokens"] = usage["prompt_tokens"] + usage["completion_tokens"]
+
+        if request.get("stream"):
+            stats.bump("streamed")
+            include_usage = bool((request.get("stream_options") or {}).get("include_usage"))
+            self._stream(completion_id, model, content, config, finish_reason, usage if include_usage else None)
+            return
+
+        time.sleep(config.sample_latency())
+        self._send_json(200, {
+            "id": completion_id,
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": model,
+            "choices": [{"index": 0, "message": {"role": "assistant", "content": content}, "finish_reason": finish_reason}],
+            "usage": usage,
+        })
+
+    def _stream(self, completion_id: str, model: str, content: str, config: MockConfig, finish_reason: str = "stop",
+                usage: Optional[Dict] = None) -> None:
+        total = config.sample_latency()
+        ttft = min(total, config.ttft_ms / 1000.0)
+        pieces = [content[i:i + config.chunk_chars] for i in range(0, len(content), config.chunk_chars)]
+        gap = (total - ttft) / max(1, len(pieces))
+
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Cache-Control", "no-cache")
+        self.send_header("Connection", "close")
+        self.end_headers()
+        self.close_connection = True
+
+        def _event(delta: Dict, finish_reason: Optional[str] = None) -> None:
+            chunk = {
+                "id": completion_id,
+                "object": "chat.completion.chunk",
+                "created": int(time.time()),
+                "model": model,
+                "choices": [{"index": 0, "delta": delta, "finish_reason": finish_reason}],
+            }
+            self.wfile.write(f"data: {json.dumps(chunk, ensure_ascii=False)}\n\n".encode("utf-8"))
+            self.wfile.flush()
+
+        try:
+            time.sleep(ttft)
+            _event({"role": "assistant", "content": ""})
+            for piece in pieces:
+                _event({"content": piece})
+                if gap > 0:
+                    time.sleep(gap)
+            _event({}, finish_reason)
+            if usage is not None:
+                # stream_options.include_usage: a last chunk with no choices
+                chunk = {"id": completion_id, "object": "chat.completion.chunk", "created": int(time.time()),
+                         "model": model, "choices": [], "usage": usage}
+                self.wfile.write(f"data: {json.dumps(chunk)}\n\n".encode("utf-8"))
+            self.wfile.write(b"data: [DONE]\n\n")
+            self.wfile.flush()
+        except (BrokenPipeError, ConnectionResetError):
+            pass  # client went away (cancelled / superseded request)
+
+
+class MockDeepseekServer:
+    """Threaded mock server; usable as a context manager."""
+
+    def __init__(self, config: Optional[MockConfig] = None, host: str = "127.0.0.1", port: int = 0):
+        self.config = config or MockConfig()
+        self.stats = MockStats()
+        self._httpd = ThreadingHTTPServer((host, port), _Handler)
+        self._httpd.daemon_threads = True
+        self._httpd.config = self.config
+        self._httpd.stats = self.stats
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def url(self) -> str:
+        host, port = self._httpd.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self) -> "MockDeepseekServer":
+        self._thread = threading.Thread(target=self._httpd.serve_forever, name="mock-deepseek", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        self._httpd.shutdown()
+        self._httpd.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, exc_type, exc, tb):
+        self.stop()
+        return False
+
+
+def add_config_arguments(parser: argparse.ArgumentParser) -> None:
+    parser.add_argument("--latency", default="lognormal", choices=["fixed", "uniform", "lognormal"], help="Latency distribution")
+    parser.add_argument("--latency-ms", type=float, default=300.0, help="Median / mean response latency")
+    parser.add_argument("--jitter", type=float, default=0.3, help="Relative spread (sigma for lognormal)")
+    parser.add_argument("--ttft-ms", type=float, default=None, help="Time to first streamed chunk (default 20%% of latency)")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Fraction of requests answered with HTTP 500")
+    parser.add_argument("--throttle-rate", type=float, default=0.0, help="Fraction of requests answered with HTTP 429")
+    parser.add_argument("--bad-json-rate", type=float, default=0.0, help="Fraction of answers with truncated JSON")
+    parser.add_argument("--natural-count", type=int, default=2, help="Natural expressions per answer")
+    parser.add_argument("--advice-chars", type=int, default=600, help="Length of the cultural advice")
+    parser.add_argument("--chunk-chars", type=int, default=8, help="Characters per streamed chunk")
+    parser.add_argument("--seed", type=int, default=None)
+
+
+def config_from_args(args: argparse.Namespace) -> MockConfig:
+    return MockConfig(
+        latency=args.latency,
+        latency_ms=args.latency_ms,
+        jitter=args.jitter,
+        ttft_ms=args.ttft_ms,
+        error_rate=args.error_rate,
+        throttle_rate=args.throttle_rate,
+        bad_json_rate=args.bad_json_rate,
+        natural_count=args.natural_count,
+        advice_chars=args.advice_chars,
+        chunk_chars=args.chunk_chars,
+        seed=args.seed,
+    )
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Run a local mock of the Deepseek chat-completions API.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8001)
+    add_config_arguments(parser)
+    args = parser.parse_args(argv)
+
+    server = MockDeepseekServer(config_from_args(args), host=args.host, port=args.port)
+    print(f"Mock Deepseek API listening on {server.url}")
+    print(f"Use: DEEPSEEK_API_KEY=mock DEEPSEEK_API_URL={server.url}")
+    try:
+        server._httpd.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server._httpd.server_close()
+        print(json.dumps(server.stats.snapshot()))
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,183 @@
+"""
+Per-request model, max_tokens and temperature routing for Deepseek calls.
+
+Every request used to go to "deepseek-chat" with no output limit. A `Route`
+is now picked from:
+
+- input size: the source's estimated tokens select a size bucket; short
+  inputs can go to DEEPSEEK_MODEL_SHORT and long ones to DEEPSEEK_MODEL_LONG
+  (both default to DEEPSEEK_MODEL, "deepseek-chat")
+- requested fields (the prompt variant): the translation fields run at
+  DEEPSEEK_TEMPERATURE_TRANSLATION, cultural advice at
+  DEEPSEEK_TEMPERATURE_ADVICE
+- scenario: output lengths are learned per (variant, scenario, size bucket)
+
+max_tokens starts at the static ceiling of `prompt_templates.max_output_tokens`.
+After MIN_SAMPLES answers for a (variant, scenario, bucket), it becomes the
+learned DEEPSEEK_ROUTE_PERCENTILE of completion tokens (from the response's
+`usage`) times DEEPSEEK_ROUTE_HEADROOM, never above the ceiling. An answer
+cut off at the limit (finish_reason "length") is recorded as twice the limit,
+so the learned cap grows again when it was set too tight.
+
+Settings (environment variables or `configure_router(...)`):
+- DEEPSEEK_MODEL                     default model (default "deepseek-chat")
+- DEEPSEEK_MODEL_SHORT               model for inputs up to DEEPSEEK_SHORT_INPUT_TOKENS (default DEEPSEEK_MODEL)
+- DEEPSEEK_MODEL_LONG                model for inputs above DEEPSEEK_LONG_INPUT_TOKENS (default DEEPSEEK_MODEL)
+- DEEPSEEK_SHORT_INPUT_TOKENS        (default 16)
+- DEEPSEEK_LONG_INPUT_TOKENS         (default 256)
+- DEEPSEEK_TEMPERATURE_TRANSLATION   (default 1.0)
+- DEEPSEEK_TEMPERATURE_ADVICE        (default 1.3)
+- DEEPSEEK_ROUTE_PERCENTILE          learned output-length percentile (default 0.99)
+- DEEPSEEK_ROUTE_HEADROOM            multiplier on the learned length (default 1.5)
+- DEEPSEEK_ROUTE_LEARNING            "0" to keep the static ceilings
+"""
+
+from bisect import bisect_left
+from collections import deque
+from typing import Dict, Optional, Tuple
+import os
+import threading
+
+from metrics import incr
+from prompt_templates import estimate_tokens, max_output_tokens
+
+
+_DEFAULT_MODEL = os.environ.get("DEEPSEEK_MODEL", "deepseek-chat")
+
+ROUTER_SETTINGS = {
+    "model": _DEFAULT_MODEL,
+    "model_short": os.environ.get("DEEPSEEK_MODEL_SHORT", _DEFAULT_MODEL),
+    "model_long": os.environ.get("DEEPSEEK_MODEL_LONG", _DEFAULT_MODEL),
+    "short_input_tokens": int(os.environ.get("DEEPSEEK_SHORT_INPUT_TOKENS", "16")),
+    "long_input_tokens": int(os.environ.get("DEEPSEEK_LONG_INPUT_TOKENS", "256")),
+    "temperature_translation": float(os.environ.get("DEEPSEEK_TEMPERATURE_TRANSLATION", "1.0")),
+    "temperature_advice": float(os.environ.get("DEEPSEEK_TEMPERATURE_ADVICE", "1.3")),
+    "percentile": float(os.environ.get("DEEPSEEK_ROUTE_PERCENTILE", "0.99")),
+    "headroom": float(os.environ.get("DEEPSEEK_ROUTE_HEADROOM", "1.5")),
+    "learning": os.environ.get("DEEPSEEK_ROUTE_LEARNING", "1") != "0",
+}
+
+# upper bounds (estimated source tokens) of the size buckets; the last is open
+SIZE_BUCKETS = (16, 64, 256, 1024)
+# completion lengths kept per route key, and how many are needed before trusting them
+WINDOW = 200
+MIN_SAMPLES = 20
+# learned caps never go below this
+MIN_MAX_TOKENS = 64
+
+
+def configure_router(**settings) -> None:
+    """Override routing settings; takes effect for the next request."""
+    for key, value in settings.items():
+        if key not in ROUTER_SETTINGS:
+            raise KeyError(f"Unknown router setting: {key}")
+        ROUTER_SETTINGS[key] = value
+
+
+def size_bucket(input_tokens: int) -> str:
+    idx = bisect_left(SIZE_BUCKETS, input_tokens)
+    return f"le{SIZE_BUCKETS[idx]}" if idx < len(SIZE_BUCKETS) else f"gt{SIZE_BUCKETS[-1]}"
+
+
+class Route:
+    """Model, output cap and temperature for one request, plus its learning key."""
+
+    __slots__ = ("model", "max_tokens", "temperature", "key", "learned")
+
+    def __init__(self, model: str, max_tokens: Optional[int], temperature: Optional[float],
+                 key: Tuple[str, str, str], learned: bool = False):
+        self.model = model
+        self.max_tokens = max_tokens
+        self.temperature = temperature
+        self.key = key
+        self.learned = learned
+
+    def options(self) -> Dict:
+        """Keyword arguments for `chat.completions.create`."""
+        options = {"model": self.model}
+        if self.max_tokens:
+            options["max_tokens"] = self.max_tokens
+        if self.temperature is not None:
+            options["temperature"] = self.temperature
+        return options
+
+    def __repr__(self) -> str:
+        return f"Route({self.model!r}, max_tokens={self.max_tokens}, temperature={self.temperature}, key={self.key})"
+
+
+class ModelRouter:
+    """Routes requests and learns completion lengths per (variant, scenario, size bucket)."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._lengths: Dict[Tuple[str, str, str], deque] = {}
+        self.truncated = 0
+        self.recorded = 0
+
+    def route(self, variant: str, scenario: str = "general", s_text: str = "", items: int = 1) -> Route:
+        input_tokens = estimate_tokens(s_text)
+        key = (variant, scenario or "general", size_bucket(input_tokens))
+        if input_tokens <= ROUTER_SETTINGS["short_input_tokens"]:
+            model = ROUTER_SETTINGS["model_short"]
+        elif input_tokens > ROUTER_SETTINGS["long_input_tokens"]:
+            model = ROUTER_SETTINGS["model_long"]
+        else:
+            model = ROUTER_SETTINGS["model"]
+        temperature = ROUTER_SETTINGS["temperature_advice" if variant == "advice" else "temperature_translation"]
+
+        ceiling = max_output_tokens(variant, s_text, items)
+        learned = self.learned_length(key) if ROUTER_SETTINGS["learning"] and variant != "batch" else None
+        if learned is None:
+            return Route(model, ceiling, temperature, key)
+        cap = max(MIN_MAX_TOKENS, int(learned * ROUTER_SETTINGS["headroom"]))
+        return Route(model, min(ceiling, cap), temperature, key, learned=cap < ceiling)
+
+    def learned_length(self, key: Tuple[str, str, str]) -> Optional[int]:
+        """The learned completion-length percentile for a route key, or None before MIN_SAMPLES."""
+        with self._lock:
+            lengths = self._lengths.get(key)
+            if lengths is None or len(lengths) < MIN_SAMPLES:
+                return None
+            samples = sorted(lengths)
+        idx = min(len(samples) - 1, int(ROUTER_SETTINGS["percentile"] * len(samples)))
+        return samples[idx]
+
+    def record(self, route: Route, completion_tokens: Optional[int], finish_reason: Optional[str] = None) -> None:
+        """Feed back a finished answer (its `usage.completion_tokens` and finish_reason)."""
+        if not completion_tokens:
+            return
+        truncated = finish_reason == "length"
+        sample = completion_tokens
+        if truncated and route.max_tokens:
+            # the real length is unknown but above the cap
+            sample = max(completion_tokens, 2 * route.max_tokens)
+        with self._lock:
+            self.recorded += 1
+            if truncated:
+                self.truncated += 1
+            self._lengths.setdefault(route.key, deque(maxlen=WINDOW)).append(sample)
+        variant, scenario, _bucket = route.key
+        incr("translator_completion_tokens_total", completion_tokens, variant=variant, scenario=scenario)
+        if truncated:
+            incr("translator_truncated_total", variant=variant, learned=str(route.learned).lower())
+
+    def stats(self) -> Dict[str, object]:
+        with self._lock:
+            keys = {key: len(lengths) for key, lengths in self._lengths.items()}
+            truncated, recorded = self.truncated, self.recorded
+        return {
+            "recorded": recorded,
+            "truncated": truncated,
+            "truncation_rate": (truncated / recorded) if recorded else 0.0,
+            "routes": {
+                "/".join(key): {"samples": count, "learned_tokens": self.learned_length(key)}
+                for key, count in keys.items()
+            },
+        }
+
+
+_default_router = ModelRouter()
+
+
+def get_router() -> ModelRouter:
+    return _default_router
@@ -0,0 +1,373 @@
+"""
+Compiled phrasebooks: curated answers for stock phrases without a model call.
+
+Short tourism / dining phrases ("How much is this?", "トイレはどこですか")
+make up a large share of requests and always get the same answer. A
+phrasebook is a read-only file per (source_lang, target_lang, scenario),
+memory-mapped and consulted before the caches and the Deepseek call:
+
+- keys are `translation_memory.normalize(text)` (case, punctuation and
+  full-width forms folded) plus the tone; entries built without a tone
+  answer every tone
+- the index is an open-addressing hash table of 64-bit key hashes stored in
+  the file, so a lookup is one hash, a probe or two and a JSON decode of the
+  entry (a few microseconds) and the OS shares the pages between processes
+- a scenario's phrasebook is searched first, then the "general" one
+
+Phrasebooks are built offline from batch_translate.py output, curated CSV /
+JSONL files or the translation memory; later inputs win on duplicate keys:
+
+    python phrasebook.py build phrases.out.jsonl curated.csv -o phrasebooks
+    python phrasebook.py build translation_memory.sqlite3 --max-chars 24
+    python phrasebook.py lookup "How much is this?" --source-lang en --target-lang zh --scenario dining
+
+CSV / JSONL columns: source_text (or text), source_lang, target_lang,
+scenario, tone (optional), literal_translation, natural_translation (a JSON
+list, or texts separated by "|"), advice (optional). Rebuilt files are
+picked up after `reload_phrasebooks()` or a restart.
+
+Settings (environment variables or `configure_phrasebook(...)`):
+- TRANSLATION_PHRASEBOOK_DIR        directory of *.phrasebook files (default phrasebooks)
+- TRANSLATION_PHRASEBOOK_MAX_CHARS  longest normalized phrase looked up / compiled (default 64)
+- TRANSLATION_PHRASEBOOK_DISABLED=1 turns it off
+"""
+
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+import argparse
+import hashlib
+import json
+import mmap
+import os
+import re
+import sqlite3
+import struct
+import sys
+import threading
+
+from translation_logging import get_logger
+from translation_memory import normalize
+
+
+log = get_logger("translator.phrasebook")
+
+
+PHRASEBOOK_SETTINGS = {
+    "dir": os.environ.get("TRANSLATION_PHRASEBOOK_DIR", "phrasebooks"),
+    "max_chars": int(os.environ.get("TRANSLATION_PHRASEBOOK_MAX_CHARS", "64")),
+    "enabled": os.environ.get("TRANSLATION_PHRASEBOOK_DISABLED") != "1",
+}
+
+SUFFIX = ".phrasebook"
+MAGIC = b"PHRBOOK1"
+# magic, slot count (a power of two), entry count
+_HEADER = struct.Struct("<8sII")
+# key hash, record offset + 1 (0 marks an empty slot)
+_SLOT = struct.Struct("<QI")
+# key length, value length
+_RECORD = struct.Struct("<HI")
+# slots per entry, at least: keeps probe chains short
+_LOAD_FACTOR = 0.5
+# joins the normalized phrase and the tone in a key
+_TONE_SEP = "\x1f"
+
+_UNSAFE_NAME_RE = re.compile(r"[^\w\-]+")
+
+
+def configure_phrasebook(**settings) -> None:
+    """Override phrasebook settings; open phrasebooks are reloaded on next use."""
+    for key, value in settings.items():
+        if key not in PHRASEBOOK_SETTINGS:
+            raise KeyError(f"Unknown phrasebook setting: {key}")
+        PHRASEBOOK_SETTINGS[key] = value
+    reload_phrasebooks()
+
+
+def phrasebook_name(source_lang: str, target_lang: str, scenario: str) -> str:
+    """File name of the phrasebook for a language pair and scenario."""
+    parts = (source_lang, target_lang, scenario or "general")
+    return ".".join(_UNSAFE_NAME_RE.sub("_", p) for p in parts) + SUFFIX
+
+
+def _key(norm: str, tone: str = "") -> bytes:
+    return f"{norm}{_TONE_SEP}{tone}".encode("utf-8")
+
+
+def _hash(key: bytes) -> int:
+    return int.from_bytes(hashlib.blake2b(key, digest_size=8).digest(), "little")
+
+
+def _entry(result: Dict) -> Optional[Dict]:
+    """The stored part of a result, or None for placeholder / error output."""
+    literal = result.get("literal_translation")
+    if not isinstance(literal, str) or not literal.strip() or literal.startswith("["):
+        return None
+    natural = result.get("natural_translation") or []
+    if isinstance(natural, str):
+        try:
+            natural = json.loads(natural)
+        except ValueError:
+            natural = [t.strip() for t in natural.split("|") if t.strip()]
+    natural = [n if isinstance(n, dict) else {"text": str(n), "explanation": ""} for n in natural]
+    if not natural or str(natural[0].get("text", "")).startswith("["):
+        return None
+    advice = result.get("advice") or ""
+    if not isinstance(advice, str) or advice.startswith("["):
+        advice = ""
+    return {"literal_translation": literal, "natural_translation": natural, "advice": advice}
+
+
+class Phrasebook:
+    """One compiled phrasebook file, memory-mapped read-only."""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._file = open(path, "rb")
+        try:
+            self._mm = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+            magic, self._slots, self.size = _HEADER.unpack_from(self._mm, 0)
+            if magic != MAGIC or self._slots & (self._slots - 1):
+                raise ValueError(f"Not a phrasebook: {path}")
+        except Exception:
+            self.close()
+            raise
+        self._mask = self._slots - 1
+
+    def get(self, norm: str, tone: str = "") -> Optional[Dict]:
+        """The entry for a normalized phrase and tone, falling back to the tone-less entry."""
+        for key in (_key(norm, tone), _key(norm)) if tone else (_key(norm),):
+            value = self._find(key)
+            if value is not None:
+                return json.loads(value)
+        return None
+
+    def _find(self, key: bytes) -> Optional[bytes]:
+        mm = self._mm
+        h = _hash(key)
+        slot = h & self._mask
+        while True:
+            slot_hash, offset = _SLOT.unpack_from(mm, _HEADER.size + slot * _SLOT.size)
+            if not offset:
+                return None
+            if slot_hash == h:
+                start = offset - 1
+                key_len, value_len = _RECORD.unpack_from(mm, start)
+                start += _RECORD.size
+                if mm[start:start + key_len] == key:
+                    start += key_len
+                    return mm[start:start + value_len]
+            slot = (slot + 1) & self._mask
+
+    def items(self) -> Iterator[Tuple[str, str, Dict]]:
+        """(normalized phrase, tone, entry) for every entry, in file order."""
+        pos = _HEADER.size + self._slots * _SLOT.size
+        for _ in range(self.size):
+            key_len, value_len = _RECORD.unpack_from(self._mm, pos)
+            pos += _RECORD.size
+            norm, tone = self._mm[pos:pos + key_len].decode("utf-8").split(_TONE_SEP, 1)
+            pos += key_len
+            yield norm, tone, json.loads(self._mm[pos:pos + value_len])
+            pos += value_len
+
+    def close(self) -> None:
+        mm = getattr(self, "_mm", None)
+        if mm is not None:
+            mm.close()
+        self._file.close()
+
+
+def write_phrasebook(path: str, entries: Dict[Tuple[str, str], Dict]) -> int:
+    """Compile {(normalized phrase, tone): entry} into `path`; returns the entry count.
+
+    The file is written next to the target and renamed over it, so readers
+    never see a partial file.
+    """
+    slots = 1
+    while slots * _LOAD_FACTOR < max(1, len(entries)):
+        slots <<= 1
+    table = bytearray(slots * _SLOT.size)
+    records = bytearray()
+    base = _HEADER.size + len(table)
+    for (norm, tone), entry in entries.items():
+        key = _key(norm, tone)
+        value = json.dumps(entry, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+        h = _hash(key)
+        slot = h & (slots - 1)
+        while _SLOT.unpack_from(table, slot * _SLOT.size)[1]:
+            slot = (slot + 1) & (slots - 1)
+        _SLOT.pack_into(table, slot * _SLOT.size, h, base + len(records) + 1)
+        records += _RECORD.pack(len(key), len(value)) + key + value
+
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(_HEADER.pack(MAGIC, slots, len(entries)))
+        f.write(table)
+        f.write(records)
+    os.replace(tmp_path, path)
+    return len(entries)
+
+
+# -- sources -----------------------------------------------------------------
+
+# (source_lang, target_lang, scenario, tone, source_text, result)
+Row = Tuple[str, str, str, str, str, Dict]
+
+
+def rows_from_memory(path: str) -> Iterator[Row]:
+    """Segments of a translation memory database (see translation_memory.py)."""
+    conn = sqlite3.connect(f"file:{path}?mode=ro", uri=True)
+    try:
+        for scope, source_text, result in conn.execute("SELECT scope, source_text, result FROM segments ORDER BY id"):
+            parts = scope.split("|")
+            if len(parts) != 4:
+                continue
+            try:
+                data = json.loads(result)
+            except ValueError:
+                continue
+            yield parts[0], parts[1], parts[2], parts[3], source_text, data
+    finally:
+        conn.close()
+
+
+def rows_from_file(path: str, defaults: Dict[str, str]) -> Iterator[Row]:
+    """Records of a batch_translate.py output file or a curated CSV / JSONL file.
+
+    Rows without a tone column answer every tone.
+    """
+    # imported here: batch_translate imports the translation core, which imports this module
+    from batch_translate import read_rows
+
+    for row in read_rows(path):
+        yield (
+            row.get("source_lang") or defaults["source_lang"],
+            row.get("target_lang") or defaults["target_lang"],
+            row.get("scenario") or defaults["scenario"],
+            row.get("tone") or "",
+            row.get("text", ""),
+            row,
+        )
+
+
+def compile_rows(rows: Iterable[Row], out_dir: str, max_chars: Optional[int] = None) -> Dict[str, int]:
+    """Group rows per phrasebook and write them; returns {file name: entry count}.
+
+    Long phrases, empty text and placeholder results are skipped; a later row
+    replaces an earlier one with the same key.
+    """
+    max_chars = PHRASEBOOK_SETTINGS["max_chars"] if max_chars is None else max_chars
+    books: Dict[str, Dict[Tuple[str, str], Dict]] = {}
+    for source_lang, target_lang, scenario, tone, text, result in rows:
+        norm = normalize(text or "")
+        entry = _entry(result) if norm and len(norm) <= max_chars else None
+        if entry is None:
+            continue
+        books.setdefault(phrasebook_name(source_lang, target_lang, scenario), {})[(norm, tone)] = entry
+    return {name: write_phrasebook(os.path.join(out_dir, name), entries) for name, entries in books.items()}
+
+
+# -- lookup --------------------------------------------------------------------
+
+# file name -> open phrasebook, or None when there is no such file
+_open_books: Dict[str, Optional[Phrasebook]] = {}
+_open_books_lock = threading.Lock()
+
+
+def _book(name: str) -> Optional[Phrasebook]:
+    try:
+        return _open_books[name]
+    except KeyError:
+        pass
+    with _open_books_lock:
+        if name not in _open_books:
+            path = os.path.join(PHRASEBOOK_SETTINGS["dir"], name)
+            book = None
+            if os.path.exists(path):
+                try:
+                    book = Phrasebook(path)
+                except (OSError, ValueError, struct.error) as e:
+                    log.warning("Phrasebook %s unusable: %s", path, e)
+            _open_books[name] = book
+        return _open_books[name]
+
+
+def reload_phrasebooks() -> None:
+    """Close open phrasebooks; files are reopened (and re-read) on next use."""
+    with _open_books_lock:
+        books = [book for book in _open_books.values() if book is not None]
+        _open_books.clear()
+    for book in books:
+        book.close()
+
+
+def lookup_phrase(text: str, source_lang: str, target_lang: str, scenario: str = "general", tone: str = "") -> Optional[Dict]:
+    """The curated result for a stock phrase, or None.
+
+    The result has the usual shape (literal_translation, natural_translation,
+    advice); advice is "" when the phrasebook has none for the phrase.
+    """
+    if not PHRASEBOOK_SETTINGS["enabled"] or len(text) > 4 * PHRASEBOOK_SETTINGS["max_chars"]:
+        return None
+    norm = normalize(text)
+    if not norm or len(norm) > PHRASEBOOK_SETTINGS["max_chars"]:
+        return None
+    for scene in (scenario, "general") if scenario != "general" else ("general",):
+        book = _book(phrasebook_name(source_lang, target_lang, scene))
+        if book is not None:
+            entry = book.get(norm, tone)
+            if entry is not None:
+                return entry
+    return None
+
+
+# -- command line --------------------------------------------------------------
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Build or query compiled phrasebooks.")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    build = sub.add_parser("build", help="Compile phrasebooks from exported translations")
+    build.add_argument("inputs", nargs="+", help="batch_translate output / curated .jsonl or .csv, or a translation memory .sqlite3")
+    build.add_argument("-o", "--out", default=PHRASEBOOK_SETTINGS["dir"], help="Output directory")
+    build.add_argument("--max-chars", type=int, default=PHRASEBOOK_SETTINGS["max_chars"], help="Longest normalized phrase kept")
+    build.add_argument("--source-lang", default="zh", help="Default for rows without source_lang")
+    build.add_argument("--target-lang", default="en", help="Default for rows without target_lang")
+    build.add_argument("--scenario", default="general", help="Default for rows without scenario")
+
+    lookup = sub.add_parser("lookup", help="Look a phrase up")
+    lookup.add_argument("text")
+    lookup.add_argument("--source-lang", default="zh")
+    lookup.add_argument("--target-lang", default="en")
+    lookup.add_argument("--scenario", default="general")
+    lookup.add_argument("--tone", default="neutral")
+    lookup.add_argument("-d", "--dir", default=PHRASEBOOK_SETTINGS["dir"], help="Phrasebook directory")
+
+    args = parser.parse_args(argv)
+    if args.command == "lookup":
+        configure_phrasebook(dir=args.dir, enabled=True)
+        entry = lookup_phrase(args.text, args.source_lang, args.target_lang, args.scenario, args.tone)
+        if entry is None:
+            print("not found", file=sys.stderr)
+            return 1
+        print(json.dumps(entry, ensure_ascii=False, indent=2))
+        return 0
+
+    defaults = {"source_lang": args.source_lang, "target_lang": args.target_lang, "scenario": args.scenario}
+
+    def rows() -> Iterator[Row]:
+        for path in args.inputs:
+            if os.path.splitext(path)[1].lower() in (".sqlite3", ".sqlite", ".db"):
+                yield from rows_from_memory(path)
+            else:
+                yield from rows_from_file(path, defaults)
+
+    written = compile_rows(rows(), args.out, args.max_chars)
+    for name, count in sorted(written.items()):
+        print(f"{os.path.join(args.out, name)}: {count} phrases", file=sys.stderr)
+    if not written:
+        print("No usable phrases found", file=sys.stderr)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,285 @@
+"""
+Precompiled prompt templates for the Deepseek translation calls.
+
+The long instruction block only depends on (source_lang, scenario, tone,
+variant), so it is compiled once per combination and sent as the system
+message. Every request with the same settings then starts with a
+byte-identical prefix, which lets the provider's context (prefix) cache hit;
+the user message carries only the per-request data.
+
+Variants:
+- "full":             literal translation + natural expressions + cultural advice
+- "translation_only": skips cultural advice (far fewer output tokens)
+- "advice":           cultural advice only (second phase of a two-phase request)
+- "batch":            several short phrases per request (batch engine)
+- "document":         the sentences of one passage of a long document, with
+                      the preceding text as context (document mode)
+
+`estimate_tokens` gives a local token estimate so prompt sizes can be
+tracked and kept under PROMPT_TOKEN_BUDGET without calling the API.
+`max_output_tokens` caps the completion length per variant, so no request
+(and in particular the fast translation phase) can run away.
+"""
+
+from typing import Dict, List, Optional, Tuple
+from functools import lru_cache
+import hashlib
+import json
+import os
+import threading
+
+from translation_logging import get_logger
+
+
+log = get_logger("translator.prompts")
+
+
+LANG_NAMES = {
+    "zh": "Simplified Chinese",
+    "en": "English",
+    "ja": "Japanese"
+}
+
+VARIANTS = ("full", "translation_only", "advice", "batch", "document")
+
+PROMPT_TOKEN_BUDGET = int(os.environ.get("PROMPT_TOKEN_BUDGET", "4000"))
+# Completion caps: base allowance + a multiple of the source length
+TRANSLATION_MAX_TOKENS = int(os.environ.get("TRANSLATION_MAX_TOKENS", "300"))
+ADVICE_MAX_TOKENS = int(os.environ.get("ADVICE_MAX_TOKENS", "1500"))
+BATCH_ADVICE_MAX_TOKENS = int(os.environ.get("BATCH_ADVICE_MAX_TOKENS", "200"))
+# JSON overhead per sentence of a "document" request
+DOCUMENT_ITEM_TOKENS = 24
+
+_PREAMBLE = "You are a helpful cross-cultural translation assistant. Output valid JSON only.\n\n"
+
+_SETTINGS_BLOCK = (
+    "Source Language: {s_lang}\n"
+    "Scenario: {scenario}\n"
+    "Tone Preference: {tone}\n\n"
+)
+
+_NATURAL_FIELD = (
+    '  "natural_expressions": [\n'
+    '    {{"text": "Natural expression 1 (Target Language)", "explanation": "Explanation and usage context in {s_lang_name}"}},\n'
+    '    {{"text": "Natural expression 2 (Target Language)", "explanation": "Explanation and usage context in {s_lang_name}"}}\n'
+    '  ]'
+)
+
+_ADVICE_FIELD = (
+    '  "cultural_advice": "Cultural advice (Markdown string, written in {s_lang_name}. Based on the \'{scenario}\' scenario and \'{tone}\' tone, provide deep cultural background analysis. Include: 1. Cultural mindset differences behind the language; 2. Etiquette taboos or unwritten rules in this scenario; 3. Potential emotional reaction of the other party. Use lists or bold text to organize content, do not use # headers, ensure empty lines between paragraphs, clear layout, substantial content, avoid vague generalizations.)"'
+)
+
+_TEMPLATES = {
+    "full": (
+        _PREAMBLE
+        + "Act as a cross-cultural translation assistant. The user message gives the target language and the source text. Output JSON data based on the following requirements.\n"
+        + _SETTINGS_BLOCK
+        + "Please return the following JSON structure (do not include Markdown code block markers, ensure valid JSON):\n"
+        "{{\n"
+        '  "literal_translation": "Literal translation result (string)",\n'
+        + _NATURAL_FIELD + ",\n"
+        + _ADVICE_FIELD + "\n"
+        "}}\n"
+    ),
+    "translation_only": (
+        _PREAMBLE
+        + "Act as a cross-cultural translation assistant. The user message gives the target language and the source text. Output JSON data based on the following requirements.\n"
+        + _SETTINGS_BLOCK
+        + "Please return the following JSON structure (do not include Markdown code block markers, ensure valid JSON, do not add any other fields):\n"
+        "{{\n"
+        '  "literal_translation": "Literal translation result (string)",\n'
+        + _NATURAL_FIELD + "\n"
+        "}}\n"
+    ),
+    "advice": (
+        _PREAMBLE
+        + "Act as a cross-cultural communication advisor. The user message gives the target language and the source text the user wants to say in it. Output JSON data based on the following requirements.\n"
+        + _SETTINGS_BLOCK
+        + "Please return the following JSON structure (do not include Markdown code block markers, ensure valid JSON, do not add any other fields):\n"
+        "{{\n"
+        + _ADVICE_FIELD + "\n"
+        "}}\n"
+    ),
+    "batch": (
+        _PREAMBLE
+        + "Act as a cross-cultural translation assistant. The user message gives the target language and a JSON array of {{\"id\", \"text\"}} entries. Translate every entry and output JSON data.\n"
+        + _SETTINGS_BLOCK
+        + "Please return the following JSON structure with exactly one item per id (do not include Markdown code block markers, ensure valid JSON):\n"
+        "{{\n"
+        '  "items": [\n'
+        '    {{"id": 0, "literal_translation": "Literal translation result (string)", '
+        '"natural_expressions": [{{"text": "Natural expression (Target Language)", "explanation": "Explanation and usage context in {s_lang_name}"}}], '
+        '"cultural_advice": "Concise cultural advice for the \'{scenario}\' scenario and \'{tone}\' tone (Markdown string, written in {s_lang_name}, do not use # headers)"}}\n'
+        "  ]\n"
+        "}}\n"
+    ),
+    "document": (
+        _PREAMBLE
+        + "Act as a cross-cultural translation assistant. The user message gives the target language, the text preceding the passage (context only, never translate it) and the sentences of one passage of a longer document as a JSON array of {{\"id\", \"text\"}} entries. Translate every sentence in the flow of the passage, keeping names and terminology consistent with the context. Output JSON data.\n"
+        + _SETTINGS_BLOCK
+        + "Please return the following JSON structure with exactly one item per id (do not include Markdown code block markers, ensure valid JSON, do not add any other fields):\n"
+        "{{\n"
+        '  "items": [\n'
+        '    {{"id": 0, "literal_translation": "Literal translation of the sentence (string)", '
+        '"natural_translation": "Natural, fluent rendering of the sentence in the target language (string)"}}\n'
+        "  ]\n"
+        "}}\n"
+    ),
+}
+
+_USER_TEMPLATES = {
+    "full": "Target Language: {t_lang}\nSource Text: {s_text}",
+    "translation_only": "Target Language: {t_lang}\nSource Text: {s_text}",
+    "advice": "Target Language: {t_lang}\nSource Text: {s_text}",
+    "batch": "Target Language: {t_lang}\nSource Texts:\n{items_json}",
+    "document": "Target Language: {t_lang}\nPreceding Context: {context}\nPassage Sentences:\n{items_json}",
+}
+
+_EXAMPLES_TEMPLATE = "\nReference translations of similar texts (reuse their wording where it fits):\n{examples_json}"
+
+# Cache version keys: change whenever a template changes
+TEMPLATE_VERSIONS = {
+    variant: hashlib.sha1((_TEMPLATES[variant] + _USER_TEMPLATES[variant]).encode("utf-8")).hexdigest()[:12]
+    for variant in VARIANTS
+}
+
+
+@lru_cache(maxsize=256)
+def compile_system_prompt(source_lang: str, scenario: str, tone: str, variant: str = "full") -> str:
+    """Render the static instruction block once per (source_lang, scenario, tone, variant)."""
+    return _TEMPLATES[variant].format(
+        s_lang=source_lang,
+        scenario=scenario,
+        tone=tone,
+        s_lang_name=LANG_NAMES.get(source_lang, source_lang),
+    )
+
+
+def _is_cjk(ch: str) -> bool:
+    code = ord(ch)
+    return (
+        0x3040 <= code <= 0x30FF      # Hiragana / Katakana
+        or 0x3400 <= code <= 0x4DBF   # CJK Extension A
+        or 0x4E00 <= code <= 0x9FFF   # CJK Unified Ideographs
+        or 0xF900 <= code <= 0xFAFF   # CJK Compatibility Ideographs
+        or 0xFF00 <= code <= 0xFFEF   # Full-width forms
+    )
+
+
+def estimate_tokens(text: str) -> int:
+    """Local token estimate for Deepseek models.
+
+    Uses Deepseek's published rule of thumb: ~0.3 tokens per English
+    character and ~0.6 tokens per Chinese/Japanese character.
+    """
+    if not text:
+        return 0
+    cjk = sum(1 for ch in text if _is_cjk(ch))
+    return int(cjk * 0.6 + (len(text) - cjk) * 0.3) + 1
+
+
+def max_output_tokens(variant: str, s_text: str = "", items: int = 1) -> int:
+    """Completion token ceiling for one request.
+
+    The translation phase gets TRANSLATION_MAX_TOKENS plus room for the literal
+    translation and two natural expressions of the source; advice gets
+    ADVICE_MAX_TOKENS and the single-prompt "full" variant both. A "document"
+    request (`s_text` holding its sentences) is capped like the translation
+    phase plus DOCUMENT_ITEM_TOKENS of JSON per sentence. A "batch" request
+    (`s_text` holding all its phrases) gets a translation allowance per item
+    plus BATCH_ADVICE_MAX_TOKENS of concise advice per item.
+    `model_router` lowers these further once it has seen real usage.
+    """
+    translation = TRANSLATION_MAX_TOKENS + 4 * estimate_tokens(s_text)
+    if variant == "translation_only":
+        return translation
+    if variant == "document":
+        return translation + DOCUMENT_ITEM_TOKENS * max(1, items)
+    if variant == "advice":
+        return ADVICE_MAX_TOKENS
+    if variant == "batch":
+        return max(1, items) * (TRANSLATION_MAX_TOKENS + BATCH_ADVICE_MAX_TOKENS) + 4 * estimate_tokens(s_text)
+    return translation + ADVICE_MAX_TOKENS
+
+
+@lru_cache(maxsize=256)
+def _system_tokens(source_lang: str, scenario: str, tone: str, variant: str) -> int:
+    return estimate_tokens(compile_system_prompt(source_lang, scenario, tone, variant))
+
+
+class PromptStats:
+    """Running totals of estimated prompt tokens per request."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.requests = 0
+        self.total_tokens = 0
+        self.max_tokens = 0
+        self.over_budget = 0
+
+    def record(self, tokens: int) -> None:
+        with self._lock:
+            self.requests += 1
+            self.total_tokens += tokens
+            self.max_tokens = max(self.max_tokens, tokens)
+            if tokens > PROMPT_TOKEN_BUDGET:
+                self.over_budget += 1
+
+    def snapshot(self) -> Dict[str, float]:
+        with self._lock:
+            return {
+                "requests": self.requests,
+                "avg_prompt_tokens": (self.total_tokens / self.requests) if self.requests else 0.0,
+                "max_prompt_tokens": self.max_tokens,
+                "over_budget": self.over_budget,
+                "budget": PROMPT_TOKEN_BUDGET,
+            }
+
+
+prompt_stats = PromptStats()
+
+
+def build_messages(
+    s_text: str,
+    s_lang: str,
+    t_lang: str,
+    scenario: str,
+    tone: str,
+    variant: str = "full",
+    items: Optional[List[Dict]] = None,
+    examples: Optional[List[Dict]] = None,
+    context: str = "",
+) -> Tuple[List[Dict[str, str]], int]:
+    """Return (messages, estimated prompt tokens) for one request.
+
+    For the "batch" and "document" variants pass `items` ([{"id", "text"},
+    ...]) instead of `s_text`; "document" also sends `context` (the source
+    text before the passage). `examples` ([{"source", "translation"}, ...],
+    e.g. from the translation memory) are appended to the user message as
+    references, so the system prompt stays identical. Prompts above
+    PROMPT_TOKEN_BUDGET are still sent but counted and reported, so
+    oversized inputs show up in the stats.
+    """
+    system = compile_system_prompt(s_lang, scenario, tone, variant)
+    if variant == "batch":
+        user = _USER_TEMPLATES[variant].format(
+            t_lang=t_lang, items_json=json.dumps(items or [], ensure_ascii=False)
+        )
+    elif variant == "document":
+        user = _USER_TEMPLATES[variant].format(
+            t_lang=t_lang, context=context or "(start of document)",
+            items_json=json.dumps(items or [], ensure_ascii=False),
+        )
+    else:
+        user = _USER_TEMPLATES[variant].format(t_lang=t_lang, s_text=s_text)
+        if examples:
+            user += _EXAMPLES_TEMPLATE.format(examples_json=json.dumps(examples, ensure_ascii=False))
+    tokens = _system_tokens(s_lang, scenario, tone, variant) + estimate_tokens(user)
+    prompt_stats.record(tokens)
+    if tokens > PROMPT_TOKEN_BUDGET:
+        log.warning("Prompt size %d tokens exceeds budget %d", tokens, PROMPT_TOKEN_BUDGET)
+    messages = [
+        {"role": "system", "content": system},
+        {"role": "user", "content": user},
+    ]
+    return messages, tokens
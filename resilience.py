@@ -0,0 +1,249 @@
+"""
+Retry, deadline and circuit-breaker policy around the Deepseek call.
+
+- Every attempt is bounded by a per-attempt timeout, and the whole call
+  (all attempts plus backoff sleeps) by a total deadline, so a hung
+  connection can never hold a caller (e.g. a Qt TranslationThread) forever.
+- Retryable errors (timeouts, connection errors, 408/409/429/5xx) are
+  retried with exponential backoff and full jitter, honoring Retry-After;
+  other errors (bad request, auth) fail immediately.
+- One `CircuitBreaker` per endpoint (api_url) opens after consecutive
+  endpoint failures (timeouts, connection errors, 5xx) and then fails fast;
+  after `breaker_reset` seconds a single half-open probe is let through and
+  closes the breaker again on success.
+
+Breaker states are exported as the `translator_circuit_state{endpoint}`
+gauge (0 closed, 1 half-open, 2 open), transitions and retries as counters.
+
+Settings (environment variables or `configure_retries(...)`):
+- DEEPSEEK_MAX_ATTEMPTS      attempts per call, including the first (default 3)
+- DEEPSEEK_ATTEMPT_TIMEOUT   seconds per attempt (default 30)
+- DEEPSEEK_TOTAL_TIMEOUT     seconds for the whole call (default 60)
+- DEEPSEEK_BACKOFF_BASE      first backoff ceiling in seconds (default 0.5)
+- DEEPSEEK_BACKOFF_MAX       backoff ceiling in seconds (default 8)
+- DEEPSEEK_BREAKER_FAILURES  consecutive failures that open a breaker (default 5)
+- DEEPSEEK_BREAKER_RESET     seconds before a half-open probe (default 30)
+"""
+
+from typing import Dict, Optional
+import logging
+import os
+import random
+import threading
+import time
+
+from metrics import incr, set_gauge
+from token_scheduler import _retry_after, _status_code
+from translation_logging import get_logger
+
+
+log = get_logger("translator.resilience")
+
+
+RETRY_SETTINGS = {
+    "max_attempts": int(os.environ.get("DEEPSEEK_MAX_ATTEMPTS", "3")),
+    "attempt_timeout": float(os.environ.get("DEEPSEEK_ATTEMPT_TIMEOUT", "30")),
+    "total_timeout": float(os.environ.get("DEEPSEEK_TOTAL_TIMEOUT", "60")),
+    "backoff_base": float(os.environ.get("DEEPSEEK_BACKOFF_BASE", "0.5")),
+    "backoff_max": float(os.environ.get("DEEPSEEK_BACKOFF_MAX", "8")),
+    "breaker_failures": int(os.environ.get("DEEPSEEK_BREAKER_FAILURES", "5")),
+    "breaker_reset": float(os.environ.get("DEEPSEEK_BREAKER_RESET", "30")),
+}
+
+# exception classes (by name, so neither openai nor httpx must be importable)
+_TRANSIENT_ERRORS = {"APIConnectionError", "APITimeoutError", "TransportError", "TimeoutException"}
+
+
+def configure_retries(**settings) -> None:
+    """Override retry / breaker settings; takes effect for the next call."""
+    for key, value in settings.items():
+        if key not in RETRY_SETTINGS:
+            raise KeyError(f"Unknown retry setting: {key}")
+        RETRY_SETTINGS[key] = value
+
+
+def _is_transient(error: BaseException) -> bool:
+    if isinstance(error, (TimeoutError, ConnectionError)):
+        return True
+    return any(cls.__name__ in _TRANSIENT_ERRORS for cls in type(error).__mro__)
+
+
+def is_retryable(error: BaseException) -> bool:
+    """Timeouts, connection errors, 408 / 409 / 429 and 5xx are worth another attempt."""
+    status = _status_code(error)
+    if status is not None:
+        return status in (408, 409, 429) or status >= 500
+    return _is_transient(error)
+
+
+def is_endpoint_failure(error: BaseException) -> bool:
+    """Errors that say the endpoint itself is unhealthy (counted by the breaker).
+
+    Throttling (429) and request errors are per-token / per-request problems
+    and leave the breaker alone.
+    """
+    status = _status_code(error)
+    if status is not None:
+        return status >= 500
+    return _is_transient(error)
+
+
+def error_label(error: BaseException) -> str:
+    status = _status_code(error)
+    return str(status) if status is not None else type(error).__name__
+
+
+class Deadline:
+    """Total time budget for one call, handing out per-attempt timeouts."""
+
+    def __init__(self, total: Optional[float] = None):
+        total = RETRY_SETTINGS["total_timeout"] if total is None else total
+        self.expires = time.monotonic() + total if total and total > 0 else None
+
+    def remaining(self) -> Optional[float]:
+        if self.expires is None:
+            return None
+        return max(0.0, self.expires - time.monotonic())
+
+    def expired(self) -> bool:
+        return self.expires is not None and time.monotonic() >= self.expires
+
+    def attempt_timeout(self) -> Optional[float]:
+        per_attempt = RETRY_SETTINGS["attempt_timeout"] or None
+        remaining = self.remaining()
+        if remaining is None:
+            return per_attempt
+        return min(per_attempt, remaining) if per_attempt else remaining
+
+
+def retry_delay(error: BaseException, attempt: int, deadline: Deadline) -> Optional[float]:
+    """Seconds to wait before attempt `attempt + 1`, or None to give up.
+
+    `attempt` counts from 1. Full jitter: uniform(0, min(backoff_max,
+    backoff_base * 2 ** (attempt - 1))), but never shorter than Retry-After.
+    Gives up when the error is not retryable, the attempts are used up or
+    the wait would overrun the deadline.
+    """
+    if attempt >= RETRY_SETTINGS["max_attempts"] or not is_retryable(error):
+        return None
+    ceiling = min(RETRY_SETTINGS["backoff_max"], RETRY_SETTINGS["backoff_base"] * (2 ** (attempt - 1)))
+    delay = random.uniform(0, ceiling)
+    retry_after = _retry_after(error)
+    if retry_after:
+        delay = max(delay, retry_after)
+    remaining = deadline.remaining()
+    if remaining is not None and delay >= remaining:
+        return None
+    incr("translator_retries_total", reason=error_label(error))
+    return delay
+
+
+class CircuitBreaker:
+    """Closed -> open after N consecutive endpoint failures -> half-open probe -> closed."""
+
+    CLOSED = "closed"
+    HALF_OPEN = "half_open"
+    OPEN = "open"
+    _GAUGE = {CLOSED: 0, HALF_OPEN: 1, OPEN: 2}
+
+    def __init__(self, endpoint: str, failure_threshold: Optional[int] = None, reset_timeout: Optional[float] = None):
+        self.endpoint = endpoint
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.state = self.CLOSED
+        self.consecutive_failures = 0
+        self.opened_at = 0.0
+        self.rejected = 0
+        self._probe_started: Optional[float] = None
+        self._lock = threading.Lock()
+        set_gauge("translator_circuit_state", 0, endpoint=endpoint)
+
+    def _threshold(self) -> int:
+        return self.failure_threshold or RETRY_SETTINGS["breaker_failures"]
+
+    def _reset(self) -> float:
+        return self.reset_timeout if self.reset_timeout is not None else RETRY_SETTINGS["breaker_reset"]
+
+    def _transition(self, state: str) -> None:
+        # caller holds the lock
+        if state == self.state:
+            return
+        level = logging.WARNING if state == self.OPEN else logging.INFO
+        log.log(level, "Circuit breaker for %s: %s -> %s", self.endpoint, self.state, state)
+        self.state = state
+        set_gauge("translator_circuit_state", self._GAUGE[state], endpoint=self.endpoint)
+        incr("translator_circuit_transitions_total", endpoint=self.endpoint, state=state)
+
+    def allow(self) -> bool:
+        """May a request go out now? In half-open state only one probe at a time."""
+        now = time.monotonic()
+        with self._lock:
+            if self.state == self.OPEN:
+                if now - self.opened_at < self._reset():
+                    self.rejected += 1
+                    return False
+                self._transition(self.HALF_OPEN)
+                self._probe_started = None
+            if self.state == self.HALF_OPEN:
+                # a probe that never reported back (cancelled caller) expires
+                if self._probe_started is not None and now - self._probe_started < self._reset():
+                    self.rejected += 1
+                    return False
+                self._probe_started = now
+            return True
+
+    def record(self, error: Optional[BaseException] = None) -> None:
+        """Feed back the outcome of an allowed request."""
+        with self._lock:
+            self._probe_started = None
+            if error is None:
+                self.consecutive_failures = 0
+                self._transition(self.CLOSED)
+                return
+            if not is_endpoint_failure(error):
+                return
+            self.consecutive_failures += 1
+            if self.state == self.HALF_OPEN or self.consecutive_failures >= self._threshold():
+                self.opened_at = time.monotonic()
+                self._transition(self.OPEN)
+
+    def release(self) -> None:
+        """An allowed request ended without a verdict (cancelled): free the probe slot."""
+        with self._lock:
+            self._probe_started = None
+
+    def retry_in(self) -> float:
+        """Seconds until the next half-open probe (0 unless open)."""
+        with self._lock:
+            if self.state != self.OPEN:
+                return 0.0
+            return max(0.0, self._reset() - (time.monotonic() - self.opened_at))
+
+    def snapshot(self) -> Dict:
+        with self._lock:
+            return {
+                "state": self.state,
+                "consecutive_failures": self.consecutive_failures,
+                "rejected": self.rejected,
+            }
+
+
+_breakers: Dict[str, CircuitBreaker] = {}
+_breakers_lock = threading.Lock()
+
+
+def get_breaker(endpoint: str) -> CircuitBreaker:
+    """The process-wide breaker for one endpoint (api_url)."""
+    breaker = _breakers.get(endpoint)
+    if breaker is None:
+        with _breakers_lock:
+            breaker = _breakers.get(endpoint)
+            if breaker is None:
+                breaker = _breakers[endpoint] = CircuitBreaker(endpoint)
+    return breaker
+
+
+def breaker_stats() -> Dict[str, Dict]:
+    with _breakers_lock:
+        breakers = list(_breakers.values())
+    return {breaker.endpoint: breaker.snapshot() for breaker in breakers}
@@ -0,0 +1,261 @@
+"""
+Semantic (paraphrase) cache in front of the Deepseek call.
+
+Source texts are embedded on the CPU with a hashing vectorizer (word
+unigrams / bigrams and character trigrams, signed feature hashing,
+L2-normalized), so no model download is needed. Vectors live in a
+memory-mapped NumPy array; metadata (scope, text, result) lives in SQLite.
+A lookup is one matrix-vector product over the rows of the same
+(source_lang, target_lang, scenario, tone) scope; the best row is served
+when its cosine similarity reaches the threshold and it has the same
+numbers, negations and date words as the query
+(`translation_memory.key_terms`). Hashed embeddings score "will arrive" and
+"will not arrive" as near-identical, so without that check a hit would
+often be a confident wrong translation.
+
+The cache is opt-in: it costs a lookup on every miss, a memory-mapped
+vector file of capacity x 1 KiB and the audit calls below.
+
+Quality drift is sampled: a small fraction of hits is re-translated in the
+background and the fresh literal translation is compared with the cached
+one (character-level similarity); agreement statistics are reported by
+`stats()`.
+
+Configuration:
+- TRANSLATION_SEMANTIC_CACHE_PATH       SQLite path (vectors go to <path>.vectors)
+- TRANSLATION_SEMANTIC_CACHE_CAPACITY   rows kept, oldest overwritten first (default 50000)
+- TRANSLATION_SEMANTIC_THRESHOLD        cosine similarity needed for a hit (default 0.9)
+- TRANSLATION_SEMANTIC_AUDIT_RATE       fraction of hits re-checked (default 0.02)
+- TRANSLATION_SEMANTIC_CACHE_ENABLED=1  turns it on (off by default)
+- TRANSLATION_SEMANTIC_CACHE_DISABLED=1 keeps it off even when enabled
+
+Requires NumPy; without it the semantic cache is simply disabled.
+"""
+
+from typing import Dict, List, Optional
+import difflib
+import hashlib
+import json
+import os
+import random
+import re
+import sqlite3
+import struct
+import threading
+import time
+import unicodedata
+
+from translation_logging import get_logger
+from translation_memory import key_terms
+
+
+log = get_logger("translator.semantic")
+
+
+DEFAULT_SEMANTIC_PATH = os.environ.get("TRANSLATION_SEMANTIC_CACHE_PATH", "semantic_cache.sqlite3")
+DEFAULT_CAPACITY = int(os.environ.get("TRANSLATION_SEMANTIC_CACHE_CAPACITY", "50000"))
+SIMILARITY_THRESHOLD = float(os.environ.get("TRANSLATION_SEMANTIC_THRESHOLD", "0.9"))
+AUDIT_RATE = float(os.environ.get("TRANSLATION_SEMANTIC_AUDIT_RATE", "0.02"))
+# audited hits whose fresh translation agrees less than this count as drift
+AUDIT_AGREEMENT = 0.6
+
+DIM = 256
+
+_WORD_RE = re.compile(r"\w+", re.UNICODE)
+_CJK_RE = re.compile(r"[\u3040-\u30ff\u3400-\u9fff]")
+
+
+def _features(text: str) -> List[str]:
+    text = unicodedata.normalize("NFKC", text).casefold()
+    words = _WORD_RE.findall(text)
+    feats = [f"w:{w}" for w in words]
+    feats += [f"b:{a} {b}" for a, b in zip(words, words[1:])]
+    # character trigrams carry CJK text (no word boundaries) and spelling variants
+    chars = "".join(words) if _CJK_RE.search(text) else " ".join(words)
+    feats += [f"c:{chars[i:i + 3]}" for i in range(max(0, len(chars) - 2))]
+    return feats
+
+
+def embed(text: str):
+    """Hashing-vectorizer embedding: float32 vector of length DIM with unit norm."""
+    import numpy as np
+
+    vec = np.zeros(DIM, dtype=np.float32)
+    for feat in _features(text):
+        h = int.from_bytes(hashlib.blake2b(feat.encode("utf-8"), digest_size=8).digest(), "little")
+        vec[h % DIM] += 1.0 if (h >> 63) else -1.0
+    norm = float(np.linalg.norm(vec))
+    if norm > 0:
+        vec /= norm
+    return vec
+
+
+def _scope_id(source_lang: str, target_lang: str, scenario: str, tone: str) -> int:
+    digest = hashlib.blake2b(f"{source_lang}|{target_lang}|{scenario}|{tone}".encode("utf-8"), digest_size=8).digest()
+    # 0 marks an empty slot
+    return struct.unpack("<q", digest)[0] or 1
+
+
+class SemanticCache:
+    """Fixed-capacity ring of embeddings (memory-mapped) with SQLite metadata."""
+
+    def __init__(self, path: str = DEFAULT_SEMANTIC_PATH, capacity: int = DEFAULT_CAPACITY, threshold: float = SIMILARITY_THRESHOLD):
+        import numpy as np
+
+        self.path = path
+        self.capacity = capacity
+        self.threshold = threshold
+        self.lookups = 0
+        self.hits = 0
+        self.rejected = 0
+        self.audits = 0
+        self.audit_agreement_sum = 0.0
+        self.drift = 0
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS entries ("
+            " slot INTEGER PRIMARY KEY,"
+            " scope INTEGER NOT NULL,"
+            " source_text TEXT NOT NULL,"
+            " result TEXT NOT NULL,"
+            " created_at REAL NOT NULL)"
+        )
+        vectors_path = f"{path}.vectors"
+        expected_bytes = capacity * DIM * 4
+        mode = "r+"
+        if not os.path.exists(vectors_path) or os.path.getsize(vectors_path) != expected_bytes:
+            # new file or capacity changed: start empty
+            mode = "w+"
+            self._conn.execute("DELETE FROM entries")
+        self._vectors = np.memmap(vectors_path, dtype=np.float32, mode=mode, shape=(capacity, DIM))
+        self._scopes = np.zeros(capacity, dtype=np.int64)
+        newest, newest_slot = -1.0, -1
+        for slot, scope, created_at in self._conn.execute("SELECT slot, scope, created_at FROM entries"):
+            if slot < capacity:
+                self._scopes[slot] = scope
+                if created_at > newest:
+                    newest, newest_slot = created_at, slot
+        self._next_slot = (newest_slot + 1) % capacity
+
+    def lookup(self, source_text: str, source_lang: str, target_lang: str, scenario: str, tone: str) -> Optional[Dict]:
+        """Return {"source_text", "result", "similarity"} for the best match above the threshold, or None."""
+        import numpy as np
+
+        query = embed(source_text)
+        scope = _scope_id(source_lang, target_lang, scenario, tone)
+        with self._lock:
+            self.lookups += 1
+            in_scope = self._scopes == scope
+            if not in_scope.any():
+                return None
+            # one contiguous BLAS pass over the whole ring is cheaper than
+            # gathering the scope's rows out of the memmap first
+            sims = np.where(in_scope, self._vectors @ query, -1.0)
+            best = int(np.argmax(sims))
+            similarity = min(1.0, float(sims[best]))
+            if similarity < self.threshold:
+                return None
+            row = self._conn.execute(
+                "SELECT source_text, result FROM entries WHERE slot = ?", (best,)
+            ).fetchone()
+            if row is None:
+                return None
+            if key_terms(source_text) != key_terms(row[0]):
+                # same wording around a different number, negation or date
+                self.rejected += 1
+                return None
+            self.hits += 1
+        try:
+            return {"source_text": row[0], "result": json.loads(row[1]), "similarity": similarity}
+        except ValueError:
+            return None
+
+    def add(self, source_text: str, source_lang: str, target_lang: str, scenario: str, tone: str, result: Dict) -> None:
+        vector = embed(source_text)
+        scope = _scope_id(source_lang, target_lang, scenario, tone)
+        value = json.dumps(result, ensure_ascii=False)
+        with self._lock:
+            slot = self._next_slot
+            self._next_slot = (slot + 1) % self.capacity
+            self._vectors[slot] = vector
+            self._scopes[slot] = scope
+            self._conn.execute(
+                "INSERT OR REPLACE INTO entries (slot, scope, source_text, result, created_at) VALUES (?, ?, ?, ?, ?)",
+                (slot, scope, source_text.strip(), value, time.time()),
+            )
+
+    def should_audit(self) -> bool:
+        return AUDIT_RATE > 0 and random.random() < AUDIT_RATE
+
+    def record_audit(self, cached: Dict, fresh: Dict) -> float:
+        """Compare a served hit with a fresh translation; returns their agreement (0..1)."""
+        agreement = difflib.SequenceMatcher(
+            None, str(cached.get("literal_translation", "")), str(fresh.get("literal_translation", ""))
+        ).ratio()
+        with self._lock:
+            self.audits += 1
+            self.audit_agreement_sum += agreement
+            if agreement < AUDIT_AGREEMENT:
+                self.drift += 1
+        if agreement < AUDIT_AGREEMENT:
+            log.info("Semantic cache drift (agreement %.2f): %r vs %r",
+                     agreement, cached.get("literal_translation"), fresh.get("literal_translation"))
+        return agreement
+
+    def flush(self) -> None:
+        with self._lock:
+            self._vectors.flush()
+
+    def clear(self) -> None:
+        with self._lock:
+            self._scopes[:] = 0
+            self._next_slot = 0
+            self._conn.execute("DELETE FROM entries")
+
+    def stats(self) -> Dict[str, float]:
+        with self._lock:
+            return {
+                "size": int((self._scopes != 0).sum()),
+                "lookups": self.lookups,
+                "hits": self.hits,
+                "hit_rate": (self.hits / self.lookups) if self.lookups else 0.0,
+                "rejected": self.rejected,
+                "audits": self.audits,
+                "audit_agreement": (self.audit_agreement_sum / self.audits) if self.audits else None,
+                "drift": self.drift,
+                "drift_rate": (self.drift / self.audits) if self.audits else 0.0,
+            }
+
+
+_default_semantic: Optional[SemanticCache] = None
+_default_semantic_lock = threading.Lock()
+_default_semantic_failed = False
+
+
+def get_default_semantic_cache() -> Optional[SemanticCache]:
+    """Return the process-wide semantic cache, or None if not enabled / NumPy missing.
+
+    Set TRANSLATION_SEMANTIC_CACHE_ENABLED=1 to turn it on.
+    """
+    global _default_semantic, _default_semantic_failed
+    if os.environ.get("TRANSLATION_SEMANTIC_CACHE_ENABLED") != "1" or _default_semantic_failed:
+        return None
+    if os.environ.get("TRANSLATION_SEMANTIC_CACHE_DISABLED") == "1":
+        return None
+    if _default_semantic is None:
+        with _default_semantic_lock:
+            if _default_semantic is None and not _default_semantic_failed:
+                try:
+                    _default_semantic = SemanticCache()
+                except ImportError:
+                    log.info("NumPy not installed; semantic cache disabled")
+                    _default_semantic_failed = True
+                    return None
+                except Exception as e:
+                    log.warning("Semantic cache unavailable: %s", e)
+                    _default_semantic_failed = True
+                    return None
+    return _default_semantic
@@ -0,0 +1,135 @@
+"""
+Single-flight request coalescing.
+
+When several callers ask for the same translation at the same time (several
+Streamlit users, repeated clicks on the translate button), only the first one
+(the leader) calls Deepseek; the others wait for and share its result.
+
+- `SingleFlight` is for the threaded paths (sync and streaming).
+- `AsyncSingleFlight` is for the asyncio path; the upstream call is cancelled
+  only when every waiter has gone away.
+- Both count calls and coalesced calls so the coalescing rate can be reported
+  (`stats()`), and export them as `translator_singleflight_total{path,result}`
+  (result "leader" or "coalesced"), so the rate is
+  coalesced / (leader + coalesced) on the metrics endpoint.
+"""
+
+from typing import Any, Awaitable, Callable, Dict, Tuple
+import asyncio
+import threading
+
+from metrics import incr
+
+
+class _Call:
+    def __init__(self):
+        self.event = threading.Event()
+        self.result: Any = None
+
+
+class SingleFlight:
+    """Thread-based coalescing of identical in-flight calls."""
+
+    def __init__(self, path: str = "threaded"):
+        self._calls: Dict[str, _Call] = {}
+        self._lock = threading.Lock()
+        self.path = path
+        self.calls = 0
+        self.coalesced = 0
+
+    def begin(self, key: str) -> Tuple[bool, _Call]:
+        """Register interest in `key`; returns (is_leader, call).
+
+        The leader must call `finish(key, call, result)` exactly once, even on
+        failure (with result None). Followers use `call.event.wait()` and read
+        `call.result`.
+        """
+        with self._lock:
+            self.calls += 1
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = _Call()
+                self._calls[key] = call
+            else:
+                self.coalesced += 1
+        incr("translator_singleflight_total", path=self.path, result="leader" if leader else "coalesced")
+        return leader, call
+
+    def finish(self, key: str, call: _Call, result: Any = None) -> None:
+        with self._lock:
+            if self._calls.get(key) is call:
+                del self._calls[key]
+        call.result = result
+        call.event.set()
+
+    def do(self, key: str, fn: Callable[[], Any]) -> Any:
+        """Run `fn` once for all concurrent callers with the same key.
+
+        If the leader produced no result (None), followers run `fn` themselves.
+        """
+        leader, call = self.begin(key)
+        if not leader:
+            call.event.wait()
+            if call.result is not None:
+                return call.result
+            return fn()
+        result = None
+        try:
+            result = fn()
+            return result
+        finally:
+            self.finish(key, call, result)
+
+    def stats(self) -> Dict[str, float]:
+        return {
+            "calls": self.calls,
+            "coalesced": self.coalesced,
+            "coalescing_rate": (self.coalesced / self.calls) if self.calls else 0.0,
+        }
+
+
+class AsyncSingleFlight:
+    """asyncio coalescing; must be used from a single event loop per key."""
+
+    def __init__(self, path: str = "async"):
+        self._tasks: Dict[str, Tuple["asyncio.Task", list]] = {}
+        self.path = path
+        self.calls = 0
+        self.coalesced = 0
+
+    async def do(self, key: str, factory: Callable[[], Awaitable[Any]]) -> Any:
+        self.calls += 1
+        entry = self._tasks.get(key)
+        if entry is not None and not entry[0].done():
+            self.coalesced += 1
+            incr("translator_singleflight_total", path=self.path, result="coalesced")
+        else:
+            incr("translator_singleflight_total", path=self.path, result="leader")
+            task = asyncio.ensure_future(factory())
+            entry = (task, [0])
+            self._tasks[key] = entry
+            task.add_done_callback(lambda t, key=key: self._forget(key, t))
+        task, waiters = entry
+        waiters[0] += 1
+        try:
+            return await asyncio.shield(task)
+        except asyncio.CancelledError:
+            if not task.done() and waiters[0] <= 1:
+                # the last waiter went away: stop the upstream request
+                task.cancel()
+            raise
+        finally:
+            waiters[0] -= 1
+
+    def _forget(self, key: str, task: "asyncio.Task") -> None:
+        entry = self._tasks.get(key)
+        if entry is not None and entry[0] is task:
+            del self._tasks[key]
+
+    def stats(self) -> Dict[str, float]:
+        return {
+            "calls": self.calls,
+            "coalesced": self.coalesced,
+            "coalescing_rate": (self.coalesced / self.calls) if self.calls else 0.0,
+        }
@@ -0,0 +1,133 @@
+"""
+Shared Vosk model registry.
+
+Loading a Vosk model reads tens to hundreds of MB from disk and takes
+seconds, so every language model is loaded once per process and reused by
+the Qt voice thread and the Streamlit offline fallback.
+
+- `get_model(path)` is thread-safe; concurrent callers for the same model
+  wait for a single load.
+- `preload([...])` warms models in a background thread at app startup.
+- When the on-disk size of loaded models exceeds the memory budget
+  (VOSK_MODEL_MEMORY_BUDGET_MB, default 1024), the least recently used
+  models are dropped from the registry.
+"""
+
+from typing import Dict, Iterable, Optional
+from collections import OrderedDict
+import os
+import threading
+
+from translation_logging import get_logger
+
+
+log = get_logger("translator.speech")
+
+
+VOSK_MODEL_PATHS = {
+    "zh": "models/zh",
+    "en": "models/en",
+    "ja": "models/ja"
+}
+
+MEMORY_BUDGET_BYTES = int(float(os.environ.get("VOSK_MODEL_MEMORY_BUDGET_MB", "1024")) * 1024 * 1024)
+
+# path -> (model, estimated bytes), most recently used last
+_models: "OrderedDict[str, tuple]" = OrderedDict()
+_registry_lock = threading.Lock()
+_load_locks: Dict[str, threading.Lock] = {}
+
+
+def model_path_for_lang(lang_code: str, default: str = "models/en") -> str:
+    return VOSK_MODEL_PATHS.get(lang_code, default)
+
+
+def _estimate_size(path: str) -> int:
+    """Approximate resident size by the model's on-disk size."""
+    total = 0
+    for root, _dirs, files in os.walk(path):
+        for name in files:
+            try:
+                total += os.path.getsize(os.path.join(root, name))
+            except OSError:
+                pass
+    return total
+
+
+def _evict_over_budget(keep: str) -> None:
+    # caller holds _registry_lock
+    total = sum(size for _model, size in _models.values())
+    for path in list(_models.keys()):
+        if total <= MEMORY_BUDGET_BYTES:
+            break
+        if path == keep:
+            continue
+        _model, size = _models.pop(path)
+        total -= size
+        log.info("Vosk model evicted (memory budget): %s", path)
+
+
+def get_model(path: str):
+    """Return the loaded Vosk `Model` for `path`, loading it on first use.
+
+    Raises ImportError if vosk is missing and the usual vosk exceptions if the
+    model cannot be loaded, just like `Model(path)`.
+    """
+    path = os.path.normpath(path)
+    with _registry_lock:
+        entry = _models.get(path)
+        if entry is not None:
+            _models.move_to_end(path)
+            return entry[0]
+        load_lock = _load_locks.setdefault(path, threading.Lock())
+
+    with load_lock:
+        with _registry_lock:
+            entry = _models.get(path)
+            if entry is not None:
+                _models.move_to_end(path)
+                return entry[0]
+        from vosk import Model
+
+        model = Model(path)
+        size = _estimate_size(path)
+        with _registry_lock:
+            _models[path] = (model, size)
+            _evict_over_budget(keep=path)
+        return model
+
+
+def get_model_for_lang(lang_code: str):
+    return get_model(model_path_for_lang(lang_code))
+
+
+def is_loaded(path: str) -> bool:
+    return os.path.normpath(path) in _models
+
+
+def preload(paths: Iterable[str], background: bool = True) -> Optional[threading.Thread]:
+    """Load the given model paths (that exist) ahead of time."""
+    def _load_all():
+        for path in paths:
+            if path and os.path.exists(path):
+                try:
+                    get_model(path)
+                except Exception as e:
+                    log.warning("Vosk model preload failed for %s: %s", path, e)
+
+    if not background:
+        _load_all()
+        return None
+    thread = threading.Thread(target=_load_all, name="vosk-preload", daemon=True)
+    thread.start()
+    return thread
+
+
+def unload(path: str) -> None:
+    with _registry_lock:
+        _models.pop(os.path.normpath(path), None)
+
+
+def loaded_models() -> Dict[str, int]:
+    with _registry_lock:
+        return {path: size for path, (_model, size) in _models.items()}
@@ -0,0 +1,329 @@
+"""
+Streaming speech input: voice-activity detection, utterance segmentation
+and translation that overlaps with recognition.
+
+Microphone audio (16 kHz, 16-bit mono) is cut into 30 ms frames. A VAD
+marks each frame as speech or silence; an utterance starts after
+`min_speech_ms` of speech and ends after `end_silence_ms` of silence, at
+which point Vosk's `FinalResult()` is read immediately instead of waiting
+for Kaldi's own (seconds-long) endpointing. Every finalized utterance is
+handed to `OverlappedTranslator`, which sends it to the translation engine
+on the shared background loop while the speaker keeps talking, and delivers
+the results in utterance order.
+
+- `EnergyVAD`: frame RMS against an adaptive noise floor (no dependencies).
+- `WebRtcVAD`: the WebRTC VAD when the optional `webrtcvad` package is installed.
+- `stream_utterances(...)`: generator of speech_start / partial / utterance events.
+- `OverlappedTranslator`: ordered, bounded in-flight translation of utterances.
+
+Settings (environment variables or `configure_vad(...)`):
+- VOICE_VAD               "auto" (WebRTC if installed, else energy), "energy" or "webrtc"
+- VOICE_END_SILENCE_MS    silence that ends an utterance (default 500)
+- VOICE_MIN_SPEECH_MS     speech needed to start an utterance (default 150)
+- VOICE_MAX_UTTERANCE     seconds before a long utterance is cut (default 12)
+- VOICE_SESSION_IDLE      seconds without speech that end the session (default 5)
+- VOICE_ENERGY_RATIO      speech threshold as a multiple of the noise floor (default 3.0)
+- VOICE_MIN_ENERGY        absolute RMS floor for speech (default 250)
+- VOICE_WEBRTC_MODE       WebRTC aggressiveness 0-3 (default 2)
+"""
+
+from array import array
+from collections import deque
+from typing import Callable, Dict, Iterator, List, Optional
+import json
+import math
+import os
+import threading
+import time
+
+from metrics import incr, observe
+from translation_logging import get_logger
+from translator_core_new import submit_translation
+
+
+log = get_logger("translator.speech")
+
+
+SAMPLE_RATE = 16000
+FRAME_MS = 30
+FRAME_BYTES = SAMPLE_RATE * FRAME_MS // 1000 * 2
+# audio kept from before the speech onset so the first syllable is not clipped
+PREROLL_MS = 300
+# how often (in frames) the recognizer is asked for a partial result
+PARTIAL_EVERY = 10
+
+VAD_SETTINGS = {
+    "vad": os.environ.get("VOICE_VAD", "auto"),
+    "end_silence_ms": int(os.environ.get("VOICE_END_SILENCE_MS", "500")),
+    "min_speech_ms": int(os.environ.get("VOICE_MIN_SPEECH_MS", "150")),
+    "max_utterance": float(os.environ.get("VOICE_MAX_UTTERANCE", "12")),
+    "session_idle": float(os.environ.get("VOICE_SESSION_IDLE", "5")),
+    "energy_ratio": float(os.environ.get("VOICE_ENERGY_RATIO", "3.0")),
+    "min_energy": float(os.environ.get("VOICE_MIN_ENERGY", "250")),
+    "webrtc_mode": int(os.environ.get("VOICE_WEBRTC_MODE", "2")),
+}
+
+
+def configure_vad(**settings) -> None:
+    """Override VAD / segmentation settings; takes effect for the next session."""
+    for key, value in settings.items():
+        if key not in VAD_SETTINGS:
+            raise KeyError(f"Unknown VAD setting: {key}")
+        VAD_SETTINGS[key] = value
+
+
+def frame_rms(frame: bytes) -> float:
+    """RMS of little-endian 16-bit PCM samples."""
+    samples = array("h", frame[: len(frame) // 2 * 2])
+    if not samples:
+        return 0.0
+    return math.sqrt(sum(s * s for s in samples) / len(samples))
+
+
+class EnergyVAD:
+    """Speech when the frame energy clears the noise floor by `energy_ratio`.
+
+    The noise floor follows silent frames quickly and creeps up slowly during
+    speech, so a fan switched on mid-session does not read as endless speech.
+    """
+
+    name = "energy"
+
+    def __init__(self, ratio: Optional[float] = None, min_energy: Optional[float] = None):
+        self.ratio = ratio or VAD_SETTINGS["energy_ratio"]
+        self.min_energy = VAD_SETTINGS["min_energy"] if min_energy is None else min_energy
+        self.noise_floor = self.min_energy / self.ratio
+
+    def is_speech(self, frame: bytes) -> bool:
+        energy = frame_rms(frame)
+        speech = energy > max(self.min_energy, self.noise_floor * self.ratio)
+        alpha = 0.002 if speech else (0.3 if energy < self.noise_floor else 0.05)
+        self.noise_floor = max(1.0, self.noise_floor + alpha * (energy - self.noise_floor))
+        return speech
+
+
+class WebRtcVAD:
+    """The WebRTC VAD (GMM-based); needs the optional `webrtcvad` package."""
+
+    name = "webrtc"
+
+    def __init__(self, mode: Optional[int] = None):
+        import webrtcvad
+
+        self._vad = webrtcvad.Vad(VAD_SETTINGS["webrtc_mode"] if mode is None else mode)
+
+    def is_speech(self, frame: bytes) -> bool:
+        return self._vad.is_speech(frame, SAMPLE_RATE)
+
+
+def make_vad():
+    """The VAD selected by VOICE_VAD; "auto" falls back to energy without webrtcvad."""
+    kind = VAD_SETTINGS["vad"]
+    if kind in ("auto", "webrtc"):
+        try:
+            return WebRtcVAD()
+        except ImportError:
+            if kind == "webrtc":
+                log.warning("webrtcvad not installed; using the energy VAD")
+    return EnergyVAD()
+
+
+def _text_of(payload: str, field: str = "text") -> str:
+    try:
+        return json.loads(payload).get(field, "").strip()
+    except ValueError:
+        return ""
+
+
+def _frames(ms: float) -> int:
+    return max(1, int(ms) // FRAME_MS)
+
+
+def stream_utterances(
+    recognizer,
+    read_audio: Callable[[], bytes],
+    stop: Optional[threading.Event] = None,
+    vad=None,
+) -> Iterator[Dict]:
+    """Segment live audio into utterances and recognize each one as soon as it ends.
+
+    `recognizer` is a 16 kHz `KaldiRecognizer`; `read_audio()` returns the
+    next chunk of 16-bit mono PCM (any length), b"" at end of input. Yields:
+
+    - {"type": "speech_start"}
+    - {"type": "partial", "text"}                       (changed partial hypotheses)
+    - {"type": "utterance", "index", "text", "duration", "latency"}
+      `latency` is the time from the last voiced frame to the final text:
+      the `end_silence_ms` wait plus the recognizer's finalization.
+
+    Stops when `stop` is set, the input ends, or no speech was heard for
+    VOICE_SESSION_IDLE seconds; a pending utterance is finalized first.
+    """
+    vad = vad or make_vad()
+    start_frames = _frames(VAD_SETTINGS["min_speech_ms"])
+    end_frames = _frames(VAD_SETTINGS["end_silence_ms"])
+    max_frames = _frames(VAD_SETTINGS["max_utterance"] * 1000)
+    idle_frames = _frames(VAD_SETTINGS["session_idle"] * 1000)
+
+    preroll: deque = deque(maxlen=max(_frames(PREROLL_MS), start_frames))
+    pending = b""
+    in_speech = False
+    voiced = silent = utt_frames = idle = 0
+    parts: List[str] = []
+    last_partial = ""
+    index = 0
+
+    def finalize(trailing_frames: int) -> Optional[Dict]:
+        nonlocal index, parts, last_partial
+        # audio arrives in real time: speech ended `trailing_frames` of silence ago
+        ended = time.perf_counter() - trailing_frames * FRAME_MS / 1000
+        parts.append(_text_of(recognizer.FinalResult()))
+        text = " ".join(p for p in parts if p)
+        parts, last_partial = [], ""
+        if not text:
+            incr("translator_voice_utterances_total", outcome="empty")
+            return None
+        latency = time.perf_counter() - ended
+        observe("translator_voice_final_latency_seconds", latency)
+        incr("translator_voice_utterances_total", outcome="ok")
+        index += 1
+        return {
+            "type": "utterance",
+            "index": index,
+            "text": text,
+            "duration": (utt_frames - trailing_frames) * FRAME_MS / 1000,
+            "latency": latency,
+        }
+
+    def accept(frame: bytes) -> None:
+        # Kaldi may end an utterance on its own inside a long VAD segment
+        if recognizer.AcceptWaveform(frame):
+            parts.append(_text_of(recognizer.Result()))
+
+    while not (stop is not None and stop.is_set()):
+        chunk = read_audio()
+        if not chunk:
+            break
+        pending += chunk
+        while len(pending) >= FRAME_BYTES:
+            frame, pending = pending[:FRAME_BYTES], pending[FRAME_BYTES:]
+            speech = vad.is_speech(frame)
+            if not in_speech:
+                preroll.append(frame)
+                voiced = voiced + 1 if speech else 0
+                idle = 0 if speech else idle + 1
+                if voiced >= start_frames:
+                    in_speech, silent, utt_frames = True, 0, len(preroll)
+                    for buffered in preroll:
+                        accept(buffered)
+                    preroll.clear()
+                    yield {"type": "speech_start"}
+                continue
+            accept(frame)
+            utt_frames += 1
+            silent = 0 if speech else silent + 1
+            if silent >= end_frames or utt_frames >= max_frames:
+                in_speech, voiced, idle = False, 0, silent
+                event = finalize(silent)
+                if event:
+                    yield event
+                continue
+            if utt_frames % PARTIAL_EVERY == 0:
+                partial = " ".join(parts + [_text_of(recognizer.PartialResult(), "partial")]).strip()
+                if partial and partial != last_partial:
+                    last_partial = partial
+                    yield {"type": "partial", "text": partial}
+        if not in_speech and idle >= idle_frames:
+            break
+
+    if in_speech:
+        event = finalize(silent)
+        if event:
+            yield event
+
+
+class OverlappedTranslator:
+    """Translate utterances while recognition continues; results come back in order.
+
+    `submit(index, text)` starts the translation right away on the shared
+    background loop (`submit_translation`); `on_result(index, text, result)`
+    is called once per utterance, in index order, from the loop thread. At
+    most `max_in_flight` translations run at once; `submit` blocks beyond that.
+    """
+
+    def __init__(
+        self,
+        on_result: Callable[[int, str, Dict], None],
+        source_lang: str,
+        target_lang: str,
+        scenario: str,
+        tone: str = "neutral",
+        include_advice: bool = False,
+        max_in_flight: int = 4,
+    ):
+        self.on_result = on_result
+        self.request = {
+            "source_lang": source_lang,
+            "target_lang": target_lang,
+            "scenario": scenario,
+            "tone": tone,
+            "include_advice": include_advice,
+        }
+        self._slots = threading.Semaphore(max_in_flight)
+        self._lock = threading.Lock()
+        self._done: Dict[int, tuple] = {}
+        self._futures: Dict[int, object] = {}
+        self._next = None
+
+    def submit(self, index: int, text: str) -> None:
+        self._slots.acquire()
+        with self._lock:
+            if self._next is None:
+                self._next = index
+            # registered before submitting: a cache hit may finish immediately
+            self._futures[index] = None
+        submitted = time.perf_counter()
+        future = submit_translation(source_text=text, **self.request)
+        with self._lock:
+            if index in self._futures:
+                self._futures[index] = future
+        future.add_done_callback(lambda f: self._finished(index, text, f, submitted))
+
+    def _finished(self, index: int, text: str, future, submitted: float) -> None:
+        self._slots.release()
+        observe("translator_voice_translation_seconds", time.perf_counter() - submitted)
+        try:
+            result = future.result()
+        except BaseException as e:
+            result = {"literal_translation": f"[Error] {e or type(e).__name__}", "natural_translation": [], "advice": ""}
+        ready = []
+        with self._lock:
+            self._done[index] = (text, result)
+            while self._next in self._done:
+                ready.append((self._next,) + self._done.pop(self._next))
+                self._futures.pop(self._next, None)
+                self._next += 1
+        for item in ready:
+            try:
+                self.on_result(*item)
+            except Exception:
+                log.exception("Voice translation callback failed")
+
+    def pending(self) -> int:
+        with self._lock:
+            return len(self._futures)
+
+    def wait(self, timeout: Optional[float] = None) -> bool:
+        """Block until every submitted utterance was delivered (or the timeout passed)."""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while self.pending():
+            if deadline is not None and time.monotonic() >= deadline:
+                return False
+            time.sleep(0.02)
+        return True
+
+    def cancel(self) -> None:
+        with self._lock:
+            futures = [f for f in self._futures.values() if f is not None]
+        for future in futures:
+            future.cancel()
@@ -0,0 +1,184 @@
+"""
+Incremental JSON parser for streamed model output.
+
+The Deepseek prompt returns one top-level object:
+
+    {"literal_translation": "...",
+     "natural_expressions": [{"text": "...", "explanation": "..."}, ...],
+     "cultural_advice": "..."}
+
+`StreamingJSONParser.feed(chunk)` scans only the newly received characters
+and returns events as soon as each piece is complete:
+
+- ("literal_translation", str)     when the literal translation string closes
+- ("natural_expression", dict)     for each completed natural_expressions item
+- ("advice_delta", str)            decoded text appended to cultural_advice
+- ("field", (key, value))          any other top-level field once complete
+
+Anything before the first "{" (e.g. a ```json fence) is ignored.
+"""
+
+from typing import Any, Dict, List, Tuple
+import json
+import re
+
+
+ADVICE_KEY = "cultural_advice"
+LITERAL_KEY = "literal_translation"
+NATURAL_KEY = "natural_expressions"
+
+# a \uD800-\uDBFF escape at the end: the low half of its surrogate pair is still to come
+_HIGH_SURROGATE_ESCAPE_RE = re.compile(r"\\u[dD][89abAB][0-9a-fA-F]{2}$")
+
+
+class StreamingJSONParser:
+    """Single-pass scanner over a growing buffer; O(total length) overall."""
+
+    def __init__(self):
+        self.buffer = ""
+        self.fields: Dict[str, Any] = {}
+        self.done = False
+        self._pos = 0
+        self._stack: List[str] = []
+        self._in_string = False
+        self._escape = False
+        self._string_start = -1
+        self._expect_key = True
+        self._key = None
+        self._value_start = -1
+        self._item_start = -1
+        self._advice_emitted = -1
+
+    def feed(self, chunk: str) -> List[Tuple[str, Any]]:
+        events: List[Tuple[str, Any]] = []
+        if not chunk or self.done:
+            return events
+        self.buffer += chunk
+        buf = self.buffer
+        i = self._pos
+        n = len(buf)
+        while i < n:
+            ch = buf[i]
+            depth = len(self._stack)
+            if self._in_string:
+                if self._escape:
+                    self._escape = False
+                elif ch == "\\":
+                    self._escape = True
+                elif ch == '"':
+                    self._in_string = False
+                    self._on_string_end(i, events)
+                i += 1
+                continue
+
+            if depth == 0:
+                if ch == "{":
+                    self._stack.append("{")
+                    self._expect_key = True
+                i += 1
+                continue
+
+            if ch == '"':
+                self._in_string = True
+                self._string_start = i
+                if depth == 1 and not self._expect_key:
+                    self._value_start = i
+                    if self._key == ADVICE_KEY:
+                        self._advice_emitted = i + 1
+            elif ch in "{[":
+                if depth == 1:
+                    self._value_start = i
+                elif depth == 2 and self._key == NATURAL_KEY and self._stack[-1] == "[":
+                    self._item_start = i
+                self._stack.append(ch)
+            elif ch in "}]":
+                self._stack.pop()
+                new_depth = len(self._stack)
+                if new_depth == 0:
+                    self._finish_scalar(i, events)
+                    self.done = True
+                    i += 1
+                    break
+                if new_depth == 2 and self._key == NATURAL_KEY and self._item_start >= 0:
+                    item = self._loads(buf[self._item_start:i + 1])
+                    self._item_start = -1
+                    if isinstance(item, dict):
+                        events.append(("natural_expression", item))
+                if new_depth == 1:
+                    self._finish_value(buf[self._value_start:i + 1], events)
+            elif depth == 1:
+                if ch == ":":
+                    self._expect_key = False
+                    self._value_start = -1
+                elif ch == ",":
+                    self._finish_scalar(i, events)
+                    self._expect_key = True
+                elif not ch.isspace() and not self._expect_key and self._value_start < 0:
+                    # number / true / false / null
+                    self._value_start = i
+            i += 1
+        self._pos = i
+        if self._in_string and len(self._stack) == 1 and self._key == ADVICE_KEY and not self._expect_key:
+            self._emit_advice_delta(n, events, final=False)
+        return events
+
+    def _on_string_end(self, i: int, events: List[Tuple[str, Any]]) -> None:
+        if len(self._stack) != 1:
+            return
+        raw = self.buffer[self._string_start:i + 1]
+        if self._expect_key:
+            self._key = self._loads(raw)
+            return
+        if self._key == ADVICE_KEY:
+            self._emit_advice_delta(i, events, final=True)
+        self._finish_value(raw, events)
+
+    def _finish_scalar(self, i: int, events: List[Tuple[str, Any]]) -> None:
+        # Close a bare number/literal value that ends at a "," or "}"
+        if not self._expect_key and self._value_start >= 0 and self._key not in self.fields:
+            raw = self.buffer[self._value_start:i].strip()
+            if raw and raw[0] not in '"{[':
+                self._finish_value(raw, events)
+
+    def _finish_value(self, raw: str, events: List[Tuple[str, Any]]) -> None:
+        key = self._key
+        value = self._loads(raw)
+        self._value_start = -1
+        if key is None:
+            return
+        self.fields[key] = value
+        if key == LITERAL_KEY:
+            events.append((LITERAL_KEY, value))
+        elif key not in (NATURAL_KEY, ADVICE_KEY):
+            events.append(("field", (key, value)))
+
+    def _emit_advice_delta(self, end: int, events: List[Tuple[str, Any]], final: bool) -> None:
+        raw = self.buffer[self._advice_emitted:end]
+        if not final:
+            # Hold back a possibly incomplete escape sequence (e.g. "\u00")
+            cut = raw.rfind("\\", max(0, len(raw) - 12))
+            if cut >= 0:
+                raw = raw[:cut]
+        if not raw:
+            return
+        try:
+            text = json.loads('"' + raw + '"', strict=False)
+        except ValueError:
+            if final:
+                text = raw
+            else:
+                return
+        if not final and text and "\ud800" <= text[-1] <= "\udbff" and _HIGH_SURROGATE_ESCAPE_RE.search(raw):
+            # an emoji escaped as "\ud83d\ude00" must not be split across deltas
+            raw, text = raw[:-6], text[:-1]
+            if not raw:
+                return
+        self._advice_emitted += len(raw)
+        events.append(("advice_delta", text))
+
+    @staticmethod
+    def _loads(raw: str):
+        try:
+            return json.loads(raw, strict=False)
+        except ValueError:
+            return None
@@ -0,0 +1,29 @@
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from streaming_json import ADVICE_KEY, StreamingJSONParser
+
+
+def _advice_deltas(payload: str, chunk_size: int):
+    parser = StreamingJSONParser()
+    deltas = []
+    for i in range(0, len(payload), chunk_size):
+        deltas.extend(value for kind, value in parser.feed(payload[i:i + chunk_size]) if kind == "advice_delta")
+    return deltas
+
+
+def test_escaped_emoji_is_not_split_across_advice_deltas():
+    payload = '{"literal_translation": "hi", "' + ADVICE_KEY + '": "hi \\ud83d\\ude00 end of advice"}'
+    for chunk_size in range(1, 16):
+        deltas = _advice_deltas(payload, chunk_size)
+        assert "".join(deltas) == "hi \U0001F600 end of advice"
+        for delta in deltas:
+            delta.encode("utf-8")  # a lone surrogate cannot be encoded
+
+
+def test_escapes_split_anywhere_decode_once():
+    payload = '{"' + ADVICE_KEY + '": "line\\none \\"quoted\\" caf\\u00e9 \\\\ done"}'
+    for chunk_size in range(1, 10):
+        assert "".join(_advice_deltas(payload, chunk_size)) == 'line\none "quoted" café \\ done'
@@ -0,0 +1,145 @@
+"""
+Language-aware sentence segmentation for Chinese, Japanese and English text.
+
+Text is cut into `(sentence, separator)` pairs; joining every sentence with
+the separator that follows it gives the text back (trailing whitespace
+trimmed and runs of blank lines collapsed to one), so translated segments
+can be stitched in place of the originals.
+
+- Line breaks are kept as separators ("\\n", or "\\n\\n" between paragraphs).
+- zh / ja: a sentence ends after 。！？ (and ASCII !?, full-width ．, "……"),
+  with or without a following space; a quotation such as 「はい。」と言った
+  or “走吧。”他说 stays inside its sentence unless another quotation follows.
+- en: a sentence ends after . ! ? (plus closing quotes / brackets) followed
+  by whitespace and a word that is not lower-case; common abbreviations
+  ("Mr.", "e.g.", "U.S.") and initials do not end a sentence. CJK
+  terminators end sentences in English text too.
+- `iter_segments` reads lines lazily, so a file can be segmented without
+  loading it (memory stays bounded by the longest line).
+"""
+
+from typing import Iterable, Iterator, List, Tuple, Union
+import io
+import re
+
+
+# (sentence, separator that follows it)
+Segment = Tuple[str, str]
+
+CJK_LANGS = ("zh", "ja")
+
+_CLOSERS = "\"'”’」』）)】〕》〉]"
+_OPENERS = "\"'“‘「『（(【〔《〈["
+_CJK_END_RE = re.compile(rf"(?:[。！？．!?]+|…{{2,}})[{re.escape(_CLOSERS)}]*\s*")
+_LATIN_END_RE = re.compile(
+    rf"(?:[.!?…]+[{re.escape(_CLOSERS)}]*(?:\s+|$)|[。！？]+[{re.escape(_CLOSERS)}]*\s*)"
+)
+_LAST_WORD_RE = re.compile(r"(\S+)[.!?…]+[^\s]*\s*$")
+# soft break points for cutting an over-long sentence
+_SOFT_BREAK_RE = re.compile(r"[，、,;；:：]\s*|\s+")
+
+ABBREVIATIONS = {
+    "mr", "mrs", "ms", "dr", "prof", "sr", "jr", "st", "mt", "vs", "etc", "e.g", "i.e", "cf", "approx",
+    "inc", "ltd", "co", "corp", "no", "vol", "fig", "dept", "est", "u.s", "u.k", "a.m", "p.m",
+    "jan", "feb", "mar", "apr", "jun", "jul", "aug", "sep", "sept", "oct", "nov", "dec",
+}
+
+
+def _cjk_boundary(line: str, match) -> bool:
+    """Whether a zh / ja terminator match really ends the sentence."""
+    if match.group().rstrip()[-1:] not in _CLOSERS:
+        return True
+    # 「はい。」と言った: the quotation is part of the sentence
+    return line[match.end():match.end() + 1] in _OPENERS
+
+
+def _latin_boundary(line: str, match) -> bool:
+    """Whether an English terminator match really ends the sentence."""
+    if match.group().strip()[:1] in "。！？":
+        return True
+    rest = line[match.end():]
+    if rest[:1].islower():
+        return False
+    word = _LAST_WORD_RE.search(line, 0, match.end())
+    if word is not None and match.group().startswith("."):
+        token = word.group(1).lower().strip(_CLOSERS + "(")
+        if token in ABBREVIATIONS or (len(token) == 1 and token.isalpha()):
+            return False
+    return True
+
+
+def split_sentences(line: str, lang: str = "en") -> List[Segment]:
+    """Sentences of one line of text; the last separator is ""."""
+    line = line.strip()
+    if not line:
+        return []
+    cjk = lang in CJK_LANGS
+    pattern = _CJK_END_RE if cjk else _LATIN_END_RE
+    segments: List[Segment] = []
+    start = 0
+    for match in pattern.finditer(line):
+        if match.end() >= len(line):
+            break
+        if not (_cjk_boundary(line, match) if cjk else _latin_boundary(line, match)):
+            continue
+        text = match.group()
+        body = text.rstrip()
+        segments.append((line[start:match.start()] + body, text[len(body):]))
+        start = match.end()
+    segments.append((line[start:], ""))
+    return segments
+
+
+def split_long(sentence: str, limit: int) -> List[str]:
+    """Cut a sentence longer than `limit` characters at soft breaks (commas, spaces)."""
+    pieces = []
+    while len(sentence) > limit:
+        cut = 0
+        for match in _SOFT_BREAK_RE.finditer(sentence, 0, limit):
+            cut = match.end()
+        if cut <= 0:
+            cut = limit
+        pieces.append(sentence[:cut])
+        sentence = sentence[cut:]
+    if sentence:
+        pieces.append(sentence)
+    return pieces
+
+
+def _lines(source: Union[str, Iterable[str]]) -> Iterator[Tuple[str, str]]:
+    """(line, separator) for the non-blank lines; blank lines become a "\\n\\n" separator."""
+    lines = io.StringIO(source) if isinstance(source, str) else source
+    previous = None
+    blank = False
+    for raw in lines:
+        line = raw.rstrip("\r\n").strip()
+        if not line:
+            blank = previous is not None
+            continue
+        if previous is not None:
+            yield previous, "\n\n" if blank else "\n"
+        previous, blank = line, False
+    if previous is not None:
+        yield previous, ""
+
+
+def iter_segments(source: Union[str, Iterable[str]], lang: str = "en") -> Iterator[Segment]:
+    """Segment a string or an iterable of lines (e.g. an open file) lazily."""
+    for line, line_sep in _lines(source):
+        sentences = split_sentences(line, lang)
+        for text, sep in sentences[:-1]:
+            yield text, sep
+        yield sentences[-1][0], line_sep
+
+
+def segment(text: str, lang: str = "en") -> List[Segment]:
+    return list(iter_segments(text, lang))
+
+
+def join_segments(segments: Iterable[Segment]) -> str:
+    return "".join(text + sep for text, sep in segments)
+
+
+def joiner(lang: str) -> str:
+    """What goes between two sentences of the same line in `lang`."""
+    return "" if lang in CJK_LANGS else " "
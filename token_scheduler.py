@@ -0,0 +1,222 @@
+"""
+Rate-limit-aware scheduling across the tokens configured in credentials.json.
+
+`credentials.json` may list several named tokens (`deepseek-main`,
+`deepseek-alt`, ...). Instead of always using one, the scheduler spreads
+requests across all of them:
+
+- per-token in-flight counts and an EWMA of request latency;
+- 429 / 5xx / connection failures put the token into a jittered,
+  exponentially growing cooldown (honoring Retry-After when present);
+- the next request goes to the healthy token with the lowest
+  latency * (1 + in_flight) score.
+
+Callers take a `TokenLease` with `acquire()` and hand it back with
+`release()` (or use it as a context manager).
+"""
+
+from typing import Dict, Mapping, Optional
+import random
+import threading
+import time
+
+
+DEFAULT_API_URL = "https://api.deepseek.com"
+
+
+class TokenState:
+    """Live health and load statistics for one (token, api_url)."""
+
+    def __init__(self, name: str, token: str, api_url: str):
+        self.name = name
+        self.token = token
+        self.api_url = api_url
+        self.in_flight = 0
+        self.ewma_latency: Optional[float] = None
+        self.requests = 0
+        self.failures = 0
+        self.throttled = 0
+        self.consecutive_failures = 0
+        self.cooldown_until = 0.0
+
+    def healthy(self, now: float) -> bool:
+        return now >= self.cooldown_until
+
+    def score(self) -> float:
+        # Untried tokens score 0 so they get sampled early
+        return (self.ewma_latency or 0.0) * (1 + self.in_flight)
+
+    def snapshot(self) -> Dict:
+        return {
+            "name": self.name,
+            "in_flight": self.in_flight,
+            "ewma_latency": self.ewma_latency,
+            "requests": self.requests,
+            "failures": self.failures,
+            "throttled": self.throttled,
+            "cooldown_remaining": max(0.0, self.cooldown_until - time.time()),
+        }
+
+
+class TokenLease:
+    """One scheduled request on a token; release exactly once."""
+
+    def __init__(self, scheduler: "TokenScheduler", state: TokenState):
+        self.scheduler = scheduler
+        self.state = state
+        self.token = state.token
+        self.api_url = state.api_url
+        self.name = state.name
+        self.started = time.perf_counter()
+        self._released = False
+
+    def release(self, error: Optional[BaseException] = None) -> None:
+        if self._released:
+            return
+        self._released = True
+        self.scheduler._release(self.state, time.perf_counter() - self.started, error)
+
+    def cancel(self) -> None:
+        """Give the slot back without recording latency or errors."""
+        if self._released:
+            return
+        self._released = True
+        self.scheduler._cancel(self.state)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.release(exc)
+        return False
+
+
+def _status_code(error: BaseException) -> Optional[int]:
+    status = getattr(error, "status_code", None)
+    if status is None:
+        response = getattr(error, "response", None)
+        status = getattr(response, "status_code", None)
+    return status if isinstance(status, int) else None
+
+
+def _retry_after(error: BaseException) -> Optional[float]:
+    response = getattr(error, "response", None)
+    headers = getattr(response, "headers", None)
+    if not headers:
+        return None
+    try:
+        return float(headers.get("retry-after"))
+    except (TypeError, ValueError):
+        return None
+
+
+class TokenScheduler:
+    """Thread-safe least-loaded / lowest-latency token picker with cooldowns."""
+
+    def __init__(self, alpha: float = 0.3, base_cooldown: float = 2.0, max_cooldown: float = 120.0):
+        self.alpha = alpha
+        self.base_cooldown = base_cooldown
+        self.max_cooldown = max_cooldown
+        self._states: Dict[str, TokenState] = {}
+        self._source: Optional[Mapping] = None
+        self._lock = threading.Lock()
+
+    def sync(self, tokens: Mapping) -> None:
+        """Reconcile with a credentials token table {name: {token, api_url}}.
+
+        Cheap to call on every request: it is a no-op for the same snapshot.
+        """
+        if tokens is self._source:
+            return
+        with self._lock:
+            states = {}
+            for name, entry in (tokens or {}).items():
+                token = entry.get("token") if isinstance(entry, Mapping) else None
+                if not token:
+                    continue
+                api_url = entry.get("api_url") or DEFAULT_API_URL
+                state = self._states.get(name)
+                if state is None or state.token != token or state.api_url != api_url:
+                    state = TokenState(name, token, api_url)
+                states[name] = state
+            # keep ad-hoc (pinned / env) entries registered through `pin`
+            for name, state in self._states.items():
+                if name.startswith("env:"):
+                    states.setdefault(name, state)
+            self._states = states
+            self._source = tokens
+
+    def pin(self, name: str, token: str, api_url: str) -> TokenLease:
+        """Lease a specific token (explicit token_name or environment override)."""
+        with self._lock:
+            state = self._states.get(name)
+            if state is None or state.token != token or state.api_url != api_url:
+                state = TokenState(name, token, api_url)
+                self._states[name] = state
+            state.in_flight += 1
+        return TokenLease(self, state)
+
+    def acquire(self, exclude=()) -> Optional[TokenLease]:
+        """Lease the best token, or None if no token is configured.
+
+        If every token is cooling down, the one whose cooldown ends first is
+        used rather than failing the request outright.
+        """
+        now = time.time()
+        with self._lock:
+            candidates = [s for n, s in self._states.items() if n not in exclude and not n.startswith("env:")]
+            if not candidates:
+                return None
+            healthy = [s for s in candidates if s.healthy(now)]
+            if healthy:
+                best_score = min(s.score() for s in healthy)
+                best = [s for s in healthy if s.score() <= best_score * 1.1 + 1e-9]
+                state = min(best, key=lambda s: (s.in_flight, s.requests))
+            else:
+                state = min(candidates, key=lambda s: s.cooldown_until)
+            state.in_flight += 1
+        return TokenLease(self, state)
+
+    def _release(self, state: TokenState, latency: float, error: Optional[BaseException]) -> None:
+        with self._lock:
+            state.in_flight = max(0, state.in_flight - 1)
+            state.requests += 1
+            if error is None:
+                state.consecutive_failures = 0
+                if state.ewma_latency is None:
+                    state.ewma_latency = latency
+                else:
+                    state.ewma_latency = self.alpha * latency + (1 - self.alpha) * state.ewma_latency
+                return
+            state.failures += 1
+            status = _status_code(error)
+            if status is not None and 400 <= status < 500 and status not in (408, 429):
+                # request-specific error (bad input); not a token health problem,
+                # except for auth failures which will not recover by themselves
+                if status in (401, 403):
+                    state.cooldown_until = time.time() + self.max_cooldown
+                return
+            if status == 429:
+                state.throttled += 1
+            state.consecutive_failures += 1
+            cooldown = min(self.max_cooldown, self.base_cooldown * (2 ** (state.consecutive_failures - 1)))
+            cooldown *= random.uniform(0.5, 1.5)
+            retry_after = _retry_after(error)
+            if retry_after:
+                cooldown = max(cooldown, retry_after)
+            state.cooldown_until = time.time() + cooldown
+
+    def _cancel(self, state: TokenState) -> None:
+        with self._lock:
+            state.in_flight = max(0, state.in_flight - 1)
+
+    def stats(self) -> Dict[str, Dict]:
+        with self._lock:
+            return {name: state.snapshot() for name, state in self._states.items()}
+
+
+_default_scheduler = TokenScheduler()
+
+
+def get_scheduler() -> TokenScheduler:
+    return _default_scheduler
@@ -0,0 +1,171 @@
+"""
+Persistent translation result cache.
+
+A small SQLite-backed, content-addressed cache that sits in front of the
+Deepseek call in `translator_core_new.generate_translation_and_advice`.
+
+- Keys are a SHA-256 of (text, source_lang, target_lang, scenario, tone, version).
+  `version` is tied to the prompt template so changing the prompt invalidates
+  old entries automatically.
+- Entries expire after `ttl_seconds` and the table is kept under `max_entries`
+  by evicting the least recently used rows.
+- Hit / miss / eviction counters are available via `stats()`.
+"""
+
+from typing import Dict, Optional
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+
+from translation_logging import get_logger
+
+
+log = get_logger("translator.cache")
+
+
+DEFAULT_CACHE_PATH = os.environ.get("TRANSLATION_CACHE_PATH", "translation_cache.sqlite3")
+DEFAULT_TTL_SECONDS = int(os.environ.get("TRANSLATION_CACHE_TTL", str(7 * 24 * 3600)))
+DEFAULT_MAX_ENTRIES = int(os.environ.get("TRANSLATION_CACHE_MAX_ENTRIES", "20000"))
+
+
+def make_cache_key(
+    source_text: str,
+    source_lang: str,
+    target_lang: str,
+    scenario: str,
+    tone: str,
+    version: str = "",
+) -> str:
+    """Return a stable content hash for a translation request."""
+    payload = json.dumps(
+        [source_text, source_lang, target_lang, scenario, tone, version],
+        ensure_ascii=False,
+        separators=(",", ":"),
+    )
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class TranslationCache:
+    """Thread-safe SQLite cache with TTL and size-bounded LRU eviction."""
+
+    def __init__(
+        self,
+        path: str = DEFAULT_CACHE_PATH,
+        ttl_seconds: int = DEFAULT_TTL_SECONDS,
+        max_entries: int = DEFAULT_MAX_ENTRIES,
+    ):
+        self.path = path
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS results ("
+            " key TEXT PRIMARY KEY,"
+            " value TEXT NOT NULL,"
+            " created_at REAL NOT NULL,"
+            " last_access REAL NOT NULL)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_results_access ON results(last_access)")
+
+    def get(self, key: str) -> Optional[Dict]:
+        """Return the cached result for `key`, or None on miss / expiry."""
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT value, created_at FROM results WHERE key = ?", (key,)
+            ).fetchone()
+            if row is None:
+                self.misses += 1
+                return None
+            value, created_at = row
+            if self.ttl_seconds and now - created_at > self.ttl_seconds:
+                self._conn.execute("DELETE FROM results WHERE key = ?", (key,))
+                self.evictions += 1
+                self.misses += 1
+                return None
+            self._conn.execute("UPDATE results SET last_access = ? WHERE key = ?", (now, key))
+            self.hits += 1
+        try:
+            return json.loads(value)
+        except Exception:
+            return None
+
+    def put(self, key: str, result: Dict) -> None:
+        """Store `result` under `key` and evict LRU rows above `max_entries`."""
+        now = time.time()
+        value = json.dumps(result, ensure_ascii=False)
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO results (key, value, created_at, last_access) VALUES (?, ?, ?, ?)",
+                (key, value, now, now),
+            )
+            if self.max_entries:
+                count = self._conn.execute("SELECT COUNT(*) FROM results").fetchone()[0]
+                overflow = count - self.max_entries
+                if overflow > 0:
+                    self._conn.execute(
+                        "DELETE FROM results WHERE key IN ("
+                        " SELECT key FROM results ORDER BY last_access ASC LIMIT ?)",
+                        (overflow,),
+                    )
+                    self.evictions += overflow
+
+    def purge_expired(self) -> int:
+        """Delete all expired rows and return how many were removed."""
+        if not self.ttl_seconds:
+            return 0
+        with self._lock:
+            cur = self._conn.execute(
+                "DELETE FROM results WHERE created_at < ?", (time.time() - self.ttl_seconds,)
+            )
+            removed = cur.rowcount or 0
+            self.evictions += removed
+        return removed
+
+    def clear(self) -> None:
+        with self._lock:
+            self._conn.execute("DELETE FROM results")
+
+    def stats(self) -> Dict[str, float]:
+        with self._lock:
+            size = self._conn.execute("SELECT COUNT(*) FROM results").fetchone()[0]
+        total = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "size": size,
+            "hit_rate": (self.hits / total) if total else 0.0,
+        }
+
+
+_default_cache: Optional[TranslationCache] = None
+_default_cache_lock = threading.Lock()
+
+
+def get_default_cache() -> Optional[TranslationCache]:
+    """Return the process-wide cache, or None if disabled / unavailable.
+
+    Set TRANSLATION_CACHE_DISABLED=1 to turn the cache off.
+    """
+    global _default_cache
+    if os.environ.get("TRANSLATION_CACHE_DISABLED") == "1":
+        return None
+    if _default_cache is None:
+        with _default_cache_lock:
+            if _default_cache is None:
+                try:
+                    _default_cache = TranslationCache()
+                except Exception as e:
+                    log.warning("Translation cache unavailable: %s", e)
+                    return None
+    return _default_cache
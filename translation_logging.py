@@ -0,0 +1,164 @@
+"""
+Leveled, non-blocking logging for the translation core.
+
+All core modules log through loggers under "translator" (see `get_logger`).
+Records are put on a bounded in-memory queue and written by a background
+listener thread, so a slow terminal, pipe or disk never stalls a
+translation; when the queue is full, records are dropped and counted.
+
+Configuration (environment variables or `configure(...)`):
+- TRANSLATION_LOG_LEVEL        DEBUG / INFO / WARNING (default) / ERROR
+- TRANSLATION_LOG_FILE         write to this file instead of stderr
+- TRANSLATION_LOG_SAMPLE_RATE  fraction of DEBUG/INFO records kept (default 1.0);
+                               warnings and errors are always kept
+- TRANSLATION_LOG_MAX_CHARS    messages are truncated to this length (default 500)
+- TRANSLATION_LOG_RAW          "1" to capture raw model payloads (off by default)
+- TRANSLATION_LOG_RAW_MAX_CHARS  truncation limit for raw payloads (default 20000)
+"""
+
+from typing import Optional
+import atexit
+import logging
+import logging.handlers
+import os
+import queue
+import random
+import threading
+
+
+ROOT_LOGGER = "translator"
+RAW_LOGGER = "translator.raw"
+
+_settings = {
+    "level": os.environ.get("TRANSLATION_LOG_LEVEL", "WARNING").upper(),
+    "file": os.environ.get("TRANSLATION_LOG_FILE") or None,
+    "sample_rate": float(os.environ.get("TRANSLATION_LOG_SAMPLE_RATE", "1.0")),
+    "max_chars": int(os.environ.get("TRANSLATION_LOG_MAX_CHARS", "500")),
+    "raw": os.environ.get("TRANSLATION_LOG_RAW") == "1",
+    "raw_max_chars": int(os.environ.get("TRANSLATION_LOG_RAW_MAX_CHARS", "20000")),
+}
+
+_setup_lock = threading.Lock()
+_listener: Optional[logging.handlers.QueueListener] = None
+_queue_handler: Optional["_DroppingQueueHandler"] = None
+_stopped = False
+
+
+def truncate(text: str, limit: int) -> str:
+    if limit <= 0 or len(text) <= limit:
+        return text
+    return f"{text[:limit]}... [truncated {len(text) - limit} chars]"
+
+
+class _SamplingFilter(logging.Filter):
+    """Keep a fraction of DEBUG/INFO records; never drop warnings or errors."""
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        rate = _settings["sample_rate"]
+        if record.levelno >= logging.WARNING or rate >= 1.0:
+            return True
+        return random.random() < rate
+
+
+class _DroppingQueueHandler(logging.handlers.QueueHandler):
+    """QueueHandler that truncates messages and never blocks on a full queue."""
+
+    def __init__(self, log_queue: "queue.Queue"):
+        super().__init__(log_queue)
+        self.dropped = 0
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        record = super().prepare(record)
+        limit = _settings["raw_max_chars"] if record.name == RAW_LOGGER else _settings["max_chars"]
+        record.msg = truncate(record.msg, limit)
+        return record
+
+    def enqueue(self, record: logging.LogRecord) -> None:
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+
+def _build_output_handler() -> logging.Handler:
+    if _settings["file"]:
+        handler: logging.Handler = logging.FileHandler(_settings["file"], encoding="utf-8")
+    else:
+        handler = logging.StreamHandler()
+    handler.setFormatter(logging.Formatter("%(asctime)s %(levelname)s %(name)s: %(message)s"))
+    return handler
+
+
+def _setup() -> None:
+    global _listener, _queue_handler
+    with _setup_lock:
+        if _listener is not None:
+            return
+        log_queue: "queue.Queue" = queue.Queue(maxsize=10000)
+        _queue_handler = _DroppingQueueHandler(log_queue)
+        _queue_handler.addFilter(_SamplingFilter())
+        root = logging.getLogger(ROOT_LOGGER)
+        root.addHandler(_queue_handler)
+        root.setLevel(_settings["level"])
+        root.propagate = False
+        logging.getLogger(RAW_LOGGER).setLevel(logging.DEBUG if _settings["raw"] else logging.CRITICAL + 1)
+        _listener = logging.handlers.QueueListener(log_queue, _build_output_handler(), respect_handler_level=True)
+        _listener.start()
+        atexit.register(shutdown)
+
+
+def get_logger(name: str = ROOT_LOGGER) -> logging.Logger:
+    """Logger under the "translator" hierarchy, with the async sink installed."""
+    if _listener is None:
+        _setup()
+    if name != ROOT_LOGGER and not name.startswith(ROOT_LOGGER + "."):
+        name = f"{ROOT_LOGGER}.{name}"
+    return logging.getLogger(name)
+
+
+def configure(
+    level: Optional[str] = None,
+    sample_rate: Optional[float] = None,
+    max_chars: Optional[int] = None,
+    raw: Optional[bool] = None,
+    raw_max_chars: Optional[int] = None,
+) -> None:
+    """Adjust logging at runtime; None leaves a setting unchanged."""
+    if _listener is None:
+        _setup()
+    if level is not None:
+        _settings["level"] = level.upper()
+        logging.getLogger(ROOT_LOGGER).setLevel(_settings["level"])
+    if sample_rate is not None:
+        _settings["sample_rate"] = sample_rate
+    if max_chars is not None:
+        _settings["max_chars"] = max_chars
+    if raw_max_chars is not None:
+        _settings["raw_max_chars"] = raw_max_chars
+    if raw is not None:
+        _settings["raw"] = raw
+        logging.getLogger(RAW_LOGGER).setLevel(logging.DEBUG if raw else logging.CRITICAL + 1)
+
+
+def raw_capture_enabled() -> bool:
+    return _settings["raw"]
+
+
+def log_raw_payload(kind: str, payload: str) -> None:
+    """Record a raw model payload, only when raw capture is switched on."""
+    if not _settings["raw"]:
+        return
+    get_logger(RAW_LOGGER).debug("%s (%d chars):\n%s", kind, len(payload), payload)
+
+
+def dropped_records() -> int:
+    return _queue_handler.dropped if _queue_handler is not None else 0
+
+
+def shutdown() -> None:
+    """Flush queued records and stop the listener thread."""
+    global _stopped
+    with _setup_lock:
+        if _listener is not None and not _stopped:
+            _stopped = True
+            _listener.stop()
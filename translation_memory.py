@@ -0,0 +1,379 @@
+"""
+Translation memory with fuzzy (near-duplicate) retrieval.
+
+Past `generate_translation_and_advice` results are stored per
+(source_lang, target_lang, scenario, tone) scope and indexed with MinHash
+over character trigrams plus LSH banding, so "Where is the station?" finds
+"Where's the train station?" without scanning the table.
+
+- `lookup()` hashes the query (a few hundred microseconds), fetches the
+  LSH candidates with a clustered range scan, ranks them by MinHash
+  agreement and confirms the best few with exact trigram Jaccard similarity.
+- A match is returned directly only when it is the same text after
+  normalization, or when it reaches the serve threshold (raised for long
+  texts, where one changed word barely moves the score) and has the same
+  numbers, negations and date words (`key_terms`). Any other match is only
+  used as a few-shot reference in the prompt, so "will not arrive" or
+  "800 units" never gets the stored translation of "will arrive" / "500 units".
+- Everything lives in SQLite on disk, so memory use stays bounded with
+  millions of segments; the table is capped at `max_segments` by evicting
+  the least recently used rows.
+
+Configuration:
+- TRANSLATION_MEMORY_PATH               (default translation_memory.sqlite3)
+- TRANSLATION_MEMORY_MAX_SEGMENTS       (default 1000000)
+- TRANSLATION_MEMORY_SERVE_THRESHOLD    similarity for serving a non-identical match (default 0.95)
+- TRANSLATION_MEMORY_FEWSHOT_THRESHOLD  (default 0.5)
+- TRANSLATION_MEMORY_DISABLED=1         turns it off
+"""
+
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+import hashlib
+import json
+import os
+import random
+import re
+import sqlite3
+import struct
+import threading
+import time
+import unicodedata
+
+from translation_logging import get_logger
+
+
+log = get_logger("translator.memory")
+
+
+DEFAULT_MEMORY_PATH = os.environ.get("TRANSLATION_MEMORY_PATH", "translation_memory.sqlite3")
+DEFAULT_MAX_SEGMENTS = int(os.environ.get("TRANSLATION_MEMORY_MAX_SEGMENTS", "1000000"))
+SERVE_THRESHOLD = float(os.environ.get("TRANSLATION_MEMORY_SERVE_THRESHOLD", "0.95"))
+FEWSHOT_THRESHOLD = float(os.environ.get("TRANSLATION_MEMORY_FEWSHOT_THRESHOLD", "0.5"))
+
+NUM_PERM = 48
+BANDS = 16
+ROWS = NUM_PERM // BANDS  # LSH threshold ~ (1/BANDS) ** (1/ROWS) ~ 0.4
+SHINGLE = 3
+# the serve threshold applies as is up to this many normalized characters;
+# longer texts must be proportionally closer
+SERVE_LENGTH = 40
+MAX_CANDIDATES = 32
+_SIG_STRUCT = struct.Struct(f"<{NUM_PERM}I")
+
+_MASK64 = (1 << 64) - 1
+# Fixed seed: signatures are persisted, so the hash family must never change
+_rng = random.Random(20240611)
+_PERMS = [(_rng.getrandbits(64) | 1, _rng.getrandbits(64)) for _ in range(NUM_PERM)]
+
+_PUNCT_RE = re.compile(r"[^\w\s]", re.UNICODE)
+_SPACE_RE = re.compile(r"\s+")
+# CJK text has no word spaces: drop the ones punctuation removal left behind
+_CJK_SPACE_RE = re.compile(r"(?<=[\u3040-\u30ff\u3400-\u9fff]) | (?=[\u3040-\u30ff\u3400-\u9fff])")
+
+
+def normalize(text: str) -> str:
+    """Case-fold, drop punctuation and collapse whitespace (full-width forms folded by NFKC)."""
+    text = unicodedata.normalize("NFKC", text).casefold()
+    text = _PUNCT_RE.sub(" ", text)
+    text = _SPACE_RE.sub(" ", text).strip()
+    return _CJK_SPACE_RE.sub("", text)
+
+
+_NUMBER_RE = re.compile(r"\d+(?:[.,:/]\d+)*|[〇零一二三四五六七八九十百千万萬億亿两兩]+")
+_WORD_RE = re.compile(r"[a-z]+(?:'[a-z]+)?")
+_NEGATION_WORDS = {
+    "no", "not", "never", "none", "nobody", "nothing", "nowhere", "neither", "nor", "without", "cannot",
+}
+_CJK_NEGATION_RE = re.compile(r"不|没|沒|别|別|无|無|未|非|莫|勿|ない|ません|なかった|ず")
+_DATE_WORDS = {
+    "january", "february", "march", "april", "may", "june", "july", "august", "september", "october",
+    "november", "december", "jan", "feb", "mar", "apr", "jun", "jul", "aug", "sep", "sept", "oct", "nov",
+    "dec", "monday", "tuesday", "wednesday", "thursday", "friday", "saturday", "sunday", "today",
+    "tomorrow", "yesterday", "tonight", "morning", "afternoon", "evening", "night", "week", "month", "year",
+}
+
+
+def key_terms(text: str) -> Tuple[Tuple[str, ...], int, Tuple[str, ...]]:
+    """(numbers, negation count, date words) of a text; a match that differs
+    in any of them is a different sentence, however similar it looks."""
+    text = unicodedata.normalize("NFKC", text).casefold().replace("’", "'")
+    words = _WORD_RE.findall(text)
+    negations = sum(1 for w in words if w in _NEGATION_WORDS or w.endswith("n't"))
+    negations += len(_CJK_NEGATION_RE.findall(text))
+    return tuple(_NUMBER_RE.findall(text)), negations, tuple(w for w in words if w in _DATE_WORDS)
+
+
+def servable(query: str, match: Dict, threshold: float = SERVE_THRESHOLD) -> bool:
+    """Whether a `lookup` match may be returned for `query` without a model call."""
+    norm = normalize(query)
+    if norm == normalize(match["source_text"]):
+        return True
+    required = 1.0 - (1.0 - threshold) * min(1.0, SERVE_LENGTH / max(1, len(norm)))
+    return match["similarity"] >= required and key_terms(query) == key_terms(match["source_text"])
+
+
+def shingles(text: str) -> Set[str]:
+    norm = normalize(text)
+    if len(norm) <= SHINGLE:
+        return {norm} if norm else set()
+    return {norm[i:i + SHINGLE] for i in range(len(norm) - SHINGLE + 1)}
+
+
+def jaccard(a: Set[str], b: Set[str]) -> float:
+    if not a or not b:
+        return 0.0
+    return len(a & b) / len(a | b)
+
+
+def _shingle_hash(shingle: str) -> int:
+    return int.from_bytes(hashlib.blake2b(shingle.encode("utf-8"), digest_size=8).digest(), "little")
+
+
+def minhash(shingle_set: Set[str]) -> List[int]:
+    """MinHash signature using multiply-shift hashing (32-bit values)."""
+    hashes = [_shingle_hash(s) for s in shingle_set]
+    return [min(((a * x + b) & _MASK64) >> 32 for x in hashes) for a, b in _PERMS]
+
+
+def _scope(source_lang: str, target_lang: str, scenario: str, tone: str) -> str:
+    return f"{source_lang}|{target_lang}|{scenario}|{tone}"
+
+
+def _band_keys(scope: str, signature: List[int]) -> List[int]:
+    """One signed 64-bit key per LSH band (SQLite INTEGER range), scoped by settings."""
+    keys = []
+    for band in range(BANDS):
+        rows = signature[band * ROWS:(band + 1) * ROWS]
+        digest = hashlib.blake2b(
+            struct.pack(f"<H{ROWS}I", band, *rows) + scope.encode("utf-8"), digest_size=8
+        ).digest()
+        keys.append(struct.unpack("<q", digest)[0])
+    return keys
+
+
+class TranslationMemory:
+    """Thread-safe SQLite translation memory with a MinHash/LSH index."""
+
+    def __init__(self, path: str = DEFAULT_MEMORY_PATH, max_segments: int = DEFAULT_MAX_SEGMENTS):
+        self.path = path
+        self.max_segments = max_segments
+        self.lookups = 0
+        self.served = 0
+        self.fewshot = 0
+        self.evictions = 0
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS segments ("
+            " id INTEGER PRIMARY KEY,"
+            " scope TEXT NOT NULL,"
+            " source_text TEXT NOT NULL,"
+            " result TEXT NOT NULL,"
+            " signature BLOB NOT NULL,"
+            " last_access REAL NOT NULL,"
+            " UNIQUE (scope, source_text))"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_segments_access ON segments(last_access)")
+        # clustered on band_key so one bucket is a contiguous range scan
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS bands ("
+            " band_key INTEGER NOT NULL,"
+            " segment_id INTEGER NOT NULL,"
+            " PRIMARY KEY (band_key, segment_id)) WITHOUT ROWID"
+        )
+        # COUNT(*) is O(n); keep a running size instead
+        self._size = self._conn.execute("SELECT COUNT(*) FROM segments").fetchone()[0]
+        # LRU timestamps of looked-up rows, written in batches to keep lookups read-only
+        self._touched: Dict[int, float] = {}
+
+    def _flush_touched(self) -> None:
+        # caller holds the lock
+        if self._touched:
+            self._conn.executemany(
+                "UPDATE segments SET last_access = ? WHERE id = ?", [(t, i) for i, t in self._touched.items()]
+            )
+            self._touched.clear()
+
+    def add(self, source_text: str, source_lang: str, target_lang: str, scenario: str, tone: str, result: Dict) -> None:
+        """Store (or refresh) one translated segment."""
+        self.add_many([(source_text, source_lang, target_lang, scenario, tone, result)])
+
+    def add_many(self, segments: Iterable[Tuple[str, str, str, str, str, Dict]]) -> int:
+        """Store many (source_text, source_lang, target_lang, scenario, tone, result) in one transaction.
+
+        Use this to import an existing corpus; returns the number of new segments.
+        """
+        prepared = []
+        for source_text, source_lang, target_lang, scenario, tone, result in segments:
+            text = source_text.strip()
+            shingle_set = shingles(text)
+            if not shingle_set:
+                continue
+            scope = _scope(source_lang, target_lang, scenario, tone)
+            signature = minhash(shingle_set)
+            prepared.append((scope, text, json.dumps(result, ensure_ascii=False), signature, _band_keys(scope, signature)))
+        if not prepared:
+            return 0
+        now = time.time()
+        added = 0
+        with self._lock:
+            self._conn.execute("BEGIN")
+            try:
+                self._flush_touched()
+                for scope, text, value, signature, keys in prepared:
+                    row = self._conn.execute(
+                        "SELECT id FROM segments WHERE scope = ? AND source_text = ?", (scope, text)
+                    ).fetchone()
+                    if row is not None:
+                        self._conn.execute(
+                            "UPDATE segments SET result = ?, last_access = ? WHERE id = ?", (value, now, row[0])
+                        )
+                        continue
+                    cur = self._conn.execute(
+                        "INSERT INTO segments (scope, source_text, result, signature, last_access) VALUES (?, ?, ?, ?, ?)",
+                        (scope, text, value, _SIG_STRUCT.pack(*signature), now),
+                    )
+                    self._conn.executemany(
+                        "INSERT OR IGNORE INTO bands (band_key, segment_id) VALUES (?, ?)",
+                        [(key, cur.lastrowid) for key in keys],
+                    )
+                    added += 1
+                self._size += added
+                if self.max_segments and self._size > self.max_segments:
+                    self._evict(self._size - self.max_segments + max(1, self.max_segments // 100))
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+        return added
+
+    def _evict(self, count: int) -> None:
+        # caller holds the lock inside a transaction; drop a chunk of LRU rows at once
+        rows = self._conn.execute(
+            "SELECT id, scope, signature FROM segments ORDER BY last_access ASC LIMIT ?", (count,)
+        ).fetchall()
+        # band keys are recomputed from the stored signature, so bands needs no segment_id index
+        self._conn.executemany(
+            "DELETE FROM bands WHERE band_key = ? AND segment_id = ?",
+            [(key, seg_id) for seg_id, scope, blob in rows for key in _band_keys(scope, list(_SIG_STRUCT.unpack(blob)))],
+        )
+        ids = [row[0] for row in rows]
+        self._conn.executemany("DELETE FROM segments WHERE id = ?", [(i,) for i in ids])
+        self._size -= len(ids)
+        self.evictions += len(ids)
+
+    def lookup(
+        self,
+        source_text: str,
+        source_lang: str,
+        target_lang: str,
+        scenario: str,
+        tone: str,
+        min_similarity: float = FEWSHOT_THRESHOLD,
+        limit: int = 3,
+    ) -> List[Dict]:
+        """Return up to `limit` prior segments with similarity >= `min_similarity`, best first.
+
+        Each match is {"source_text", "result", "similarity"}.
+        """
+        query = shingles(source_text.strip())
+        if not query:
+            return []
+        scope = _scope(source_lang, target_lang, scenario, tone)
+        signature = minhash(query)
+        keys = _band_keys(scope, signature)
+        placeholders = ",".join("?" * len(keys))
+        with self._lock:
+            self.lookups += 1
+            rows = self._conn.execute(
+                "SELECT s.id, s.signature FROM segments s JOIN ("
+                f" SELECT segment_id, COUNT(*) AS hits FROM bands WHERE band_key IN ({placeholders})"
+                f"  GROUP BY segment_id ORDER BY hits DESC LIMIT {MAX_CANDIDATES}"
+                ") c ON c.segment_id = s.id",
+                keys,
+            ).fetchall()
+        if not rows:
+            return []
+        # cheap MinHash estimate first; exact Jaccard only for the most promising few
+        slack = 0.15
+        estimated = []
+        for seg_id, blob in rows:
+            agree = sum(1 for x, y in zip(signature, _SIG_STRUCT.unpack(blob)) if x == y) / NUM_PERM
+            if agree >= min_similarity - slack:
+                estimated.append((agree, seg_id))
+        estimated.sort(reverse=True)
+        ids = [seg_id for _agree, seg_id in estimated[:limit * 3]]
+        if not ids:
+            return []
+        with self._lock:
+            details = self._conn.execute(
+                f"SELECT id, source_text, result FROM segments WHERE id IN ({','.join('?' * len(ids))})", ids
+            ).fetchall()
+        matches = []
+        for seg_id, text, value in details:
+            similarity = jaccard(query, shingles(text))
+            if similarity >= min_similarity:
+                matches.append((similarity, seg_id, text, value))
+        matches.sort(key=lambda m: m[0], reverse=True)
+        results = []
+        for similarity, seg_id, text, value in matches[:limit]:
+            try:
+                results.append({"source_text": text, "result": json.loads(value), "similarity": similarity})
+            except ValueError:
+                continue
+        if results:
+            with self._lock:
+                self._touched[matches[0][1]] = time.time()
+                if len(self._touched) >= 256:
+                    self._flush_touched()
+        return results
+
+    def record_use(self, served: bool) -> None:
+        with self._lock:
+            if served:
+                self.served += 1
+            else:
+                self.fewshot += 1
+
+    def clear(self) -> None:
+        with self._lock:
+            self._touched.clear()
+            self._conn.execute("DELETE FROM bands")
+            self._conn.execute("DELETE FROM segments")
+            self._size = 0
+
+    def stats(self) -> Dict[str, float]:
+        with self._lock:
+            return {
+                "segments": self._size,
+                "lookups": self.lookups,
+                "served": self.served,
+                "fewshot": self.fewshot,
+                "evictions": self.evictions,
+                "serve_rate": (self.served / self.lookups) if self.lookups else 0.0,
+            }
+
+
+_default_memory: Optional[TranslationMemory] = None
+_default_memory_lock = threading.Lock()
+
+
+def get_default_memory() -> Optional[TranslationMemory]:
+    """Return the process-wide translation memory, or None if disabled / unavailable.
+
+    Set TRANSLATION_MEMORY_DISABLED=1 to turn it off.
+    """
+    global _default_memory
+    if os.environ.get("TRANSLATION_MEMORY_DISABLED") == "1":
+        return None
+    if _default_memory is None:
+        with _default_memory_lock:
+            if _default_memory is None:
+                try:
+                    _default_memory = TranslationMemory()
+                except Exception as e:
+                    log.warning("Translation memory unavailable: %s", e)
+                    return None
+    return _default_memory
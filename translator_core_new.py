@@ -1,11 +1,40 @@
-from typing import Dict
+from typing import Dict, Iterator, List, Mapping, Optional, Tuple
+from types import MappingProxyType
 import os
 import json
 import traceback
+import threading
+import time
+import asyncio
+import concurrent.futures
+import queue
 
+from translation_cache import get_default_cache, make_cache_key
+from translation_memory import get_default_memory, servable as memory_servable
+from semantic_cache import get_default_semantic_cache
+from phrasebook import lookup_phrase
+from client_pool import get_async_client, get_client, warm_up
+from streaming_json import ADVICE_KEY, LITERAL_KEY, StreamingJSONParser
+from json_repair import loads_tolerant
+from token_scheduler import TokenLease, get_scheduler
+from resilience import Deadline, error_label, get_breaker, retry_delay
+from hedging import enabled as hedging_enabled, get_hedge_policy
+from single_flight import AsyncSingleFlight, SingleFlight
+from prompt_templates import LANG_NAMES, TEMPLATE_VERSIONS, build_messages, estimate_tokens
+from model_router import ROUTER_SETTINGS, Route, get_router
+from metrics import incr, observe, span
+from translation_logging import get_logger, log_raw_payload
 
-def _read_credentials(json_path: str = "credentials.json", legacy_path: str = "credentials") -> Dict:
-    """Read credentials with support for a structured JSON file containing multiple tokens.
+
+log = get_logger("translator.core")
+
+# Cache version keys: change whenever the prompt templates change
+PROMPT_VERSION = TEMPLATE_VERSIONS["full"]
+BATCH_PROMPT_VERSION = TEMPLATE_VERSIONS["batch"]
+
+
+def _parse_credentials(json_path: str = "credentials.json", legacy_path: str = "credentials") -> Dict:
+    """Parse credentials with support for a structured JSON file containing multiple tokens.
 
     Return format:
     {
@@ -72,7 +101,7 @@ def _read_credentials(json_path: str = "credentials.json", legacy_path: str = "c
                 return {"tokens": {"deepseek-main": {"token": data.get("token") or data.get("api_key"), "api_url": data.get("api_url")}}, "default": "deepseek-main"}
             # If user stored a tokens list/dict, try to normalize
             if "tokens" in data:
-                return _read_credentials(json_path=legacy_path, legacy_path=legacy_path)
+                return _parse_credentials(json_path=legacy_path, legacy_path=legacy_path)
     except Exception:
         pass
 
@@ -95,6 +124,658 @@ def _read_credentials(json_path: str = "credentials.json", legacy_path: str = "c
     return {"tokens": {"deepseek-main": {"token": content, "api_url": None}}, "default": "deepseek-main"}
 
 
+def _file_signature(path: str) -> Optional[Tuple[int, int, int]]:
+    try:
+        st = os.stat(path)
+    except OSError:
+        return None
+    return (st.st_mtime_ns, st.st_ino, st.st_size)
+
+
+def _freeze(value):
+    """Recursively wrap dicts in read-only mapping proxies."""
+    if isinstance(value, dict):
+        return MappingProxyType({k: _freeze(v) for k, v in value.items()})
+    return value
+
+
+# (json_path, legacy_path) -> (file signatures, frozen snapshot)
+_credentials_cache: Dict[Tuple[str, str], Tuple[Tuple, Mapping]] = {}
+_credentials_lock = threading.Lock()
+
+
+def _read_credentials(json_path: str = "credentials.json", legacy_path: str = "credentials") -> Mapping:
+    """Return the normalized token table, re-parsing only when the files change.
+
+    The result has the same shape as `_parse_credentials` but is an immutable
+    snapshot (read-only mappings) shared by all callers. The files are re-read
+    only when their mtime, inode or size changes, so concurrent
+    TranslationThreads never hit the disk on the hot path.
+    """
+    key = (json_path, legacy_path)
+    signature = (_file_signature(json_path), _file_signature(legacy_path))
+    cached = _credentials_cache.get(key)
+    if cached is not None and cached[0] == signature:
+        return cached[1]
+    with _credentials_lock:
+        cached = _credentials_cache.get(key)
+        if cached is not None and cached[0] == signature:
+            return cached[1]
+        snapshot = _freeze(_parse_credentials(json_path=json_path, legacy_path=legacy_path))
+        _credentials_cache[key] = (signature, snapshot)
+        return snapshot
+
+
+def _resolve_token(token_name: str = None) -> Tuple[Optional[str], str]:
+    """Pick (token, api_url) for a request.
+
+    DEEPSEEK_API_KEY overrides everything (with DEEPSEEK_API_URL as its optional
+    endpoint); otherwise use `token_name`, then the credentials `default`, then
+    the first configured token.
+    """
+    # Credentials: prefer environment variable; then structured credentials.json;
+    # keep backward compatibility with legacy single-line `credentials`.
+    creds = _read_credentials()
+
+    # Choose token: environment variable overrides everything
+    env_token = os.environ.get("DEEPSEEK_API_KEY") or os.environ.get("DEEPSEEK_API_KEY_0")
+    token = None
+    api_url = None
+    if env_token:
+        token = env_token
+        api_url = os.environ.get("DEEPSEEK_API_URL")
+    else:
+        # structured creds: {'tokens': {name: {token, api_url}}, 'default': name}
+        tokens = creds.get("tokens") if isinstance(creds, Mapping) else None
+        default_name = creds.get("default") if isinstance(creds, Mapping) else None
+        if token_name and tokens and token_name in tokens:
+            token = tokens[token_name].get("token")
+            api_url = tokens[token_name].get("api_url")
+        elif default_name and tokens and default_name in tokens:
+            token = tokens[default_name].get("token")
+            api_url = tokens[default_name].get("api_url")
+        elif tokens:
+            # pick the first available token
+            first = next(iter(tokens.items()))
+            token = first[1].get("token")
+            api_url = first[1].get("api_url")
+
+    if not api_url:
+        # allow top-level api_url in legacy kv formats
+        if isinstance(creds, Mapping) and creds.get("api_url"):
+            api_url = creds.get("api_url")
+        else:
+            api_url = "https://api.deepseek.com"
+
+    return token, api_url
+
+
+def warm_up_client(token_name: str = None) -> bool:
+    """Create the pooled client for the active token and open a keep-alive connection.
+
+    Intended to be called from a background thread at app startup so the first
+    translation does not pay the TCP+TLS handshake.
+    """
+    token, api_url = _resolve_token(token_name)
+    if not token:
+        return False
+    return warm_up(token, api_url)
+
+
+_CIRCUIT_OPEN = "[Circuit Open]"
+_ERROR_PREFIXES = ("[SDK Not Installed]", "[Missing Credentials]", "[Deepseek Call Error]", _CIRCUIT_OPEN)
+
+
+def _normalize_request(source_text, source_lang, target_lang, scenario, tone) -> Dict[str, str]:
+    """Apply the same defaults the prompt has always used to raw UI inputs."""
+    s_lang = source_lang.strip() if isinstance(source_lang, str) and source_lang.strip() else "<unknown>"
+    t_lang = target_lang.strip() if isinstance(target_lang, str) and target_lang.strip() else "<unknown>"
+    return {
+        "s_text": source_text if isinstance(source_text, str) else "",
+        "s_lang": s_lang,
+        "t_lang": t_lang,
+        "scenario": scenario.strip() if isinstance(scenario, str) and scenario.strip() else "general",
+        "tone": tone.strip() if isinstance(tone, str) and tone.strip() else "neutral",
+        # Map language codes to natural names for the prompt
+        "s_lang_name": LANG_NAMES.get(s_lang, s_lang),
+        "t_lang_name": LANG_NAMES.get(t_lang, t_lang),
+    }
+
+
+def _variant(include_advice: bool) -> str:
+    return "full" if include_advice else "translation_only"
+
+
+def _build_messages(req: Dict[str, str], variant: str = "full", examples: Optional[List[Dict]] = None) -> list:
+    """Precompiled system instructions + a short per-request user message."""
+    with span("prompt"):
+        messages, _tokens = build_messages(
+            req["s_text"], req["s_lang"], req["t_lang"], req["scenario"], req["tone"], variant=variant,
+            examples=examples,
+        )
+    return messages
+
+
+def _request_cache_key(req: Dict[str, str], version: str = PROMPT_VERSION) -> str:
+    return make_cache_key(req["s_text"].strip(), req["s_lang"], req["t_lang"], req["scenario"], req["tone"], version)
+
+
+def _phrasebook_lookup(req: Dict[str, str], variant: str = "full") -> Optional[Dict]:
+    """Curated answer for a stock phrase, or None.
+
+    A phrase without curated advice only answers translation-only requests.
+    """
+    with span("cache_lookup", kind="phrasebook"):
+        entry = lookup_phrase(req["s_text"].strip(), req["s_lang"], req["t_lang"], req["scenario"], req["tone"])
+    if entry is not None and variant == "translation_only":
+        entry["advice"] = ""
+    elif entry is not None and not entry["advice"]:
+        entry = None
+    incr("translator_cache_total", result="hit" if entry else "miss", kind="phrasebook")
+    return entry
+
+
+def _cache_lookup(cache, req: Dict[str, str], variant: str = "full") -> Tuple[Optional[str], Optional[Dict]]:
+    """Return (key to store the answer under, cached result or None)."""
+    if cache is None:
+        return None, None
+    with span("cache_lookup"):
+        cache_key = _request_cache_key(req, TEMPLATE_VERSIONS[variant])
+        cached = cache.get(cache_key)
+        if not cached and variant == "translation_only":
+            # a full answer also satisfies a translation-only request
+            full = cache.get(_request_cache_key(req))
+            if full:
+                cached = {**full, "advice": ""}
+    incr("translator_cache_total", result="hit" if cached else "miss")
+    return cache_key, cached or None
+
+
+def _cache_store(cache, cache_key: Optional[str], result: Dict) -> None:
+    if cache is not None and cache_key:
+        with span("cache_store"):
+            cache.put(cache_key, result)
+
+
+def _memory_lookup(memory, req: Dict[str, str], variant: str = "full") -> Tuple[Optional[Dict], List[Dict]]:
+    """Return (near-duplicate result to serve directly or None, few-shot reference pairs)."""
+    if memory is None:
+        return None, []
+    with span("memory_lookup"):
+        matches = memory.lookup(req["s_text"], req["s_lang"], req["t_lang"], req["scenario"], req["tone"])
+    if not matches:
+        incr("translator_memory_total", result="miss")
+        return None, []
+    best = matches[0]
+    # near-duplicates that differ in a number, negation or date are only references
+    if memory_servable(req["s_text"], best):
+        memory.record_use(served=True)
+        incr("translator_memory_total", result="served")
+        result = dict(best["result"])
+        if variant == "translation_only":
+            result["advice"] = ""
+        return result, []
+    memory.record_use(served=False)
+    incr("translator_memory_total", result="fewshot")
+    return None, [
+        {"source": m["source_text"], "translation": m["result"].get("literal_translation", "")}
+        for m in matches
+    ]
+
+
+_audit_pool: Optional[concurrent.futures.ThreadPoolExecutor] = None
+_audit_pool_lock = threading.Lock()
+
+
+def _audit_semantic_hit(semantic, req: Dict[str, str], cached: Dict, token_name: str = None) -> None:
+    fresh = generate_translation_and_advice(
+        req["s_text"], req["s_lang"], req["t_lang"], req["scenario"], req["tone"],
+        token_name=token_name, use_cache=False,
+    )
+    if not is_fallback(fresh):
+        semantic.record_audit(cached, fresh)
+
+
+def _semantic_lookup(semantic, req: Dict[str, str], variant: str = "full", token_name: str = None) -> Optional[Dict]:
+    """Serve a paraphrase of an earlier request; occasionally re-check the hit in the background."""
+    global _audit_pool
+    if semantic is None:
+        return None
+    with span("semantic_lookup"):
+        hit = semantic.lookup(req["s_text"], req["s_lang"], req["t_lang"], req["scenario"], req["tone"])
+    incr("translator_semantic_total", result="hit" if hit else "miss")
+    if hit is None:
+        return None
+    if semantic.should_audit():
+        with _audit_pool_lock:
+            if _audit_pool is None:
+                _audit_pool = concurrent.futures.ThreadPoolExecutor(max_workers=1, thread_name_prefix="semantic-audit")
+        _audit_pool.submit(_audit_semantic_hit, semantic, req, hit["result"], token_name)
+    result = dict(hit["result"])
+    if variant == "translation_only":
+        result["advice"] = ""
+    return result
+
+
+def _remember(memory, semantic, req: Dict[str, str], variant: str, result: Dict) -> None:
+    """Feed a fresh answer to the fuzzy layers (translation memory, semantic cache)."""
+    # only full answers are remembered, so a served match always has its advice
+    if variant != "full":
+        return
+    if memory is not None:
+        with span("memory_store"):
+            memory.add(req["s_text"], req["s_lang"], req["t_lang"], req["scenario"], req["tone"], result)
+    if semantic is not None:
+        with span("semantic_store"):
+            semantic.add(req["s_text"], req["s_lang"], req["t_lang"], req["scenario"], req["tone"], result)
+
+
+def _local_lookup(req: Dict[str, str], variant: str, use_cache: bool, token_name: str = None) -> Tuple[Optional[Dict], Dict]:
+    """Run the local layers before a model call: phrasebook, result cache,
+    translation memory and semantic cache (all blocking disk / NumPy work).
+
+    Returns (result to serve or None, layers) where `layers` holds the
+    "cache", "cache_key", "memory", "semantic" and few-shot "examples" needed
+    to build the prompt and to store the fresh answer (`_store_result`).
+    """
+    layers = {"cache": None, "cache_key": None, "memory": None, "semantic": None, "examples": []}
+    if not use_cache:
+        return None, layers
+
+    # Stock phrases are answered from the compiled phrasebooks
+    curated = _phrasebook_lookup(req, variant)
+    if curated:
+        return curated, layers
+
+    # Serve repeated requests from the on-disk cache (no API round trip)
+    layers["cache"] = get_default_cache()
+    layers["cache_key"], cached = _cache_lookup(layers["cache"], req, variant)
+    if cached:
+        return cached, layers
+
+    # Near-duplicates of earlier requests: serve directly or pass as references
+    layers["memory"] = get_default_memory()
+    remembered, layers["examples"] = _memory_lookup(layers["memory"], req, variant)
+    if remembered:
+        return remembered, layers
+    # Paraphrases of earlier requests in the same scenario
+    layers["semantic"] = get_default_semantic_cache()
+    return _semantic_lookup(layers["semantic"], req, variant, token_name), layers
+
+
+def _store_result(layers: Dict, req: Dict[str, str], variant: str, result: Dict) -> None:
+    """Store a fresh answer in the layers `_local_lookup` consulted."""
+    _cache_store(layers["cache"], layers["cache_key"], result)
+    _remember(layers["memory"], layers["semantic"], req, variant, result)
+
+
+def _empty_source_result() -> Dict:
+    return {
+        "literal_translation": "[Literal Example] Source text not provided.",
+        "natural_translation": [{"text": "[No Natural Expression]", "explanation": ""}],
+        "advice": "[Tip] Source text not provided; please enter text to translate to get translation and cultural advice.",
+    }
+
+
+def _result_from_data(data: Dict, include_advice: bool = True) -> Dict:
+    """Map the model's JSON fields onto the result shape the UIs expect."""
+    literal = data.get("literal_translation", "") or "[No Literal Translation Output]"
+    natural = data.get("natural_expressions", [])
+    if not natural:
+        natural = [{"text": "[No Natural Expression Output]", "explanation": ""}]
+    advice = data.get("cultural_advice", "") or ("[No Cultural Advice Output]" if include_advice else "")
+    return {
+        "literal_translation": literal,
+        "natural_translation": natural, # List of dicts
+        "advice": advice,
+    }
+
+
+_FALLBACK_REASONS = (
+    ("[SDK Not Installed]", "sdk_not_installed"),
+    ("[Missing Credentials]", "missing_credentials"),
+    ("[Deepseek Call Error]", "call_error"),
+    (_CIRCUIT_OPEN, "circuit_open"),
+)
+
+
+def _fallback_reason(model_text: str) -> str:
+    for prefix, reason in _FALLBACK_REASONS:
+        if model_text.startswith(prefix):
+            return reason
+    return "parse_error"
+
+
+def _fallback_result(req: Dict[str, str], model_text: str) -> Dict:
+    """Safe fake output used when the SDK, token or API call is unavailable or parsing failed."""
+    incr("translator_fallbacks_total", reason=_fallback_reason(model_text))
+    s_text, s_lang, t_lang, scenario = req["s_text"], req["s_lang"], req["t_lang"], req["scenario"]
+    note = ""
+    if model_text.startswith("[SDK Not Installed]"):
+        note = "\n\n**Tip**: OpenAI SDK not installed. Please run `pip install openai` and set `DEEPSEEK_API_KEY`."
+    elif model_text.startswith("[Missing Credentials]"):
+        note = "\n\n**Tip**: Deepseek credentials not found. Please set token in `DEEPSEEK_API_KEY` environment variable or `credentials` file in project root."
+    elif model_text.startswith("[Deepseek Call Error]"):
+        note = f"\n\n**Deepseek Call Error**: {model_text}"
+    elif model_text.startswith(_CIRCUIT_OPEN):
+        note = f"\n\n**Deepseek Unavailable**: {model_text}"
+
+    # Fallback safe fake implementation
+    literal = f"[Literal Example] ({s_lang} -> {t_lang}): {s_text}"
+    # Natural needs to be a list now
+    natural = [
+        {"text": f"[Natural Expression Example] {s_text}", "explanation": f"(Scenario: {scenario}) This is an example of a more natural expression generated for the source text."}
+    ]
+    advice = (
+        "【Cultural Advice Example】\n"
+        "- Based on your selected scenario, remind the user to pay attention to polite language and local customs.\n"
+        "- This will be generated by the large model based on source text and target culture in the future."
+    ) + note
+
+    return {
+        "literal_translation": literal,
+        "natural_translation": natural,
+        "advice": advice,
+    }
+
+
+def is_fallback(result: Dict) -> bool:
+    """True for placeholder output from `_fallback_result` / `_error_result` / empty input."""
+    return str(result.get("literal_translation", "")).startswith(("[Literal Example]", "[Error]"))
+
+
+def _error_result(exc: Exception) -> Dict:
+    incr("translator_fallbacks_total", reason="exception")
+    return {
+        "literal_translation": "[Error] Cannot generate literal translation.",
+        "natural_translation": [{"text": "[Error]", "explanation": f"Cannot generate natural translation: {str(exc)}"}],
+        "advice": f"[Error] Exception during advice generation: {str(exc)}\n{traceback.format_exc()}",
+    }
+
+
+_MISSING_CREDENTIALS = "[Missing Credentials] DEEPSEEK API token not found in environment variables or credentials file."
+_SDK_NOT_INSTALLED = "[SDK Not Installed] Please run: pip install openai and set DEEPSEEK_API_KEY to your token."
+
+
+def _acquire_token(token_name: str = None, exclude=()) -> Optional[TokenLease]:
+    """Lease a token for one request from the shared `TokenScheduler`.
+
+    DEEPSEEK_API_KEY and an explicit `token_name` pin that token. Otherwise the
+    request is spread across every token in credentials.json by load, latency
+    and health. Set DEEPSEEK_TOKEN_SCHEDULING=0 to always use the default token.
+    Returns None when no token is configured.
+    """
+    with span("credentials"):
+        scheduler = get_scheduler()
+        env_token = os.environ.get("DEEPSEEK_API_KEY") or os.environ.get("DEEPSEEK_API_KEY_0")
+        creds = _read_credentials()
+        tokens = creds.get("tokens") if isinstance(creds, Mapping) else None
+        if env_token or (token_name and tokens and token_name in tokens) or os.environ.get("DEEPSEEK_TOKEN_SCHEDULING") == "0":
+            token, api_url = _resolve_token(token_name)
+            if not token:
+                return None
+            return scheduler.pin("env:DEEPSEEK_API_KEY" if env_token else (token_name or "default"), token, api_url)
+        scheduler.sync(tokens or {})
+        return scheduler.acquire(exclude=exclude)
+
+
+def _route(variant: str, req: Dict[str, str], items: int = 1) -> Route:
+    """Model, max_tokens and temperature for one request (see `model_router`)."""
+    return get_router().route(variant, req["scenario"], req["s_text"], items)
+
+
+def _completion_options(route: Optional[Route] = None, timeout: Optional[float] = None) -> Dict:
+    options = {"model": ROUTER_SETTINGS["model"], "response_format": {"type": "json_object"}}
+    if route is not None:
+        options.update(route.options())
+    if timeout:
+        options["timeout"] = timeout
+    return options
+
+
+def _record_usage(route: Optional[Route], response) -> None:
+    """Teach the router the answer's real length (from `usage`)."""
+    if route is None:
+        return
+    try:
+        completion_tokens = response.usage.completion_tokens
+        finish_reason = response.choices[0].finish_reason
+    except Exception:
+        return
+    get_router().record(route, completion_tokens, finish_reason)
+
+
+def _lease_for_attempt(token_name: str = None, exclude: List[str] = ()) -> Optional[TokenLease]:
+    # a retry prefers another token, but any token beats giving up
+    return _acquire_token(token_name, exclude) or (_acquire_token(token_name) if exclude else None)
+
+
+def _circuit_open(breaker) -> str:
+    return (
+        f"{_CIRCUIT_OPEN} Deepseek endpoint {breaker.endpoint} is failing; "
+        f"next attempt in {breaker.retry_in():.0f}s."
+    )
+
+
+def _response_text(response) -> str:
+    # Extract text from common response shape
+    try:
+        return response.choices[0].message.content
+    except Exception:
+        # fallback: stringify response
+        try:
+            return json.dumps(response)
+        except Exception:
+            return str(response)
+
+
+def _call_model(token_name: str, messages: list, route: Optional[Route] = None, tried: Optional[List[str]] = None) -> str:
+    """Run one non-streaming chat completion under the retry policy.
+
+    Each attempt leases a token (a retry avoids the token that just failed),
+    is bounded by the per-attempt timeout and gated by the endpoint's circuit
+    breaker; retryable errors back off with jitter until the attempts or the
+    total deadline run out (see `resilience`). Leases are always released,
+    with the outcome fed back to the scheduler. Errors come back as bracketed
+    markers. `tried` collects the token names used (shared by hedged calls,
+    so a hedge goes to another token).
+    """
+    deadline = Deadline()
+    exclude: List[str] = tried if tried is not None else []
+    attempt = 0
+    while True:
+        attempt += 1
+        lease = _lease_for_attempt(token_name, exclude)
+        if lease is None:
+            return _MISSING_CREDENTIALS
+        exclude.append(lease.name)
+        breaker = get_breaker(lease.api_url)
+        if not breaker.allow():
+            lease.cancel()
+            return _circuit_open(breaker)
+        try:
+            with span("client"):
+                client = get_client(lease.token, lease.api_url)
+            with span("request", token=lease.name, stream=False, attempt=attempt):
+                # JSON mode is enforced if supported, otherwise the prompt handles it
+                response = client.chat.completions.create(
+                    messages=messages, stream=False, **_completion_options(route, deadline.attempt_timeout())
+                )
+        except ImportError:
+            lease.cancel()
+            breaker.release()
+            return _SDK_NOT_INSTALLED
+        except Exception as e:
+            lease.release(e)
+            breaker.record(e)
+            delay = retry_delay(e, attempt, deadline)
+            if delay is None:
+                return f"[Deepseek Call Error] {str(e)}"
+            log.info("Deepseek call failed (%s), retrying in %.2fs", error_label(e), delay)
+            time.sleep(delay)
+            continue
+        lease.release()
+        breaker.record()
+        _record_usage(route, response)
+        return _response_text(response)
+
+
+async def _acall_model(token_name: str, messages: list, route: Optional[Route] = None, tried: Optional[List[str]] = None) -> str:
+    """Async counterpart of `_call_model` on the shared AsyncOpenAI pool.
+
+    Cancellation (asyncio.CancelledError) is propagated, never swallowed; the
+    lease of the attempt in flight is given back first.
+    """
+    deadline = Deadline()
+    exclude: List[str] = tried if tried is not None else []
+    attempt = 0
+    while True:
+        attempt += 1
+        lease = _lease_for_attempt(token_name, exclude)
+        if lease is None:
+            return _MISSING_CREDENTIALS
+        exclude.append(lease.name)
+        breaker = get_breaker(lease.api_url)
+        if not breaker.allow():
+            lease.cancel()
+            return _circuit_open(breaker)
+        try:
+            with span("client"):
+                client = get_async_client(lease.token, lease.api_url)
+            with span("request", token=lease.name, stream=False, attempt=attempt):
+                response = await client.chat.completions.create(
+                    messages=messages, stream=False, **_completion_options(route, deadline.attempt_timeout())
+                )
+        except ImportError:
+            lease.cancel()
+            breaker.release()
+            return _SDK_NOT_INSTALLED
+        except Exception as e:
+            lease.release(e)
+            breaker.record(e)
+            delay = retry_delay(e, attempt, deadline)
+            if delay is None:
+                return f"[Deepseek Call Error] {str(e)}"
+            log.info("Deepseek call failed (%s), retrying in %.2fs", error_label(e), delay)
+            await asyncio.sleep(delay)
+            continue
+        except BaseException:
+            # cancelled mid-request
+            lease.cancel()
+            breaker.release()
+            raise
+        lease.release()
+        breaker.record()
+        _record_usage(route, response)
+        return _response_text(response)
+
+
+def _can_hedge(token_name: str = None) -> bool:
+    """Hedging needs it switched on and a choice of scheduled tokens (nothing pinned)."""
+    if not hedging_enabled() or token_name:
+        return False
+    if os.environ.get("DEEPSEEK_API_KEY") or os.environ.get("DEEPSEEK_API_KEY_0") or os.environ.get("DEEPSEEK_TOKEN_SCHEDULING") == "0":
+        return False
+    creds = _read_credentials()
+    tokens = creds.get("tokens") if isinstance(creds, Mapping) else None
+    return bool(tokens) and len(tokens) > 1
+
+
+async def _acall_hedged(token_name: str, messages: list, route: Optional[Route] = None) -> str:
+    """`_acall_model`, duplicated to a second token if the first is slow.
+
+    The duplicate is sent once the first call has been running for the
+    policy's percentile delay (and only within the hedge budget); the first
+    usable answer wins and the other call is cancelled. See `hedging`.
+    """
+    policy = get_hedge_policy()
+    policy.start_request()
+    tried: List[str] = []
+    started = {}
+
+    def _launch() -> "asyncio.Future":
+        task = asyncio.ensure_future(_acall_model(token_name, messages, route, tried))
+        started[task] = time.perf_counter()
+        return task
+
+    tasks = [_launch()]
+    try:
+        done, _pending = await asyncio.wait(tasks, timeout=policy.delay())
+        if not done and policy.try_hedge():
+            tasks.append(_launch())
+        pending = set(tasks)
+        model_text, winner = None, None
+        while pending:
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                text = task.result()
+                if not text.startswith(_ERROR_PREFIXES):
+                    policy.record_latency(time.perf_counter() - started[task])
+                if model_text is None or (model_text.startswith(_ERROR_PREFIXES) and not text.startswith(_ERROR_PREFIXES)):
+                    model_text, winner = text, task
+            if not model_text.startswith(_ERROR_PREFIXES):
+                break
+        if len(tasks) > 1:
+            policy.record_outcome(hedge_won=winner is tasks[1])
+        return model_text
+    finally:
+        # cancel the loser (or everything, if we were cancelled ourselves)
+        for task in tasks:
+            if not task.done():
+                task.cancel()
+
+
+def _complete(token_name: str, messages: list, route: Optional[Route] = None) -> str:
+    """Blocking completion used by the sync entry points; hedged when possible.
+
+    Hedged calls run on the shared background event loop, where the losing
+    request can really be cancelled.
+    """
+    if _can_hedge(token_name):
+        future = asyncio.run_coroutine_threadsafe(
+            _acall_hedged(token_name, messages, route), _get_background_loop()
+        )
+        return future.result()
+    return _call_model(token_name, messages, route)
+
+
+async def _acomplete(token_name: str, messages: list, route: Optional[Route] = None) -> str:
+    if _can_hedge(token_name):
+        return await _acall_hedged(token_name, messages, route)
+    return await _acall_model(token_name, messages, route)
+
+
+def _parse_model_text(model_text: str, include_advice: bool = True) -> Optional[Dict]:
+    """Parse a successful completion into a result dict, or None if unusable."""
+    if not model_text or model_text.startswith(_ERROR_PREFIXES):
+        return None
+    log_raw_payload("model output", model_text)
+    with span("parse"):
+        # malformed or truncated output is repaired; only the advice may be cut short
+        data, outcome = loads_tolerant(model_text, kind="translation", partial_keys=(ADVICE_KEY,))
+    if not isinstance(data, dict) or not data.get(LITERAL_KEY):
+        log.warning("JSON parsing failed (%s): no usable literal translation", outcome)
+        # parsing failed — caller falls back
+        return None
+    if outcome != "ok":
+        log.info("Model JSON %s; salvaged fields: %s", outcome, ", ".join(data))
+    return _result_from_data(data, include_advice)
+
+
+# Coalesces identical in-flight requests (sync + streaming share one, async has its own)
+_flight = SingleFlight()
+_aflight = AsyncSingleFlight()
+
+
+def _flight_key(req: Dict[str, str], token_name: str = None, variant: str = "full") -> str:
+    return f"{_request_cache_key(req, TEMPLATE_VERSIONS[variant])}|{token_name or ''}"
+
+
+def coalescing_stats() -> Dict[str, Dict[str, float]]:
+    """Calls / coalesced calls / coalescing rate for the threaded and async paths."""
+    return {"threaded": _flight.stats(), "async": _aflight.stats()}
+
+
 def generate_translation_and_advice(
     source_text: str,
     source_lang: str,
@@ -102,192 +783,717 @@ def generate_translation_and_advice(
     scenario: str,
     tone: str = "neutral",
     token_name: str = None,
+    use_cache: bool = True,
+    include_advice: bool = True,
 ) -> Dict[str, str]:
     """Construct a prompt and (if possible) call Deepseek via the OpenAI SDK.
 
     Behavior:
     - Prefer DEEPSEEK_API_KEY from environment; fallback to credentials file.
     - Prefer api_url from credentials or default to https://api.deepseek.com
-    - Try to import OpenAI SDK (from openai import OpenAI). If not available,
+    - Reuse a pooled, keep-alive OpenAI client per (token, api_url) from
+      `client_pool`. If the OpenAI SDK is not available,
       return a helpful message in the advice field instructing how to install it
       and fall back to the safe fake outputs so the UI remains functional.
+    - Successful results are cached on disk keyed by (text, languages, scenario,
+      tone, prompt version); pass use_cache=False to force a fresh call.
+    - include_advice=False uses the "translation only" prompt: no cultural
+      advice is generated (advice is ""), which cuts output tokens and latency.
     - Always avoid raising exceptions to the caller; return safe strings.
     """
 
     try:
-        s_text = source_text if isinstance(source_text, str) else ""
-        s_lang = source_lang.strip() if isinstance(source_lang, str) and source_lang.strip() else "<unknown>"
-        t_lang = target_lang.strip() if isinstance(target_lang, str) and target_lang.strip() else "<unknown>"
-        scenario = scenario.strip() if isinstance(scenario, str) and scenario.strip() else "general"
-        tone = tone.strip() if isinstance(tone, str) and tone.strip() else "neutral"
+        incr("translator_requests_total", entry="sync")
+        with span("translate", entry="sync", variant=_variant(include_advice)):
+            req = _normalize_request(source_text, source_lang, target_lang, scenario, tone)
+            if not req["s_text"]:
+                return _empty_source_result()
 
-        # Map language codes to natural names for the prompt
-        lang_names = {
-            "zh": "Simplified Chinese",
-            "en": "English",
-            "ja": "Japanese"
-        }
-        s_lang_name = lang_names.get(s_lang, s_lang)
-        t_lang_name = lang_names.get(t_lang, t_lang)
-
-        if not s_text:
-            return {
-                "literal_translation": "[Literal Example] Source text not provided.",
-                "natural_translation": [{"text": "[No Natural Expression]", "explanation": ""}],
-                "advice": "[Tip] Source text not provided; please enter text to translate to get translation and cultural advice.",
-            }
-
-        # Build prompt and messages
-        prompt = (
-            "Act as a cross-cultural translation assistant. Output JSON data based on the following requirements.\n"
-            "Input content:\n"
-            f"Source Text: {s_text}\n"
-            f"Source Language: {s_lang}\n"
-            f"Target Language: {t_lang}\n"
-            f"Scenario: {scenario}\n"
-            f"Tone Preference: {tone}\n\n"
-            "Please return the following JSON structure (do not include Markdown code block markers, ensure valid JSON):\n"
-            "{\n"
-            '  "literal_translation": "Literal translation result (string)",\n'
-            '  "natural_expressions": [\n'
-            f'    {{"text": "Natural expression 1 (Target Language)", "explanation": "Explanation and usage context in {s_lang_name}"}},\n'
-            f'    {{"text": "Natural expression 2 (Target Language)", "explanation": "Explanation and usage context in {s_lang_name}"}}\n'
-            '  ],\n'
-            f'  "cultural_advice": "Cultural advice (Markdown string, written in {s_lang_name}. Based on the \'{scenario}\' scenario and \'{tone}\' tone, provide deep cultural background analysis. Include: 1. Cultural mindset differences behind the language; 2. Etiquette taboos or unwritten rules in this scenario; 3. Potential emotional reaction of the other party. Use lists or bold text to organize content, do not use # headers, ensure empty lines between paragraphs, clear layout, substantial content, avoid vague generalizations.)"\n'
-            "}\n"
-        )
+            variant = _variant(include_advice)
 
-        messages = [
-            {"role": "system", "content": "You are a helpful cross-cultural translation assistant. Output valid JSON only."},
-            {"role": "user", "content": prompt},
-        ]
+            # Phrasebook, result cache, translation memory and semantic cache
+            served, layers = _local_lookup(req, variant, use_cache, token_name)
+            if served:
+                return served
+            messages = _build_messages(req, variant, layers["examples"])
 
-        # Credentials: prefer environment variable; then structured credentials.json;
-        # keep backward compatibility with legacy single-line `credentials`.
-        creds = _read_credentials()
+            def _fetch() -> Dict:
+                model_text = _complete(token_name, messages, _route(variant, req))
 
-        # Choose token: environment variable overrides everything
-        env_token = os.environ.get("DEEPSEEK_API_KEY") or os.environ.get("DEEPSEEK_API_KEY_0")
-        token = None
-        api_url = None
-        if env_token:
-            token = env_token
-        else:
-            # structured creds: {'tokens': {name: {token, api_url}}, 'default': name}
-            tokens = creds.get("tokens") if isinstance(creds, dict) else None
-            default_name = creds.get("default") if isinstance(creds, dict) else None
-            if token_name and tokens and token_name in tokens:
-                token = tokens[token_name].get("token")
-                api_url = tokens[token_name].get("api_url")
-            elif default_name and tokens and default_name in tokens:
-                token = tokens[default_name].get("token")
-                api_url = tokens[default_name].get("api_url")
-            elif tokens:
-                # pick the first available token
-                first = next(iter(tokens.items()))
-                token = first[1].get("token")
-                api_url = first[1].get("api_url")
-
-        if not api_url:
-            # allow top-level api_url in legacy kv formats
-            if isinstance(creds, dict) and creds.get("api_url"):
-                api_url = creds.get("api_url")
-            else:
-                api_url = "https://api.deepseek.com"
-
-        # Try to call Deepseek via OpenAI SDK
-        model_text = ""
-        try:
-            from openai import OpenAI
+                result = _parse_model_text(model_text, include_advice)
+                if result is not None:
+                    _store_result(layers, req, variant, result)
+                    return result
 
-            if token:
-                client = OpenAI(api_key=token, base_url=api_url)
-                response = client.chat.completions.create(
-                    model="deepseek-chat",
-                    messages=messages,
-                    stream=False,
-                    response_format={"type": "json_object"}  # Enforce JSON if supported, otherwise prompt handles it
+                # If we reach here, either SDK missing, token missing, API error, or parsing failed
+                return _fallback_result(req, model_text)
+
+            # Identical concurrent requests share one upstream call
+            return _flight.do(_flight_key(req, token_name, variant), _fetch)
+    except Exception as exc:
+        # Ultimate fallback — never raise
+        return _error_result(exc)
+
+
+def generate_translations_batch(
+    source_texts: List[str],
+    source_lang: str,
+    target_lang: str,
+    scenario: str,
+    tone: str = "neutral",
+    token_name: str = None,
+    use_cache: bool = True,
+) -> List[Dict[str, str]]:
+    """Translate several short phrases sharing the same settings in one request.
+
+    Behavior:
+    - Results are returned in input order, one dict per text, in the same shape
+      as `generate_translation_and_advice`.
+    - Cached phrases are served from the cache; only the rest are packed into a
+      single prompt.
+    - Any item the packed answer misses (or an unusable answer) falls back to a
+      regular single-phrase call, so the list is always complete. Never raises.
+    """
+    results: List[Optional[Dict]] = [None] * len(source_texts)
+    try:
+        incr("translator_requests_total", entry="batch")
+        with span("translate", entry="batch", items=len(source_texts)):
+            reqs = [_normalize_request(text, source_lang, target_lang, scenario, tone) for text in source_texts]
+            cache = get_default_cache() if use_cache else None
+            pending = []
+            for idx, req in enumerate(reqs):
+                if not req["s_text"]:
+                    results[idx] = _empty_source_result()
+                    continue
+                curated = _phrasebook_lookup(req) if use_cache else None
+                if curated:
+                    results[idx] = curated
+                    continue
+                if cache is not None:
+                    cached = cache.get(_request_cache_key(req)) or cache.get(_request_cache_key(req, BATCH_PROMPT_VERSION))
+                    if cached:
+                        results[idx] = cached
+                        continue
+                pending.append(idx)
+
+            if len(pending) > 1:
+                base = reqs[pending[0]]
+                messages, _tokens = build_messages(
+                    "", base["s_lang"], base["t_lang"], base["scenario"], base["tone"],
+                    variant="batch", items=[{"id": idx, "text": reqs[idx]["s_text"]} for idx in pending],
                 )
-                # Extract text from common response shape
-                try:
-                    model_text = response.choices[0].message.content
-                except Exception:
-                    # fallback: stringify response
+                route = get_router().route(
+                    "batch", base["scenario"], "\n".join(reqs[idx]["s_text"] for idx in pending), items=len(pending)
+                )
+                model_text = _complete(token_name, messages, route)
+                if model_text and not model_text.startswith(_ERROR_PREFIXES):
+                    # complete items of a malformed / truncated answer are kept
+                    data, outcome = loads_tolerant(model_text, kind="batch")
+                    items = data.get("items", []) if isinstance(data, dict) else []
+                    if data is None:
+                        log.warning("Batch JSON parsing failed")
+                    for item in items if isinstance(items, list) else []:
+                        if not isinstance(item, dict) or item.get("id") not in pending or not item.get("literal_translation"):
+                            continue
+                        idx = item["id"]
+                        if results[idx] is None:
+                            results[idx] = _result_from_data(item)
+                            if cache is not None:
+                                cache.put(_request_cache_key(reqs[idx], BATCH_PROMPT_VERSION), results[idx])
+
+            # Anything still missing goes through the normal single-phrase path
+            for idx in pending:
+                if results[idx] is None:
+                    results[idx] = generate_translation_and_advice(
+                        source_texts[idx], source_lang, target_lang, scenario, tone,
+                        token_name=token_name, use_cache=use_cache,
+                    )
+            return results
+    except Exception as exc:
+        return [r if r is not None else _error_result(exc) for r in results]
+
+
+def _parse_document_items(model_text: str, pending: List[int]) -> Dict[int, Dict]:
+    """Usable sentence translations of a "document" completion, by id."""
+    if not model_text or model_text.startswith(_ERROR_PREFIXES):
+        return {}
+    log_raw_payload("document output", model_text)
+    with span("parse", kind="document"):
+        # complete items of a malformed / truncated answer are kept
+        data, outcome = loads_tolerant(model_text, kind="document")
+    items = data.get("items", []) if isinstance(data, dict) else []
+    wanted = set(pending)
+    parsed = {}
+    for item in items if isinstance(items, list) else []:
+        if not isinstance(item, dict) or item.get("id") not in wanted:
+            continue
+        literal = item.get(LITERAL_KEY)
+        if not isinstance(literal, str) or not literal.strip():
+            continue
+        natural = item.get("natural_translation")
+        if not isinstance(natural, str) or not natural.strip():
+            natural = literal
+        parsed[item["id"]] = {"literal_translation": literal, "natural_translation": natural}
+    if len(parsed) < len(pending):
+        log.warning("Document answer (%s) missed %d of %d sentences", outcome, len(pending) - len(parsed), len(pending))
+    return parsed
+
+
+def generate_document_sentences(
+    sentences: List[str],
+    context: str,
+    source_lang: str,
+    target_lang: str,
+    scenario: str,
+    tone: str = "neutral",
+    token_name: str = None,
+    use_cache: bool = True,
+) -> List[Dict]:
+    """Translate the sentences of one passage of a long document (see document_translate.py).
+
+    Behavior:
+    - Every sentence is cached on its own, keyed by its text only: `context`
+      (the source text before the passage) keeps names and terminology
+      consistent but is not part of the key, so an edited document only
+      sends its changed sentences.
+    - The uncached sentences are packed into one request; sentences the
+      answer misses get one more request of their own.
+    - Returns one {"literal_translation": str, "natural_translation": str,
+      "ok": bool} per sentence, in order; when ok is False both hold the
+      usual bracketed fallback text. Never raises.
+    """
+    results: List[Optional[Dict]] = [None] * len(sentences)
+    try:
+        incr("translator_requests_total", entry="document")
+        with span("translate", entry="document", items=len(sentences)):
+            reqs = [_normalize_request(text, source_lang, target_lang, scenario, tone) for text in sentences]
+            cache = get_default_cache() if use_cache else None
+            cache_keys: List[Optional[str]] = [None] * len(reqs)
+            pending = []
+            for idx, req in enumerate(reqs):
+                if not req["s_text"].strip():
+                    results[idx] = {"literal_translation": "", "natural_translation": "", "ok": True}
+                    continue
+                cache_keys[idx], cached = _cache_lookup(cache, req, "document")
+                if cached:
+                    results[idx] = {**cached, "ok": True}
+                    continue
+                pending.append(idx)
+
+            model_text = ""
+            for _attempt in range(2):
+                if not pending:
+                    break
+                base = reqs[pending[0]]
+                messages, _tokens = build_messages(
+                    "", base["s_lang"], base["t_lang"], base["scenario"], base["tone"], variant="document",
+                    items=[{"id": idx, "text": reqs[idx]["s_text"]} for idx in pending], context=context,
+                )
+                combined = {**base, "s_text": "\n".join(reqs[idx]["s_text"] for idx in pending)}
+                model_text = _complete(token_name, messages, _route("document", combined, items=len(pending)))
+                for idx, result in _parse_document_items(model_text, pending).items():
+                    _cache_store(cache, cache_keys[idx], result)
+                    results[idx] = {**result, "ok": True}
+                pending = [idx for idx in pending if results[idx] is None]
+                if model_text.startswith(_ERROR_PREFIXES):
+                    # the call itself failed (after its retries); do not ask again
+                    break
+
+            for idx in pending:
+                fallback = _fallback_result(reqs[idx], model_text)
+                results[idx] = {
+                    "literal_translation": fallback["literal_translation"],
+                    "natural_translation": fallback["natural_translation"][0]["text"],
+                    "ok": False,
+                }
+            return results
+    except Exception as exc:
+        error = _error_result(exc)
+        failed = {"literal_translation": error["literal_translation"], "natural_translation": "[Error]", "ok": False}
+        return [r if r is not None else dict(failed) for r in results]
+
+
+# supersede_key -> task currently translating for that key
+_inflight_tasks: Dict[str, "asyncio.Task"] = {}
+
+
+async def agenerate_translation_and_advice(
+    source_text: str,
+    source_lang: str,
+    target_lang: str,
+    scenario: str,
+    tone: str = "neutral",
+    token_name: str = None,
+    use_cache: bool = True,
+    timeout: Optional[float] = None,
+    supersede_key: Optional[str] = None,
+    include_advice: bool = True,
+) -> Dict[str, str]:
+    """Async counterpart of `generate_translation_and_advice` built on AsyncOpenAI.
+
+    Behavior:
+    - All calls on one event loop share a single pooled AsyncOpenAI client per
+      (token, api_url), so hundreds of translations can be in flight without
+      one thread each.
+    - `timeout` is a per-request deadline in seconds; when it expires the call
+      is abandoned and the usual fallback result is returned.
+    - `supersede_key` (e.g. a UI session id): starting a new request with the
+      same key cancels the previous in-flight one, whose awaiter then gets
+      asyncio.CancelledError. This is the only exception that propagates.
+    """
+    current = asyncio.current_task()
+    if supersede_key is not None:
+        previous = _inflight_tasks.get(supersede_key)
+        if previous is not None and previous is not current and not previous.done():
+            previous.cancel()
+        _inflight_tasks[supersede_key] = current
+    try:
+        incr("translator_requests_total", entry="async")
+        with span("translate", entry="async", variant=_variant(include_advice)):
+            req = _normalize_request(source_text, source_lang, target_lang, scenario, tone)
+            if not req["s_text"]:
+                return _empty_source_result()
+
+            variant = _variant(include_advice)
+
+            # The local layers do blocking SQLite / mmap / NumPy work: keep it off the event loop
+            served, layers = await asyncio.to_thread(_local_lookup, req, variant, use_cache, token_name)
+            if served:
+                return served
+            messages = _build_messages(req, variant, layers["examples"])
+
+            async def _fetch() -> Dict:
+                model_text = await _acomplete(token_name, messages, _route(variant, req))
+                result = _parse_model_text(model_text, include_advice)
+                if result is not None:
+                    await asyncio.to_thread(_store_result, layers, req, variant, result)
+                    return result
+                return _fallback_result(req, model_text)
+
+            # Identical concurrent requests share one upstream call; the deadline
+            # applies to this caller's wait only
+            try:
+                return await asyncio.wait_for(_aflight.do(_flight_key(req, token_name, variant), _fetch), timeout)
+            except asyncio.TimeoutError:
+                return _fallback_result(req, f"[Deepseek Call Error] Request exceeded its {timeout}s deadline.")
+    except asyncio.CancelledError:
+        raise
+    except Exception as exc:
+        return _error_result(exc)
+    finally:
+        if supersede_key is not None and _inflight_tasks.get(supersede_key) is current:
+            del _inflight_tasks[supersede_key]
+
+
+_background_loop: Optional[asyncio.AbstractEventLoop] = None
+_background_loop_lock = threading.Lock()
+
+
+def _get_background_loop() -> asyncio.AbstractEventLoop:
+    """Start (once) a daemon thread running the event loop shared by sync callers."""
+    global _background_loop
+    with _background_loop_lock:
+        if _background_loop is None:
+            loop = asyncio.new_event_loop()
+            threading.Thread(target=loop.run_forever, name="translation-loop", daemon=True).start()
+            _background_loop = loop
+    return _background_loop
+
+
+def submit_translation(**kwargs) -> "concurrent.futures.Future":
+    """Schedule `agenerate_translation_and_advice(**kwargs)` on the shared background loop.
+
+    Lets thread-based callers (Qt, batch jobs) use the single async connection
+    pool. Returns a concurrent.futures.Future; `future.cancel()` cancels the
+    request.
+    """
+    return asyncio.run_coroutine_threadsafe(agenerate_translation_and_advice(**kwargs), _get_background_loop())
+
+
+def _stream_model(token_name: str, messages: list, route: Optional[Route] = None) -> Iterator[Dict]:
+    """Stream one chat completion, yielding UI events as parts of the JSON complete.
+
+    Returns (via StopIteration, i.e. `yield from`) the full model text, with
+    errors as bracketed markers. Runs under the same retry / deadline /
+    circuit-breaker policy as `_call_model`, except that an attempt is only
+    retried while nothing has been yielded yet; the total deadline also
+    bounds a stream that keeps trickling. Leases are always released or
+    cancelled.
+    """
+    deadline = Deadline()
+    exclude: List[str] = []
+    attempt = 0
+    while True:
+        attempt += 1
+        lease = _lease_for_attempt(token_name, exclude)
+        if lease is None:
+            return _MISSING_CREDENTIALS
+        exclude.append(lease.name)
+        breaker = get_breaker(lease.api_url)
+        if not breaker.allow():
+            lease.cancel()
+            return _circuit_open(breaker)
+        parser = StreamingJSONParser()
+        parts = []
+        natural_count = 0
+        stream = None
+        usage, finish_reason = None, None
+        delay = None
+        try:
+            with span("client"):
+                client = get_client(lease.token, lease.api_url)
+            with span("request", token=lease.name, stream=True, attempt=attempt):
+                started = time.perf_counter()
+                stream = client.chat.completions.create(
+                    messages=messages, stream=True, stream_options={"include_usage": True},
+                    **_completion_options(route, deadline.attempt_timeout())
+                )
+                for chunk in stream:
+                    if deadline.expired():
+                        raise TimeoutError("Streaming response exceeded the total deadline.")
+                    usage = getattr(chunk, "usage", None) or usage
                     try:
-                        model_text = json.dumps(response)
+                        finish_reason = chunk.choices[0].finish_reason or finish_reason
+                        delta = chunk.choices[0].delta.content
                     except Exception:
-                        model_text = str(response)
-            else:
-                model_text = "[Missing Credentials] DEEPSEEK API token not found in environment variables or credentials file."
+                        delta = None
+                    if not delta:
+                        continue
+                    if not parts:
+                        observe("translator_stage_seconds", time.perf_counter() - started, stage="first_token")
+                    parts.append(delta)
+                    for kind, payload in parser.feed(delta):
+                        if kind == "literal_translation":
+                            yield {"type": "literal_translation", "text": payload or ""}
+                        elif kind == "natural_expression":
+                            yield {"type": "natural_expression", "index": natural_count, "item": payload}
+                            natural_count += 1
+                        elif kind == "advice_delta":
+                            yield {"type": "advice_delta", "text": payload}
+            lease.release()
+            breaker.record()
+            model_text = "".join(parts)
+            if route is not None:
+                # without usage in the stream, the local estimate has to do
+                completion_tokens = getattr(usage, "completion_tokens", None) or estimate_tokens(model_text)
+                get_router().record(route, completion_tokens, finish_reason)
+            return model_text
         except ImportError:
-            model_text = "[SDK Not Installed] Please run: pip install openai and set DEEPSEEK_API_KEY to your token."
+            breaker.release()
+            return _SDK_NOT_INSTALLED
         except Exception as e:
-            # Capture trace for debugging but do not raise
-            model_text = f"[Deepseek Call Error] {str(e)}"
+            lease.release(e)
+            breaker.record(e)
+            # output already shown cannot be taken back: only retry a silent failure
+            delay = None if parts else retry_delay(e, attempt, deadline)
+            if delay is None:
+                return f"[Deepseek Call Error] {str(e)}"
+            log.info("Deepseek stream failed (%s), retrying in %.2fs", error_label(e), delay)
+        except GeneratorExit:
+            # consumer stopped early
+            breaker.release()
+            raise
+        finally:
+            lease.cancel()
+            if stream is not None:
+                try:
+                    stream.close()
+                except Exception:
+                    pass
+        time.sleep(delay)
+
+
+def _result_events(result: Dict) -> Iterator[Dict]:
+    """Replay a complete result as streaming events (cache hits, fallbacks)."""
+    yield {"type": "literal_translation", "text": result.get("literal_translation", "")}
+    natural = result.get("natural_translation")
+    if isinstance(natural, list):
+        for idx, item in enumerate(natural):
+            yield {"type": "natural_expression", "index": idx, "item": item}
+    if result.get("advice"):
+        yield {"type": "advice_delta", "text": result["advice"]}
+    yield {"type": "done", "result": result}
+
+
+def stream_translation_and_advice(
+    source_text: str,
+    source_lang: str,
+    target_lang: str,
+    scenario: str,
+    tone: str = "neutral",
+    token_name: str = None,
+    use_cache: bool = True,
+    include_advice: bool = True,
+) -> Iterator[Dict]:
+    """Streaming variant of `generate_translation_and_advice`.
+
+    Yields event dicts as soon as each part of the JSON answer is complete:
+    - {"type": "literal_translation", "text": str}
+    - {"type": "natural_expression", "index": int, "item": {"text", "explanation"}}
+    - {"type": "advice_delta", "text": str}   (append to the advice shown so far)
+    - {"type": "done", "result": dict}        (same shape as the non-streaming result)
+
+    The final "done" result is authoritative: if the stream fails or the JSON
+    cannot be parsed, it carries the usual fallback output. With
+    include_advice=False no "advice_delta" events are produced. Never raises.
+    """
+    try:
+        incr("translator_requests_total", entry="stream")
+        with span("translate", entry="stream", variant=_variant(include_advice)):
+            req = _normalize_request(source_text, source_lang, target_lang, scenario, tone)
+            if not req["s_text"]:
+                yield from _result_events(_empty_source_result())
+                return
+
+            variant = _variant(include_advice)
+
+            curated = _phrasebook_lookup(req, variant) if use_cache else None
+            if curated:
+                yield from _result_events(curated)
+                return
+
+            cache = get_default_cache() if use_cache else None
+            cache_key, cached = _cache_lookup(cache, req, variant)
+            if cached:
+                yield from _result_events(cached)
+                return
 
-        # If we got model_text from API, parse JSON
-        if model_text and not model_text.startswith("[SDK Not Installed]") and not model_text.startswith("[Missing Credentials]") and not model_text.startswith("[Deepseek Call Error]"):
-            # Debug: print raw output to console
-            print(f"DEBUG: Raw model output:\n{model_text}\n" + "-"*20)
+            memory = get_default_memory() if use_cache else None
+            remembered, examples = _memory_lookup(memory, req, variant)
+            if not remembered:
+                semantic = get_default_semantic_cache() if use_cache else None
+                remembered = _semantic_lookup(semantic, req, variant, token_name)
+            if remembered:
+                yield from _result_events(remembered)
+                return
+            messages = _build_messages(req, variant, examples)
 
+            # Join an identical request that is already in flight instead of calling again
+            flight_key = _flight_key(req, token_name, variant)
+            leader, call = _flight.begin(flight_key)
+            if not leader:
+                call.event.wait()
+                if call.result is not None:
+                    yield from _result_events(call.result)
+                    return
+                # the leader gave up without a result: make our own call
+                leader, call = _flight.begin(flight_key)
+
+            result = None
             try:
-                # Clean up potential markdown markers
-                clean_text = model_text.strip()
-                if clean_text.startswith("```json"):
-                    clean_text = clean_text[7:]
-                if clean_text.startswith("```"):
-                    clean_text = clean_text[3:]
-                if clean_text.endswith("```"):
-                    clean_text = clean_text[:-3]
-                
-                data = json.loads(clean_text.strip())
-                
-                literal = data.get("literal_translation", "") or "[No Literal Translation Output]"
-                natural = data.get("natural_expressions", []) 
-                if not natural:
-                    natural = [{"text": "[No Natural Expression Output]", "explanation": ""}]
-                advice = data.get("cultural_advice", "") or "[No Cultural Advice Output]"
-
-                return {
-                    "literal_translation": literal,
-                    "natural_translation": natural, # List of dicts
-                    "advice": advice,
-                }
-            except Exception as e:
-                print(f"JSON Parsing failed: {e}")
-                # parsing failed — continue to fallback
-                pass
-
-        # If we reach here, either SDK missing, token missing, API error, or parsing failed
-        note = ""
-        if model_text.startswith("[SDK Not Installed]"):
-            note = "\n\n**Tip**: OpenAI SDK not installed. Please run `pip install openai` and set `DEEPSEEK_API_KEY`."
-        elif model_text.startswith("[Missing Credentials]"):
-            note = "\n\n**Tip**: Deepseek credentials not found. Please set token in `DEEPSEEK_API_KEY` environment variable or `credentials` file in project root."
-        elif model_text.startswith("[Deepseek Call Error]"):
-            note = f"\n\n**Deepseek Call Error**: {model_text}"
-
-        # Fallback safe fake implementation
-        literal = f"[Literal Example] ({s_lang} -> {t_lang}): {s_text}"
-        # Natural needs to be a list now
-        natural = [
-            {"text": f"[Natural Expression Example] {s_text}", "explanation": f"(Scenario: {scenario}) This is an example of a more natural expression generated for the source text."}
-        ]
-        advice = (
-            "【Cultural Advice Example】\n"
-            "- Based on your selected scenario, remind the user to pay attention to polite language and local customs.\n"
-            "- This will be generated by the large model based on source text and target culture in the future."
-        ) + note
-
-        return {
-            "literal_translation": literal,
-            "natural_translation": natural,
-            "advice": advice,
-        }
+                model_text = yield from _stream_model(token_name, messages, _route(variant, req))
+
+                result = _parse_model_text(model_text, include_advice)
+                if result is not None:
+                    _cache_store(cache, cache_key, result)
+                    _remember(memory, semantic, req, variant, result)
+                else:
+                    result = _fallback_result(req, model_text)
+                yield {"type": "done", "result": result}
+            finally:
+                # fan the result out to identical requests that joined meanwhile
+                if leader:
+                    _flight.finish(flight_key, call, result)
     except Exception as exc:
-        # Ultimate fallback — never raise
-        return {
-            "literal_translation": "[Error] Cannot generate literal translation.",
-            "natural_translation": [{"text": "[Error]", "explanation": f"Cannot generate natural translation: {str(exc)}"}],
-            "advice": f"[Error] Exception during advice generation: {str(exc)}\n{traceback.format_exc()}",
-        }
+        yield {"type": "done", "result": _error_result(exc)}
+
+
+# ---- Two-phase requests: translation first, cultural advice separately ----
+
+_ADVICE_VERSION = TEMPLATE_VERSIONS["advice"]
+
+_advice_pool: Optional[concurrent.futures.ThreadPoolExecutor] = None
+_advice_pool_lock = threading.Lock()
+
+
+def _advice_lookup(cache, req: Dict[str, str], use_phrasebook: bool = True) -> Tuple[Optional[str], Optional[str]]:
+    """Return (key to store the advice under, cached advice or None).
+
+    Advice is cached on its own per (text, language pair, scenario, tone); the
+    advice of a cached full answer and curated phrasebook advice are reused
+    as well.
+    """
+    curated = _phrasebook_lookup(req) if use_phrasebook else None
+    if curated:
+        return None, curated["advice"]
+    if cache is None:
+        return None, None
+    with span("cache_lookup", kind="advice"):
+        cache_key = _request_cache_key(req, _ADVICE_VERSION)
+        cached = cache.get(cache_key) or cache.get(_request_cache_key(req)) or {}
+    advice = cached.get("advice") or None
+    if advice is not None and advice.startswith("["):
+        advice = None  # placeholder advice of an earlier answer
+    incr("translator_cache_total", result="hit" if advice else "miss", kind="advice")
+    return cache_key, advice
+
+
+def _parse_advice_text(model_text: str) -> Optional[str]:
+    """Extract the advice Markdown from an "advice" completion, or None if unusable."""
+    if not model_text or model_text.startswith(_ERROR_PREFIXES):
+        return None
+    log_raw_payload("advice output", model_text)
+    with span("parse", kind="advice"):
+        data, outcome = loads_tolerant(model_text, kind="advice", partial_keys=(ADVICE_KEY,))
+    advice = data.get(ADVICE_KEY, "") if isinstance(data, dict) else ""
+    if not isinstance(advice, str) or not advice.strip():
+        log.warning("Advice JSON parsing failed (%s)", outcome)
+        return None
+    return advice
+
+
+def generate_advice(
+    source_text: str,
+    source_lang: str,
+    target_lang: str,
+    scenario: str,
+    tone: str = "neutral",
+    token_name: str = None,
+    use_cache: bool = True,
+) -> str:
+    """Cultural advice alone (the second phase of a two-phase request).
+
+    Cached separately from translations, so it can be fetched lazily (e.g.
+    when the user opens the advice view) or concurrently with
+    `generate_translation_and_advice(include_advice=False)`. Failures return
+    the usual fallback advice text. Never raises.
+    """
+    try:
+        incr("translator_requests_total", entry="advice")
+        with span("translate", entry="advice", variant="advice"):
+            req = _normalize_request(source_text, source_lang, target_lang, scenario, tone)
+            if not req["s_text"]:
+                return _empty_source_result()["advice"]
+            cache = get_default_cache() if use_cache else None
+            cache_key, cached = _advice_lookup(cache, req, use_cache)
+            if cached:
+                return cached
+            messages = _build_messages(req, "advice")
+
+            def _fetch() -> Dict:
+                model_text = _complete(token_name, messages, _route("advice", req))
+                advice = _parse_advice_text(model_text)
+                if advice is None:
+                    return {"advice": _fallback_result(req, model_text)["advice"]}
+                _cache_store(cache, cache_key, {"advice": advice})
+                return {"advice": advice}
+
+            return _flight.do(_flight_key(req, token_name, "advice"), _fetch)["advice"]
+    except Exception as exc:
+        return _error_result(exc)["advice"]
+
+
+def stream_advice(
+    source_text: str,
+    source_lang: str,
+    target_lang: str,
+    scenario: str,
+    tone: str = "neutral",
+    token_name: str = None,
+    use_cache: bool = True,
+) -> Iterator[Dict]:
+    """Streaming variant of `generate_advice`.
+
+    Yields {"type": "advice_delta", "text": str} events, then
+    {"type": "done", "result": {"advice": str}, "ok": bool}; ok is False when
+    the advice is fallback text. Never raises.
+    """
+    try:
+        incr("translator_requests_total", entry="advice_stream")
+        with span("translate", entry="advice_stream", variant="advice"):
+            req = _normalize_request(source_text, source_lang, target_lang, scenario, tone)
+            if not req["s_text"]:
+                yield {"type": "done", "result": {"advice": _empty_source_result()["advice"]}, "ok": False}
+                return
+            cache = get_default_cache() if use_cache else None
+            cache_key, cached = _advice_lookup(cache, req, use_cache)
+            if cached:
+                yield {"type": "advice_delta", "text": cached}
+                yield {"type": "done", "result": {"advice": cached}, "ok": True}
+                return
+            messages = _build_messages(req, "advice")
+            model_text = yield from _stream_model(token_name, messages, _route("advice", req))
+            advice = _parse_advice_text(model_text)
+            if advice is None:
+                yield {"type": "done", "result": {"advice": _fallback_result(req, model_text)["advice"]}, "ok": False}
+                return
+            _cache_store(cache, cache_key, {"advice": advice})
+            yield {"type": "done", "result": {"advice": advice}, "ok": True}
+    except Exception as exc:
+        yield {"type": "done", "result": {"advice": _error_result(exc)["advice"]}, "ok": False}
+
+
+def stream_translation_then_advice(
+    source_text: str,
+    source_lang: str,
+    target_lang: str,
+    scenario: str,
+    tone: str = "neutral",
+    token_name: str = None,
+    use_cache: bool = True,
+    lazy_advice: bool = False,
+) -> Iterator[Dict]:
+    """Two-phase streaming: the short translation request first, advice after it.
+
+    Phase one is the "translation_only" request (capped output length); its
+    events are yielded as they arrive and end with
+    {"type": "translation_done", "result": dict}. Phase two, the "advice"
+    request, starts at the same time on a background thread, so by the time
+    the translation is shown the advice is usually streaming or cached; its
+    "advice_delta" events follow, then the usual {"type": "done", "result": dict}
+    with both parts merged (same shape as the single-prompt result).
+
+    With lazy_advice=True only phase one runs: "done" follows "translation_done"
+    with advice "", and the advice can be fetched on demand with
+    `generate_advice` / `stream_advice`. Never raises.
+    """
+    global _advice_pool
+    request = dict(
+        source_text=source_text, source_lang=source_lang, target_lang=target_lang,
+        scenario=scenario, tone=tone, token_name=token_name, use_cache=use_cache,
+    )
+    advice_events: "queue.Queue" = queue.Queue()
+    if not lazy_advice:
+        def _produce() -> None:
+            try:
+                for event in stream_advice(**request):
+                    advice_events.put(event)
+            finally:
+                advice_events.put(None)
+
+        with _advice_pool_lock:
+            if _advice_pool is None:
+                _advice_pool = concurrent.futures.ThreadPoolExecutor(max_workers=4, thread_name_prefix="advice")
+        _advice_pool.submit(_produce)
+
+    translation = None
+    for event in stream_translation_and_advice(include_advice=False, **request):
+        if event.get("type") == "done":
+            translation = event.get("result") or {}
+            yield {"type": "translation_done", "result": translation}
+        else:
+            yield event
+    if lazy_advice:
+        yield {"type": "done", "result": translation}
+        return
+
+    advice, advice_ok = "", False
+    while True:
+        event = advice_events.get()
+        if event is None:
+            break
+        if event.get("type") == "advice_delta":
+            yield event
+        elif event.get("type") == "done":
+            advice, advice_ok = event["result"].get("advice", ""), event.get("ok", False)
+    result = {**translation, "advice": advice}
+    if use_cache and advice_ok and translation and not is_fallback(translation):
+        # the merged answer also serves single-prompt requests and the fuzzy layers
+        try:
+            req = _normalize_request(source_text, source_lang, target_lang, scenario, tone)
+            cache = get_default_cache()
+            _cache_store(cache, _request_cache_key(req) if cache is not None else None, result)
+            _remember(get_default_memory(), get_default_semantic_cache(), req, "full", result)
+        except Exception as e:
+            log.warning("Could not store two-phase result: %s", e)
+    yield {"type": "done", "result": result}
@@ -0,0 +1,319 @@
+"""
+Persistent text-to-speech worker for the desktop app.
+
+`pyttsx3.init()` plus enumerating and keyword-matching every installed voice
+used to run on each 🔊 click. Here one daemon thread owns the pyttsx3
+engine for the life of the process (pyttsx3 engines must stay on the thread
+that created them):
+
+- Voices are enumerated once at start; the voice chosen per language is cached.
+- Commands go through a priority queue: playback before pre-synthesis.
+- `speak(..., interrupt=True)` stops what is playing and drops queued
+  playback; `interrupt=False` queues after it.
+- `presynthesize(texts, lang)` renders phrases (e.g. the top natural
+  expressions of a translation) to WAV in the background, so clicking 🔊
+  plays the file at once; without PyAudio, or for text that was not
+  rendered, it is spoken live.
+
+Settings (environment variables or `configure_tts(...)`):
+- TTS_RATE              speech rate in words per minute (default 150)
+- TTS_PRESYNTH          "0" to disable pre-synthesis (default on)
+- TTS_PRESYNTH_COUNT    natural expressions pre-synthesized per result (default 3)
+- TTS_PRESYNTH_CACHE    WAV files kept, least recently used removed first (default 64)
+"""
+
+from collections import OrderedDict
+from typing import Callable, Dict, Iterable, List, Optional
+import importlib.util
+import itertools
+import os
+import queue
+import shutil
+import tempfile
+import threading
+import wave
+
+from metrics import incr
+from translation_logging import get_logger
+
+
+log = get_logger("translator.tts")
+
+
+TTS_AVAILABLE = importlib.util.find_spec("pyttsx3") is not None
+
+TTS_SETTINGS = {
+    "rate": int(os.environ.get("TTS_RATE", "150")),
+    "presynth": os.environ.get("TTS_PRESYNTH", "1") != "0",
+    "presynth_count": int(os.environ.get("TTS_PRESYNTH_COUNT", "3")),
+    "presynth_cache": int(os.environ.get("TTS_PRESYNTH_CACHE", "64")),
+}
+
+# keywords matched against voice names / ids (covers the common naming schemes)
+LANG_KEYWORDS = {
+    "zh": ["chinese", "mandarin", "zh", "cn", "china", "台灣", "中文", "普通话"],
+    "en": ["english", "en", "us", "uk", "america", "britain"],
+    "ja": ["japanese", "ja", "japan", "日本", "haruka", "ichiro", "sayaka"],
+}
+
+# queue priorities: lower runs first
+_PRIORITY_CONTROL = 0
+_PRIORITY_SPEAK = 1
+_PRIORITY_SYNTH = 2
+
+_PLAYBACK_FRAMES = 1024
+
+
+def configure_tts(**settings) -> None:
+    """Override TTS settings at runtime."""
+    for key, value in settings.items():
+        if key not in TTS_SETTINGS:
+            raise KeyError(f"Unknown TTS setting: {key}")
+        TTS_SETTINGS[key] = value
+
+
+def match_voice(voices: Iterable, lang_code: str):
+    """First voice whose name or id contains one of the language's keywords, or None."""
+    keywords = [k.lower() for k in LANG_KEYWORDS.get(lang_code, ["english"])]
+    for voice in voices:
+        name = (voice.name or "").lower()
+        voice_id = (getattr(voice, "id", "") or "").lower()
+        if any(k in name or k in voice_id for k in keywords):
+            return voice
+    return None
+
+
+class TTSWorker:
+    """One long-lived pyttsx3 engine behind a command queue.
+
+    `on_error(message)` is called from the worker thread (e.g. a Qt signal's
+    `emit`); a missing voice for a language is reported once.
+    """
+
+    def __init__(self, on_error: Optional[Callable[[str], None]] = None):
+        self.on_error = on_error
+        self._queue: "queue.PriorityQueue" = queue.PriorityQueue()
+        self._seq = itertools.count()
+        self._generation = 0
+        self._lock = threading.Lock()
+        self._ready = threading.Event()
+        self._voices: List = []
+        self._voice_by_lang: Dict[str, Optional[str]] = {}
+        self._current_voice: Optional[str] = None
+        self._rendered: "OrderedDict[tuple, str]" = OrderedDict()
+        self._render_dir = tempfile.mkdtemp(prefix="tts_")
+        self._engine = None
+        self._audio = None
+        self._playing_generation: Optional[int] = None
+        self._thread = threading.Thread(target=self._run, name="tts-worker", daemon=True)
+        self._thread.start()
+
+    # -- public API (any thread) -------------------------------------------
+
+    def speak(self, text: str, lang_code: str, interrupt: bool = True) -> None:
+        """Play `text`; with `interrupt` the current and queued playback are dropped."""
+        if not text:
+            return
+        with self._lock:
+            if interrupt:
+                self._generation += 1
+            generation = self._generation
+        self._put(_PRIORITY_SPEAK, ("speak", text, lang_code, generation))
+
+    def stop(self) -> None:
+        """Stop playback and drop everything queued for playback."""
+        with self._lock:
+            self._generation += 1
+
+    def presynthesize(self, texts: Iterable[str], lang_code: str) -> None:
+        """Render phrases to WAV in the background (no-op when disabled)."""
+        if not TTS_SETTINGS["presynth"]:
+            return
+        for text in texts:
+            if text and not text.startswith("["):
+                self._put(_PRIORITY_SYNTH, ("synthesize", text, lang_code))
+
+    def voices(self, timeout: float = 10.0) -> List[Dict[str, str]]:
+        """Installed voices (resolved once when the worker started)."""
+        self._ready.wait(timeout)
+        return [
+            {"name": v.name, "id": getattr(v, "id", ""), "languages": str(getattr(v, "languages", ""))}
+            for v in self._voices
+        ]
+
+    def is_rendered(self, text: str, lang_code: str) -> bool:
+        with self._lock:
+            return (lang_code, text) in self._rendered
+
+    def shutdown(self, timeout: float = 2.0) -> None:
+        self.stop()
+        self._put(_PRIORITY_CONTROL, ("shutdown",))
+        self._thread.join(timeout)
+        shutil.rmtree(self._render_dir, ignore_errors=True)
+
+    # -- worker thread -------------------------------------------------------
+
+    def _put(self, priority: int, command: tuple) -> None:
+        self._queue.put((priority, next(self._seq), command))
+
+    def _report(self, message: str) -> None:
+        log.warning("TTS: %s", message.splitlines()[0])
+        if self.on_error:
+            try:
+                self.on_error(message)
+            except Exception:
+                pass
+
+    def _run(self) -> None:
+        try:
+            import pyttsx3
+
+            self._engine = pyttsx3.init()
+            self._engine.setProperty("rate", TTS_SETTINGS["rate"])
+            self._voices = list(self._engine.getProperty("voices") or [])
+            # interrupt live speech between words
+            self._engine.connect("started-word", self._on_word)
+        except Exception as e:
+            self._engine = None
+            self._report(f"TTS 错误: {str(e)}")
+        finally:
+            self._ready.set()
+
+        while True:
+            _priority, _seq, command = self._queue.get()
+            kind = command[0]
+            if kind == "shutdown":
+                break
+            if self._engine is None:
+                # initialization failed and was reported already
+                continue
+            try:
+                if kind == "speak":
+                    _, text, lang_code, generation = command
+                    if generation == self._generation:
+                        self._play(text, lang_code, generation)
+                elif kind == "synthesize":
+                    _, text, lang_code = command
+                    if not self.is_rendered(text, lang_code):
+                        self._render(text, lang_code)
+            except Exception as e:
+                self._report(f"TTS 错误: {str(e)}")
+        if self._audio is not None:
+            self._audio.terminate()
+
+    def _on_word(self, name, location, length) -> None:
+        if self._playing_generation is not None and self._playing_generation != self._generation:
+            self._engine.stop()
+
+    def _voice_for(self, lang_code: str) -> Optional[str]:
+        if lang_code not in self._voice_by_lang:
+            voice = match_voice(self._voices, lang_code)
+            self._voice_by_lang[lang_code] = voice.id if voice else None
+            if voice is None:
+                # 如果没找到，使用系统默认语音并提示用户（每种语言只提示一次）
+                available_voices = "\n".join([f"- {v.name} ({v.id})" for v in self._voices[:5]])
+                self._report(
+                    f"未找到 {lang_code} 语音。\n\n"
+                    f"将使用系统默认语音。\n\n"
+                    f"可用的前 5 个语音：\n{available_voices}\n\n"
+                    f"提示：\n"
+                    f"- 如需日语语音，请在 Windows 设置中安装日语语音包\n"
+                    f"- 设置 → 时间和语言 → 语音 → 添加语音"
+                )
+        return self._voice_by_lang[lang_code]
+
+    def _select_voice(self, lang_code: str) -> None:
+        voice_id = self._voice_for(lang_code)
+        if voice_id and voice_id != self._current_voice:
+            self._engine.setProperty("voice", voice_id)
+            self._current_voice = voice_id
+
+    def _play(self, text: str, lang_code: str, generation: int) -> None:
+        with self._lock:
+            path = self._rendered.get((lang_code, text))
+            if path:
+                self._rendered.move_to_end((lang_code, text))
+        if path and self._play_wav(path, generation):
+            incr("translator_tts_playback_total", source="presynthesized")
+            return
+        incr("translator_tts_playback_total", source="live")
+        self._select_voice(lang_code)
+        self._playing_generation = generation
+        try:
+            self._engine.say(text)
+            self._engine.runAndWait()
+        finally:
+            self._playing_generation = None
+
+    def _play_wav(self, path: str, generation: int) -> bool:
+        """Play a rendered file through PyAudio; False if that is not possible."""
+        if self._audio is None:
+            try:
+                import pyaudio
+            except ImportError:
+                return False
+            self._audio = pyaudio.PyAudio()
+        try:
+            with wave.open(path, "rb") as wav:
+                stream = self._audio.open(
+                    format=self._audio.get_format_from_width(wav.getsampwidth()),
+                    channels=wav.getnchannels(),
+                    rate=wav.getframerate(),
+                    output=True,
+                )
+                try:
+                    data = wav.readframes(_PLAYBACK_FRAMES)
+                    while data and generation == self._generation:
+                        stream.write(data)
+                        data = wav.readframes(_PLAYBACK_FRAMES)
+                finally:
+                    stream.stop_stream()
+                    stream.close()
+            return True
+        except (OSError, wave.Error, EOFError):
+            return False
+
+    def _render(self, text: str, lang_code: str) -> None:
+        self._select_voice(lang_code)
+        path = os.path.join(self._render_dir, f"{next(self._seq)}.wav")
+        self._engine.save_to_file(text, path)
+        self._engine.runAndWait()
+        if not os.path.exists(path) or os.path.getsize(path) == 0:
+            return
+        evicted = []
+        with self._lock:
+            self._rendered[(lang_code, text)] = path
+            while len(self._rendered) > TTS_SETTINGS["presynth_cache"]:
+                evicted.append(self._rendered.popitem(last=False)[1])
+        for old in evicted:
+            try:
+                os.remove(old)
+            except OSError:
+                pass
+
+
+_default_worker: Optional[TTSWorker] = None
+_default_worker_lock = threading.Lock()
+
+
+def get_default_tts_worker(on_error: Optional[Callable[[str], None]] = None) -> Optional[TTSWorker]:
+    """Return the process-wide TTS worker (started on first use), or None without pyttsx3.
+
+    `on_error` is only used when the worker is created.
+    """
+    global _default_worker
+    if not TTS_AVAILABLE:
+        return None
+    if _default_worker is None:
+        with _default_worker_lock:
+            if _default_worker is None:
+                _default_worker = TTSWorker(on_error=on_error)
+    return _default_worker
+
+
+def shutdown() -> None:
+    global _default_worker
+    with _default_worker_lock:
+        worker, _default_worker = _default_worker, None
+    if worker is not None:
+        worker.shutdown()